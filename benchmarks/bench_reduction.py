@@ -0,0 +1,297 @@
+"""Benchmark the reduction stages of ImageCollection_Model on synthetic nights
+
+Run the benchmark and write a results file:
+
+    python -m benchmarks.bench_reduction run results.json --size 2048x2048 --repeat 3
+
+Compare two results files, e.g. from two versions of the pipeline:
+
+    python -m benchmarks.bench_reduction compare before.json after.json
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from statistics import median
+
+import tkinter as tk
+
+import numpy as np
+
+from mht_ccd_pipeline import models as m
+
+from .synthetic_night import SyntheticNight, parse_size, parse_list
+
+
+STAGES = (
+    ('Create Directories','reductionCreateDirectories'),
+    ('Copy Images','reductionCopyImages'),
+    ('Setup Collections','reductionSetupCollections'),
+    ('Copy Filters','reductionCopyFilters'),
+    ('Create Masters','reductionCreateMasters'),
+    ('Bias Removal','reductionBiasRemoval'),
+    ('Dark Removal','reductionDarkRemoval'),
+    ('Prepare Flats','reductionPrepareFlats'),
+    ('Reduce Science','reductionReduceScience'),
+    ('Copy Results','reductionCopyResults'),
+    ('Delete Directories','reductionDeleteDirs'),
+)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git','describe','--always','--dirty'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def versions():
+    import astropy
+    import ccdproc
+    return {
+        'python':platform.python_version(),
+        'numpy':np.__version__,
+        'astropy':astropy.__version__,
+        'ccdproc':ccdproc.__version__,
+    }
+
+
+def prepare_config(config_file,night_dir,working_dir):
+    """Copy the configuration, pointing it at the synthetic night"""
+
+    bench_config = os.path.join(working_dir,'bench_config.ini')
+    shutil.copy(config_file,bench_config)
+
+    config_model = m.Configuration_Model(bench_config)
+    config_model.config['directories']['source_dir'] = night_dir
+    config_model.config['directories']['working_dir'] = os.path.join(working_dir,'working')
+    config_model.save()
+    return config_model
+
+
+def stage_arguments(name,config_model,paths):
+    directories = config_model.config['directories']
+    if name == 'Copy Results':
+        return (paths['source_dir'],directories['output_dir'],paths['output_dir'])
+    if name == 'Delete Directories':
+        return (directories['working_dir'],)
+    return ()
+
+
+def run_once(config_model,trace_memory=True):
+    """Run every stage once, returning per-stage measurements"""
+
+    collection_args, directorylist = config_model.collection_arguments()
+    paths = collection_args['paths']
+
+    status = tk.StringVar(master=tk.Tcl())
+    collection = m.ImageCollection_Model(status=status,**collection_args)
+    collection.report.track_memory = trace_memory
+    collection.reductionSetupDir({},directorylist)
+
+    results = []
+    for name, method in STAGES:
+        args = stage_arguments(name,config_model,paths)
+
+        wall_start = time.perf_counter()
+        getattr(collection,method)(*args)
+        wall = time.perf_counter() - wall_start
+
+        step = collection.report.steps[-1]
+        results.append({
+            'stage':name,
+            'wall':wall,
+            'cpu':step['cpu'],
+            'frames':step['frames'],
+            'bytes_read':step['bytes_read'],
+            'bytes_written':step['bytes_written'],
+            'peak_traced_mb':(step.get('traced_peak',0) - step.get('traced_start',0)) / 1e6,
+            'max_rss_mb':step.get('rss_peak',0) / 1e6,
+        })
+
+    return results
+
+
+def summarise(runs):
+    """Median of each measurement over repeated runs"""
+
+    summary = []
+    for index, (name,method) in enumerate(STAGES):
+        stage = {'stage':name}
+        for key in ('wall','cpu','frames','bytes_read','bytes_written','peak_traced_mb','max_rss_mb'):
+            stage[key] = median(run[index][key] for run in runs)
+        summary.append(stage)
+    return summary
+
+
+def run(args):
+    working_dir = args.working or tempfile.mkdtemp(prefix='mht_bench_')
+    night_dir = os.path.join(working_dir,'night')
+
+    night = SyntheticNight(
+        config_file=args.config,
+        shape=parse_size(args.size),
+        bias=args.bias,
+        dark_exposures=parse_list(args.dark_exposures,float),
+        darks=args.darks,
+        flat_filters=parse_list(args.filters),
+        flats=args.flats,
+        science=args.science,
+        science_exposures=parse_list(args.science_exposures,float),
+        seed=args.seed)
+
+    if os.path.isdir(night_dir):
+        shutil.rmtree(night_dir)
+    frames = night.write(night_dir)
+    print('Synthetic night: {} frames of {}x{} in {}'.format(frames,night.shape[1],night.shape[0],night_dir))
+
+    config_model = prepare_config(args.config,night_dir,working_dir)
+
+    runs = []
+    for repeat in range(args.repeat):
+        output = os.path.join(night_dir,config_model.config['directories']['output_dir'])
+        if os.path.isdir(output):
+            shutil.rmtree(output)
+        runs.append(run_once(config_model,trace_memory=not args.no_trace_memory))
+        print('Run {} of {}: {:.2f} s'.format(repeat + 1,args.repeat,sum(stage['wall'] for stage in runs[-1])))
+
+    results = {
+        'created':datetime.now().isoformat(timespec='seconds'),
+        'revision':git_revision(),
+        'label':args.label,
+        'versions':versions(),
+        'night':{
+            'size':args.size,
+            'frames':frames,
+            'bias':args.bias,
+            'dark_exposures':args.dark_exposures,
+            'darks':args.darks,
+            'filters':args.filters,
+            'flats':args.flats,
+            'science':args.science,
+            'science_exposures':args.science_exposures,
+            'seed':args.seed,
+        },
+        'repeat':args.repeat,
+        'stages':summarise(runs),
+        'runs':runs,
+    }
+
+    with open(args.results,'w',encoding='utf-8') as fh:
+        json.dump(results,fh,indent=2)
+
+    print_table(results['stages'])
+    print('Results written to {}'.format(args.results))
+
+    if not args.working and not args.keep:
+        shutil.rmtree(working_dir)
+
+
+def print_table(stages):
+    print('{:<28}{:>10}{:>10}{:>8}{:>12}{:>12}'.format('Stage','Wall s','CPU s','Frames','Peak MB','RSS MB'))
+    for stage in stages:
+        print('{:<28}{:>10.3f}{:>10.3f}{:>8}{:>12.1f}{:>12.1f}'.format(
+            stage['stage'],stage['wall'],stage['cpu'],int(stage['frames']),
+            stage['peak_traced_mb'],stage['max_rss_mb']))
+    print('{:<28}{:>10.3f}{:>10.3f}'.format(
+        'Total',sum(stage['wall'] for stage in stages),sum(stage['cpu'] for stage in stages)))
+
+
+def percent_change(base,new):
+    if base == 0:
+        return 0.0 if new == 0 else float('inf')
+    return 100.0 * (new - base) / base
+
+
+def compare(args):
+    with open(args.base,encoding='utf-8') as fh:
+        base = json.load(fh)
+    with open(args.new,encoding='utf-8') as fh:
+        new = json.load(fh)
+
+    if base['night'] != new['night']:
+        print('Warning: the results were measured on different synthetic nights')
+
+    print('Base: {} {}'.format(base.get('revision',''),base.get('label') or ''))
+    print('New:  {} {}'.format(new.get('revision',''),new.get('label') or ''))
+    print('{:<28}{:>10}{:>10}{:>9}{:>11}{:>11}{:>9}'.format(
+        'Stage','Base s','New s','Wall %','Base MB','New MB','Mem %'))
+
+    new_stages = {stage['stage']:stage for stage in new['stages']}
+    regressions = []
+    for stage in base['stages']:
+        other = new_stages.get(stage['stage'])
+        if other is None:
+            continue
+        wall_change = percent_change(stage['wall'],other['wall'])
+        memory_change = percent_change(stage['peak_traced_mb'],other['peak_traced_mb'])
+        flag = ''
+        if wall_change > args.threshold and other['wall'] - stage['wall'] > args.min_seconds:
+            flag = ' <- slower'
+            regressions.append(stage['stage'])
+        elif memory_change > args.threshold and other['peak_traced_mb'] - stage['peak_traced_mb'] > 1.0:
+            flag = ' <- more memory'
+            regressions.append(stage['stage'])
+        print('{:<28}{:>10.3f}{:>10.3f}{:>+9.1f}{:>11.1f}{:>11.1f}{:>+9.1f}{}'.format(
+            stage['stage'],stage['wall'],other['wall'],wall_change,
+            stage['peak_traced_mb'],other['peak_traced_mb'],memory_change,flag))
+
+    base_total = sum(stage['wall'] for stage in base['stages'])
+    new_total = sum(stage['wall'] for stage in new['stages'])
+    print('{:<28}{:>10.3f}{:>10.3f}{:>+9.1f}'.format(
+        'Total',base_total,new_total,percent_change(base_total,new_total)))
+
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the MHT CCD reduction pipeline')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser('run',help='run the benchmark on a synthetic night')
+    run_parser.add_argument('results',help='results file to write')
+    run_parser.add_argument('--config',default='config.ini',help='pipeline configuration file')
+    run_parser.add_argument('--label',default='',help='label stored with the results')
+    run_parser.add_argument('--working',default=None,help='directory for the night and working files')
+    run_parser.add_argument('--keep',action='store_true',help='keep the temporary working directory')
+    run_parser.add_argument('--repeat',type=int,default=1,help='number of runs to take the median of')
+    run_parser.add_argument('--no-trace-memory',action='store_true',
+                            help='skip tracemalloc, which slows the timed stages')
+    run_parser.add_argument('--size',default='1024x1024',help='sensor size as WIDTHxHEIGHT')
+    run_parser.add_argument('--bias',type=int,default=5,help='number of bias frames')
+    run_parser.add_argument('--dark-exposures',default='30 60',help='dark exposure times')
+    run_parser.add_argument('--darks',type=int,default=3,help='dark frames per exposure time')
+    run_parser.add_argument('--filters',default='B V',help='flat and science filters')
+    run_parser.add_argument('--flats',type=int,default=3,help='flat frames per filter')
+    run_parser.add_argument('--science',type=int,default=4,help='science frames per filter')
+    run_parser.add_argument('--science-exposures',default='30 60',help='science exposure times')
+    run_parser.add_argument('--seed',type=int,default=0,help='random seed')
+
+    compare_parser = subparsers.add_parser('compare',help='compare two results files')
+    compare_parser.add_argument('base',help='results of the reference version')
+    compare_parser.add_argument('new',help='results of the version under test')
+    compare_parser.add_argument('--threshold',type=float,default=10.0,
+                                help='percentage increase reported as a regression')
+    compare_parser.add_argument('--min-seconds',type=float,default=0.05,
+                                help='ignore wall time changes smaller than this')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        run(args)
+        return 0
+    return compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""Generate a synthetic observing night for benchmarking the pipeline
+
+The frames use the FITS keywords, image type values and filename text of a
+pipeline configuration file, so the same night can be classified either by
+header or by filename.
+
+    python -m benchmarks.synthetic_night night_dir --size 2048x2048 --bias 10
+"""
+
+import os
+import argparse
+
+import numpy as np
+from astropy.io import fits
+from configobj import ConfigObj
+
+
+def parse_size(text):
+    """Parse a sensor size given as WIDTHxHEIGHT or a single number"""
+
+    if 'x' in text:
+        width, height = text.lower().split('x')
+    else:
+        width = height = text
+    return int(height), int(width)
+
+
+def parse_list(text,cast=str):
+    return [cast(item) for item in text.replace(',',' ').split()]
+
+
+class SyntheticNight:
+    """Synthetic bias, dark, flat and science frames for one night"""
+
+    def __init__(self,config_file='config.ini',shape=(1024,1024),bias=5,
+                 dark_exposures=(30.0,60.0),darks=3,flat_filters=('B','V'),
+                 flats=3,science=4,science_exposures=(30.0,60.0),
+                 science_object=None,seed=0):
+
+        self.config = ConfigObj(config_file)
+        self.shape = shape
+        self.bias = bias
+        self.dark_exposures = dark_exposures
+        self.darks = darks
+        self.flat_filters = flat_filters
+        self.flats = flats
+        self.science = science
+        self.science_exposures = science_exposures
+        self.science_object = science_object or self.config['science_details']['filename_text'] or 'Target'
+        self.rng = np.random.default_rng(seed)
+
+        general = self.config['general_details']
+        self.key_imagetype = general['fits_header_image_type']
+        self.key_filter = general['fits_header_filter']
+        self.key_temp = general['fits_header_CCD_temp']
+        self.key_exposure = general['fits_header_exposure']
+
+        self.bias_level = 1000.0
+        self.readnoise = float(general['ccd_readnoise']) / float(general['ccd_gain'])
+        self.dark_rate = 0.5
+
+        yy, xx = np.mgrid[0:shape[0],0:shape[1]]
+        radius = np.hypot((yy - shape[0] / 2) / shape[0],(xx - shape[1] / 2) / shape[1])
+        self.vignetting = 1.0 - 0.3 * radius ** 2
+
+    def _header(self,section,exposure,filter_name=None):
+        header = fits.Header()
+        header[self.key_imagetype] = self.config[section]['fits_header_image_value']
+        header[self.key_exposure] = float(exposure)
+        header[self.key_temp] = -20.0
+        header['BUNIT'] = 'adu'
+        if filter_name is not None:
+            header[self.key_filter] = filter_name
+        return header
+
+    def _frame(self,signal):
+        data = self.bias_level + signal
+        data = data + self.rng.normal(0.0,self.readnoise,self.shape)
+        return np.clip(data,0,65535).astype(np.uint16)
+
+    def _write(self,directory,filename,data,header):
+        hdu = fits.PrimaryHDU(data,header)
+        hdu.writeto(os.path.join(directory,filename),overwrite=True)
+
+    def _stars(self,count=40):
+        image = np.zeros(self.shape)
+        ys = self.rng.uniform(0,self.shape[0],count)
+        xs = self.rng.uniform(0,self.shape[1],count)
+        fluxes = self.rng.uniform(500,20000,count)
+        yy, xx = np.ogrid[0:self.shape[0],0:self.shape[1]]
+        for y, x, flux in zip(ys,xs,fluxes):
+            y0, y1 = int(max(y - 8,0)), int(min(y + 9,self.shape[0]))
+            x0, x1 = int(max(x - 8,0)), int(min(x + 9,self.shape[1]))
+            image[y0:y1,x0:x1] += flux * np.exp(
+                -((yy[y0:y1] - y) ** 2 + (xx[:,x0:x1] - x) ** 2) / (2 * 1.5 ** 2))
+        return image
+
+    def write(self,directory):
+        """Write the night into directory, returning the number of frames"""
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        count = 0
+        text = {section:self.config[section]['filename_text'] or section.split('_')[0]
+                for section in ('bias_details','dark_details','flat_details')}
+
+        for number in range(self.bias):
+            self._write(directory,'{}-{:04d}.fit'.format(text['bias_details'],number),
+                        self._frame(0.0),self._header('bias_details',0.0))
+            count += 1
+
+        for exposure in self.dark_exposures:
+            for number in range(self.darks):
+                self._write(directory,'{}-{:04d}-{:g}s.fit'.format(text['dark_details'],number,exposure),
+                            self._frame(self.dark_rate * exposure),self._header('dark_details',exposure))
+                count += 1
+
+        for filter_name in self.flat_filters:
+            for number in range(self.flats):
+                signal = 20000.0 * self.vignetting
+                self._write(directory,'{}-{:04d}-{}.fit'.format(text['flat_details'],number,filter_name),
+                            self._frame(self.rng.poisson(signal) + self.dark_rate * 5.0),
+                            self._header('flat_details',5.0,filter_name))
+                count += 1
+
+        for filter_name in self.flat_filters:
+            for number in range(self.science):
+                exposure = self.science_exposures[number % len(self.science_exposures)]
+                sky = 200.0 + self._stars()
+                signal = self.rng.poisson(sky * self.vignetting) + self.dark_rate * exposure
+                header = self._header('science_details',exposure,filter_name)
+                header['OBJECT'] = self.science_object
+                self._write(directory,'{}-{:04d}-{}.fit'.format(self.science_object,number,filter_name),
+                            self._frame(signal),header)
+                count += 1
+
+        return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory',help='directory to write the night into')
+    parser.add_argument('--config',default='config.ini',help='pipeline configuration file')
+    parser.add_argument('--size',default='1024x1024',help='sensor size as WIDTHxHEIGHT')
+    parser.add_argument('--bias',type=int,default=5,help='number of bias frames')
+    parser.add_argument('--dark-exposures',default='30 60',help='dark exposure times')
+    parser.add_argument('--darks',type=int,default=3,help='dark frames per exposure time')
+    parser.add_argument('--filters',default='B V',help='flat and science filters')
+    parser.add_argument('--flats',type=int,default=3,help='flat frames per filter')
+    parser.add_argument('--science',type=int,default=4,help='science frames per filter')
+    parser.add_argument('--science-exposures',default='30 60',help='science exposure times')
+    parser.add_argument('--seed',type=int,default=0,help='random seed')
+    args = parser.parse_args(argv)
+
+    night = SyntheticNight(
+        config_file=args.config,
+        shape=parse_size(args.size),
+        bias=args.bias,
+        dark_exposures=parse_list(args.dark_exposures,float),
+        darks=args.darks,
+        flat_filters=parse_list(args.filters),
+        flats=args.flats,
+        science=args.science,
+        science_exposures=parse_list(args.science_exposures,float),
+        seed=args.seed)
+    count = night.write(args.directory)
+    print('Wrote {} frames to {}'.format(count,args.directory))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+from .api import reduce_night, ReductionResult, Status
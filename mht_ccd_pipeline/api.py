@@ -0,0 +1,314 @@
+import os
+import fnmatch
+
+from ccdproc import CCDData
+from astropy.io import fits
+from astropy.table import Table, MaskedColumn
+from configobj import ConfigObj
+
+from . import models as m
+from .models import Status
+from .sweep import apply_overrides
+from .medianfilter import median_filter
+from .fingerprint import data_fingerprint
+from .fitsscan import data_hdu
+
+
+# settings that configuration files spell differently from Configuration_Model.fields
+config_keys = {'fits_header_CCD_Temp': 'fits_header_CCD_temp'}
+
+# night name recorded in the run report for frames passed in memory
+memory_night = '<memory>'
+
+
+def default_config():
+    """ConfigObj with the default value of every setting"""
+
+    config = ConfigObj()
+    for section, fields in m.Configuration_Model.fields.items():
+        config[section] = {}
+        for key, spec in fields.items():
+            config[section][config_keys.get(key,key)] = spec.get('value',spec.get('values',[''])[0])
+    return config
+
+
+def configuration(config=None,overrides=None):
+    """Configuration_Model from a model, a configuration file or the defaults, with overrides set
+
+    The configuration file is read but never written back. overrides are
+    'section.key' names or nested by section, as for a sweep.
+    """
+
+    config_model = m.Configuration_Model.__new__(m.Configuration_Model)
+    if isinstance(config,m.Configuration_Model):
+        config_model.config = ConfigObj(config.config.dict())
+    elif config is not None:
+        config_model.config = ConfigObj(config,file_error=True)
+        config_model.add_missing_defaults()
+    else:
+        config_model.config = default_config()
+    apply_overrides(config_model.config,overrides or {})
+    return config_model
+
+
+def read_frame(storage,name):
+    """CCDData of the image of a frame in storage, in ADU unless its header says otherwise"""
+
+    with storage.open(name) as fh, fits.open(fh,memmap=False) as hdulist:
+        hdu = data_hdu(hdulist)
+        return CCDData(hdu.data,meta=hdu.header,unit=hdu.header.get('bunit','adu'))
+
+
+class ReductionResult:
+    """Masters and science frames of a reduction, held in memory
+
+    masters maps the file names the pipeline gives masters, such as
+    Master_Bias.fit or br_Master_Flat_V.fit, to CCDData. science maps the
+    output file names of the science frames to CCDData, or for a lazy
+    reduction is a generator of (name, CCDData) that reduces each frame as
+    it is taken. report is the RunReport of the reduction.
+    """
+
+    def __init__(self,masters,science,model):
+        self.masters = masters
+        self.science = science
+        self.model = model
+        self.report = model.report
+
+    def write(self,directory):
+        """Write the masters and science frames into the master and output directories of directory
+
+        A lazy reduction's science frames are reduced as they are written.
+        Returns the paths written.
+        """
+
+        master_dir = os.path.join(directory,os.path.basename(self.model.paths['master_dir']))
+        output_dir = os.path.join(directory,os.path.basename(self.model.paths['output_dir']))
+        for path in (master_dir,output_dir):
+            os.makedirs(path,exist_ok=True)
+
+        written = []
+        for name, ccd in self.masters.items():
+            written.append(os.path.join(master_dir,name))
+            self.model.writeCCD(ccd,written[-1],name)
+        science = self.science.items() if isinstance(self.science,dict) else self.science
+        for name, ccd in science:
+            written.append(os.path.join(output_dir,name))
+            self.model.writeCCD(ccd,written[-1],name)
+        return written
+
+
+class MemoryReduction:
+    """Reduction of one night held in memory with the steps of ImageCollection_Model
+
+    Frames are classified, median filtered, gain corrected, combined and
+    calibrated by the model's own methods. The masters are kept in the
+    model's caches of masters in memory (shared_frames, dark_cache and
+    inverse_flats) under the paths the file based steps would use, so the
+    corrections find them there and nothing is read from or written to the
+    working directories.
+    """
+
+    def __init__(self,source,config_model,status=None):
+        collection_args, _ = config_model.collection_arguments()
+        in_memory = not isinstance(source,(str,os.PathLike))
+        collection_args['paths']['source_dir'] = memory_night if in_memory else os.fspath(source)
+        # both write files, so they stay off here
+        collection_args['filemods']['save_inverse_flat'] = False
+        collection_args['filemods']['library_dir'] = ''
+        self.model = m.ImageCollection_Model.memoryModel(status=status if status is not None else Status(),
+                                                         **collection_args)
+        self.master_dir = self.model.paths['master_dir']
+
+        if in_memory:
+            frames = source if isinstance(source,dict) else {'frame_{:04d}.fit'.format(index):ccd
+                                                             for index, ccd in enumerate(source)}
+            self.read = frames.__getitem__
+            self.model.table = self.headerTable(frames)
+        else:
+            collection = m.source_collection(self.model.paths['source_dir'],self.model.keywords,self.model.worker_threads)
+            self.model.source = collection.storage
+            self.read = lambda name: read_frame(collection.storage,name)
+            self.model.table = collection.summary
+        self.model.source_frames = None
+
+    def headerTable(self,frames):
+        """Summary table of frames held in memory, as the header scan of a night gives"""
+
+        key = self.model.keywords[0]
+        values = [ccd.header.get(key) for ccd in frames.values()]
+        column = MaskedColumn([str(value) if value is not None else '' for value in values],name=key,
+                              mask=[value is None for value in values])
+        return Table([list(frames),column],names=['file',key])
+
+    def ingest(self,fname,image_type):
+        """Frame fname prepared as copying it in and gain correcting it would, None for a repeat"""
+
+        model = self.model
+        ccd = self.read(fname)
+        with model.report.operation('compute',fname):
+            duplicate = model.isDuplicate(data_fingerprint(ccd.header,ccd.data),fname,image_type)
+        if duplicate:
+            return None
+
+        header = ccd.header.copy()
+        data = ccd.data
+        if 'bunit' not in header:
+            header['bunit'] = 'adu'
+        if model.medianfilter[image_type] == 'True':
+            filtersize = int(model.medianfiltersize[image_type])
+            data = median_filter(data,filtersize,model.worker_threads)
+            header['medfilt'] = filtersize
+        if model.usefitslist[image_type] != 'True' and model.updatefitslist[image_type] == 'True':
+            header[model.keywords[0]] = model.imagelist[image_type]
+
+        frame = CCDData(data,meta=header,unit=ccd.unit)
+        return model.toPrecision(model.gainCorrect(frame,model.ccd_details[0],model.ccd_details[1],fname))
+
+    def frameFilter(self,fname,header,science=False):
+        """Filter of a flat or science frame, from its header or its name as configured"""
+
+        model = self.model
+        index = 1 if science else 0
+        if model.usefitsfilterlist[index] == 'True':
+            value = header.get(model.keywords[1])
+            return None if value is None else str(value)
+        for filterType in (model.sciencefilterlist if science else model.flatfilterlist):
+            if fnmatch.fnmatch(fname,'*' + filterType + '.*'):
+                if model.updatefitsfilterlist[index] == 'True':
+                    header[model.keywords[1]] = filterType
+                return filterType
+        return None
+
+    def ingestCalibrations(self):
+        """Ingested bias frames, darks by exposure and flats by filter"""
+
+        model = self.model
+        frames = model.sourceFrames()
+        with model.report.step('Copy Images'):
+            bias = [ccd for ccd in (self.ingest(fname,0) for fname in frames[0]) if ccd is not None]
+            darks = {}
+            for fname in frames[1]:
+                ccd = self.ingest(fname,1)
+                if ccd is not None:
+                    darks.setdefault(float(ccd.header[model.keywords[3]]),[]).append(ccd)
+            flats = {}
+            for fname in frames[2]:
+                ccd = self.ingest(fname,2)
+                filterType = self.frameFilter(fname,ccd.header) if ccd is not None else None
+                if filterType is not None:
+                    flats.setdefault(filterType,[]).append(ccd)
+
+        if not bias:
+            raise ValueError('No bias frames in {}'.format(model.paths['source_dir']))
+        if not darks:
+            raise ValueError('No dark frames in {}'.format(model.paths['source_dir']))
+        return bias, darks, flats
+
+    def createMasters(self,bias,darks,flats):
+        """Combine and calibrate the masters, by the file names the pipeline gives them"""
+
+        model = self.model
+        filemods = model.filemods
+        masters = {}
+
+        with model.report.step('Create Masters'):
+            bias_file = filemods['master_bias_name'] + '.fit'
+            masters[bias_file] = model.toPrecision(model.combineFrames(bias,filemods['master_bias_header_value'],
+                                                                       filemods['median_combine_bias']))
+            for exposure, frames in sorted(darks.items()):
+                masters[model.masterDarkName(exposure)] = model.toPrecision(model.combineFrames(
+                        frames,filemods['master_dark_header_value'],filemods['median_combine_dark']))
+            for filterType, frames in sorted(flats.items()):
+                masters[model.masterFlatName(filterType)] = model.toPrecision(model.combineFrames(
+                        frames,filemods['master_flat_header_value'],filemods['median_combine_flat']))
+
+        with model.report.step('Bias Removal'):
+            model.shared_frames[os.path.join(self.master_dir,bias_file)] = masters[bias_file]
+            exposures = {}
+            for exposure in sorted(darks):
+                name = model.masterDarkName(exposure,bias_removed=True)
+                masters[name] = model.toPrecision(model.biasCorrect(masters[model.masterDarkName(exposure)],self.master_dir,
+                                                                    bias_file,filemods['master_dark_header_value'],name))
+                model.shared_frames[os.path.join(self.master_dir,name)] = masters[name]
+                exposures[exposure] = name
+            model.dark_cache[('exposures',self.master_dir)] = exposures
+            for filterType in sorted(flats):
+                name = model.masterFlatName(filterType,bias_removed=True)
+                masters[name] = model.toPrecision(model.biasCorrect(masters[model.masterFlatName(filterType)],self.master_dir,
+                                                                    bias_file,filemods['master_flat_header_value'],name))
+
+        with model.report.step('Dark Removal'):
+            for filterType in sorted(flats):
+                name = model.scienceFlatName(filterType)
+                masters[name] = model.toPrecision(model.darkCorrect(masters[model.masterFlatName(filterType,bias_removed=True)],
+                                                                    self.master_dir,model.masterDarkName(bias_removed=True),
+                                                                    filemods['master_flat_header_value'],name))
+                model.shared_frames[os.path.join(self.master_dir,name)] = masters[name]
+
+        with model.report.step('Prepare Flats'):
+            for filterType in sorted(flats):
+                model.prepareFlat(self.master_dir,model.scienceFlatName(filterType),filterType)
+
+        return masters
+
+    def reduceScience(self,intermediate=False):
+        """(name, CCDData) of each reduced science frame, reduced as it is taken
+
+        With intermediate the bias and dark subtracted frames come too.
+        A frame without a flat for its filter ends dark subtracted.
+        """
+
+        model = self.model
+        with model.report.step('Reduce Science'):
+            for fname in model.sourceFrames()[3]:
+                ccd = self.ingest(fname,3)
+                if ccd is None:
+                    continue
+                filterType = self.frameFilter(fname,ccd.header,science=True)
+                if filterType not in model.inverse_flats:
+                    model.log.warning('No flat for filter %s',filterType,frame=fname)
+                    filterType = None
+                outputs = model.calibrateScience(fname,ccd,filterType)
+                for reduced, path_file in (outputs if intermediate else outputs[-1:]):
+                    yield os.path.basename(path_file), reduced
+
+
+def reduce_night(source,config=None,overrides=None,lazy=False,intermediate=False,write_to=None,status=None):
+    """Reduce a night in memory and return a ReductionResult
+
+    source is a directory or archive of FITS frames, a dict of frame names
+    to CCDData, or an iterable of CCDData. config is a Configuration_Model,
+    a configuration file or None for the default settings, and overrides
+    are set on top of it. The masters are made straight away. With lazy
+    the science frames are a generator, reduced only as they are taken.
+    write_to, when given, is a directory the masters and science frames are
+    also written to, the science frames as they are reduced when lazy.
+    status takes the name of each step as it runs, a Status by default.
+    """
+
+    reduction = MemoryReduction(source,configuration(config,overrides),status)
+    masters = reduction.createMasters(*reduction.ingestCalibrations())
+    science = reduction.reduceScience(intermediate)
+    result = ReductionResult(masters,science,reduction.model)
+
+    if lazy:
+        if write_to is not None:
+            result.science = iter(())
+            result.write(write_to)
+            result.science = _written(science,result,write_to)
+        return result
+
+    result.science = dict(science)
+    if write_to is not None:
+        result.write(write_to)
+    return result
+
+
+def _written(science,result,directory):
+    """Science frames of a lazy reduction, each written into directory as it is taken"""
+
+    output_dir = os.path.join(directory,os.path.basename(result.model.paths['output_dir']))
+    for name, ccd in science:
+        result.model.writeCCD(ccd,os.path.join(output_dir,name),name)
+        yield name, ccd
@@ -12,6 +12,9 @@ from tkinter.font import nametofont
 
 from . import views as v
 from . import models as m
+from .logs import logger, setup_logging
+from .storage import night_locations
+from .fingerprint import FingerprintRegistry
 
 from .mainmenu import get_main_menu_for_os
 from .images import MHT_LOGO_32, MHT_LOGO_64
@@ -467,195 +470,130 @@ class Application(tk.Tk):
     def create_collections(self):
         #create all collections
 
-        filemods = {}
-        filemods['filename_mod_prefix'] = self.config_model.config['reduction_details'].as_bool('filename_stub_prefix')
-        filemods['filename_mod'] = self.config_model.config['reduction_details']['filename_prefix_suffix_modifier']
-        if filemods['filename_mod_prefix']:
-            filemods['bias_removal_mod'] = self.config_model.config['reduction_details']['filename_bias_stub'] + filemods['filename_mod']
-            filemods['dark_removal_mod'] = self.config_model.config['reduction_details']['filename_dark_stub'] + filemods['filename_mod']
-            filemods['flat_removal_mod'] = self.config_model.config['reduction_details']['filename_flat_stub'] + filemods['filename_mod']
-            filemods['reduced_removal_mod'] = self.config_model.config['reduction_details']['filename_reduced_stub'] + filemods['filename_mod']
-        else:
-            filemods['bias_removal_mod'] = filemods['filename_mod'] + self.config_model.config['reduction_details']['filename_bias_stub']
-            filemods['dark_removal_mod'] = filemods['filename_mod'] + self.config_model.config['reduction_details']['filename_dark_stub']
-            filemods['flat_removal_mod'] = filemods['filename_mod'] + self.config_model.config['reduction_details']['filename_flat_stub']
-            filemods['reduced_removal_mod'] = filemods['filename_mod'] + self.config_model.config['reduction_details']['filename_reduced_stub']
-
-        filemods['master_bias_name'] = self.config_model.config['master_details']['filename_bias']
-        filemods['master_dark_name'] = self.config_model.config['master_details']['filename_dark']
-        filemods['master_flat_name'] = self.config_model.config['master_details']['filename_flat']
-        filemods['master_bias_header_value'] = self.config_model.config['master_details']['fits_header_image_value_bias']
-        filemods['master_dark_header_value'] = self.config_model.config['master_details']['fits_header_image_value_dark']
-        filemods['master_flat_header_value'] = self.config_model.config['master_details']['fits_header_image_value_flat']
-        filemods['median_combine_bias'] = self.config_model.config['master_details'].as_bool('median_combine_bias')
-        filemods['median_combine_dark'] = self.config_model.config['master_details'].as_bool('median_combine_dark')
-        filemods['median_combine_flat'] = self.config_model.config['master_details'].as_bool('median_combine_flat')
-        filemods['save_masters'] = self.config_model.config['directories'].as_bool('save_masters')
-        filemods['save_working'] = self.config_model.config['directories'].as_bool('save_working')
-
-        paths = {}
-        paths['source_dir'] = self.config_model.config['directories']['source_dir']
-        paths['working_dir'] = self.config_model.config['directories']['working_dir']
-        paths['base_bias_dir'] = self.config_model.config['directories']['bias_dir']
-        paths['base_dark_dir'] = self.config_model.config['directories']['dark_dir']
-        paths['base_flat_dir'] = self.config_model.config['directories']['flat_dir']
-        paths['bias_dir'] = os.path.join(
-                                self.config_model.config['directories']['working_dir'],
-                                self.config_model.config['directories']['bias_dir'])
-        paths['dark_dir'] = os.path.join(
-                                self.config_model.config['directories']['working_dir'],
-                                self.config_model.config['directories']['dark_dir'])
-        paths['flat_dir'] = os.path.join(
-                                self.config_model.config['directories']['working_dir'],
-                                self.config_model.config['directories']['flat_dir'])
-        paths['master_dir'] = os.path.join(
-                                self.config_model.config['directories']['working_dir'],
-                                self.config_model.config['directories']['master_dir'])
-        paths['science_dir'] = os.path.join(
-                                self.config_model.config['directories']['working_dir'],
-                                self.config_model.config['directories']['science_dir'])
-        paths['output_dir'] = os.path.join(
-                                self.config_model.config['directories']['working_dir'],
-                                self.config_model.config['directories']['output_dir'])
-
-        keywords = (self.config_model.config['general_details']['fits_header_image_type'],
-                         self.config_model.config['general_details']['fits_header_filter'],
-                         self.config_model.config['general_details']['fits_header_CCD_temp'],
-                         self.config_model.config['general_details']['fits_header_exposure'],
-                         "OBJECT")
-
-        imagelist = (self.config_model.config['bias_details']['fits_header_image_value'],
-                        self.config_model.config['dark_details']['fits_header_image_value'],
-                        self.config_model.config['flat_details']['fits_header_image_value'],
-                        self.config_model.config['science_details']['fits_header_image_value'],
-                        )
-
-        filelist = (self.config_model.config['bias_details']['filename_text'],
-                        self.config_model.config['dark_details']['filename_text'],
-                        self.config_model.config['flat_details']['filename_text'],
-                        self.config_model.config['science_details']['filename_text'],
-                        )
-
-        usefitslist = (self.config_model.config['bias_details']['use_fits'],
-                        self.config_model.config['dark_details']['use_fits'],
-                        self.config_model.config['flat_details']['use_fits'],
-                        self.config_model.config['science_details']['use_fits'],
-                        )
-        updatefitslist = (self.config_model.config['bias_details']['update_fits'],
-                        self.config_model.config['dark_details']['update_fits'],
-                        self.config_model.config['flat_details']['update_fits'],
-                        self.config_model.config['science_details']['update_fits'],
-                        self.config_model.config['master_details']['update_fits'],
-                        )
-        usefitsfilterlist = (self.config_model.config['flat_details']['use_fits_filter'],
-                        self.config_model.config['science_details']['use_fits_filter'],
-                        )
-        updatefitsfilterlist = (self.config_model.config['flat_details']['update_fits_filter'],
-                        self.config_model.config['science_details']['update_fits_filter'],
-                        )
-        ccd_details = (float(self.config_model.config['general_details']['ccd_gain']),
-                         float(self.config_model.config['general_details']['ccd_readnoise']))
-
-        flatfilterlist = (self.config_model.config['flat_details']['filename_text_filter'].split())
-
-        sciencefilterlist = (self.config_model.config['science_details']['filename_text_filter'].split())
-
-        medianfilter = (self.config_model.config['bias_details']['perform_median_filter'],
-                        self.config_model.config['dark_details']['perform_median_filter'],
-                        self.config_model.config['flat_details']['perform_median_filter'],
-                        self.config_model.config['science_details']['perform_median_filter'],
-                        )
-
-        medianfiltersize = (self.config_model.config['bias_details']['median_filter_size'],
-                            self.config_model.config['dark_details']['median_filter_size'],
-                            self.config_model.config['flat_details']['median_filter_size'],
-                            self.config_model.config['science_details']['median_filter_size'],
-                            )
-
-        directorylist = (paths['bias_dir'],
-                            paths['dark_dir'],
-                            paths['flat_dir'],
-                            paths['science_dir'],
-                            paths['master_dir'],
-                            paths['output_dir'])
+        setup_logging(self.config_model.config['general_details'].get('log_level','INFO'))
+
+        collection_args, directorylist = self.config_model.collection_arguments()
+        filemods = collection_args['filemods']
+        paths = collection_args['paths']
+
+        report_rows = []
+        # frames repeated within or across the nights of this run are ingested once
+        fingerprints = FingerprintRegistry()
 
         if self.ccdreductionform.steps['single'].get() == 'False':
 
-            subfolders = [f.name for f in os.scandir(paths['source_dir']) if f.is_dir() ] 
-            print('Multiple Pass')
+            subfolders = night_locations(paths['source_dir'])
+            logger.info('Multiple Pass')
 
             for folder in subfolders:
                 
-                print(repr(folder))
+                logger.info('Night %s',folder)
                 temp = os.path.join(self.config_model.config['directories']['source_dir'],folder)
                 paths['source_dir'] = temp
 
-                self.collection = m.ImageCollection_Model(keywords,paths,filemods,imagelist,filelist,usefitslist,updatefitslist,
-                        usefitsfilterlist,updatefitsfilterlist,flatfilterlist,sciencefilterlist,ccd_details,medianfilter,medianfiltersize)
+                self.collection = m.ImageCollection_Model(**collection_args)
+                self.collection.fingerprints = fingerprints
 
                 self.collection.status.trace('w', self.reduction_status)
 
-                self.reduce_collection(directorylist,filemods,paths)
+                try:
+                    self.reduce_collection(directorylist,filemods,paths)
+                except m.MemoryBudgetError as e:
+                    self.memory_budget_error(e)
+                    return
+                report_rows.extend(self.collection.report.summary())
 
         else:
 
-            print('Single Pass')
+            logger.info('Single Pass')
 
-            self.collection = m.ImageCollection_Model(keywords,paths,filemods,imagelist,filelist,usefitslist,updatefitslist,
-                    usefitsfilterlist,updatefitsfilterlist,flatfilterlist,sciencefilterlist,ccd_details,medianfilter,medianfiltersize)
+            self.collection = m.ImageCollection_Model(**collection_args)
+            self.collection.fingerprints = fingerprints
 
             self.collection.status.trace('w', self.reduction_status)
 
-            self.reduce_collection(directorylist,filemods,paths)
+            try:
+                self.reduce_collection(directorylist,filemods,paths)
+            except m.MemoryBudgetError as e:
+                self.memory_budget_error(e)
+                return
+            report_rows.extend(self.collection.report.summary())
+
+        self.ccdreductionform.populate_report(report_rows)
 
+        logger.info('Reduction and File Copies Complete')
 
-        print('Reduction and File Copies Complete')
+    def memory_budget_error(self,error):
+        """Report a night that cannot be reduced within the memory budget"""
 
-    def reduce_collection(self,directorylist,filemods,paths):
-        """Reduce the collection"""
+        self.ccdreductionform.populate_report(self.collection.report.summary())
+        messagebox.showerror(
+            title='Error',
+            message='Memory budget exceeded',
+            detail=str(error)
+        )
 
-        m.ImageCollection_Model.reductionSetupDir(self.collection,self.settings,directorylist)
+    def calibrate_collection(self,collection,directorylist):
+        """Create masters and calibrate the science frames of a collection"""
 
-        if self.ccdreductionform.steps['CreateDir'].get() == 'True':
-            m.ImageCollection_Model.reductionCreateDirectories(self.collection)
-        
-        # copy all from same directory or calibration from External Directory
-        if self.ccdreductionform.steps['CopyImages'].get() == 'True':
-            m.ImageCollection_Model.reductionCopyImages(self.collection)
-            if self.generalconfigurationform.inputs['File Use'].get() == 'Calibration':
-                m.ImageCollection_Model.reductionCopyCalibrations(self.collection,self.generalconfigurationform.inputs['External Directory'].get())
+        steps = {step:self.ccdreductionform.steps[step].get() == 'True'
+                 for step in m.ImageCollection_Model.calibration_steps}
+        m.ImageCollection_Model.reductionCalibrate(collection,self.settings,directorylist,steps,
+                self.generalconfigurationform.inputs['File Use'].get(),
+                self.generalconfigurationform.inputs['External Directory'].get())
 
-        m.ImageCollection_Model.reductionSetupCollections(self.collection)
-        
-        if self.ccdreductionform.steps['CopyImages'].get() == 'True':
-            m.ImageCollection_Model.reductionCopyExpFilt(self.collection)
-
-        # create masters or copy from external directory
-        if self.ccdreductionform.steps['CreateMasters'].get() == 'True':
-            if self.generalconfigurationform.inputs['File Use'].get() != 'Masters':
-                m.ImageCollection_Model.reductionCreateMasters(self.collection)
-            elif self.generalconfigurationform.inputs['File Use'].get() == 'Masters':
-                m.ImageCollection_Model.reductionCopyMasters(self.collection,self.generalconfigurationform.inputs['External Directory'].get())
-
-
-        if self.ccdreductionform.steps['BiasRemoval'].get() == 'True':
-            m.ImageCollection_Model.reductionBiasRemoval(self.collection)
-        if self.ccdreductionform.steps['DarkRemoval'].get() == 'True':
-            m.ImageCollection_Model.reductionDarkRemoval(self.collection)
-        if self.ccdreductionform.steps['PerformReduction'].get() == 'True':
-            m.ImageCollection_Model.reductionReduceScience(self.collection)
-        if self.ccdreductionform.steps['CopyResults'].get() == 'True':
-            m.ImageCollection_Model.reductionCopyResults(self.collection,paths['source_dir'],
-                    self.config_model.config['directories']['output_dir'],
-                    paths['output_dir'])
-        if self.ccdreductionform.steps['CopyWorking'].get() == 'True':
-            m.ImageCollection_Model.reductionCopyWorking(self.collection,filemods,paths['source_dir'],
-                    self.config_model.config['directories']['working_dir'],
-                    self.config_model.config['directories']['master_dir'],
-                    paths['master_dir'])
-        if self.ccdreductionform.steps['DeleteDir'].get() == 'True':
-            m.ImageCollection_Model.reductionDeleteDirs(self.collection,
-                    self.config_model.config['directories']['working_dir'])
+    def validate_precision(self,paths):
+        """Repeat the calibration in float64 and compare it with the float32 run"""
+
+        # the reference calibrates into its own working directories, never the main run's
+        reference, reference_directorylist = self.collection.precisionReference(
+                self.config_model,paths['working_dir'] + '_float64')
+        reference.status.trace('w', self.reduction_status)
+        self.calibrate_collection(reference,reference_directorylist)
+
+        m.ImageCollection_Model.reductionValidatePrecision(self.collection,reference)
+
+        reference.source.close()
+        reference.releaseWorkingStore()
+        if os.path.isdir(reference.paths['working_dir']):
+            shutil.rmtree(reference.paths['working_dir'])
+
+    def reduce_collection(self,directorylist,filemods,paths):
+        """Reduce the collection"""
+
+        try:
+            self.calibrate_collection(self.collection,directorylist)
+            # results of a night read from an archive go beside the archive
+            night_dir = self.collection.source.outputDirectory()
+
+            if filemods.get('precision') == 'float32' and filemods.get('precision_validation',False):
+                self.validate_precision(paths)
+
+            # working files deleted after the export can be moved rather than copied
+            delete = self.ccdreductionform.steps['DeleteDir'].get() == 'True' or self.collection.working_store.in_memory
+            copy_working = self.ccdreductionform.steps['CopyWorking'].get() == 'True'
+
+            # the working directories may be in a RAM working store, so copy from the collection's paths
+            if self.ccdreductionform.steps['CopyResults'].get() == 'True':
+                m.ImageCollection_Model.reductionCopyResults(self.collection,night_dir,
+                        self.config_model.config['directories']['output_dir'],
+                        self.collection.paths['output_dir'],
+                        move=delete and not (copy_working and filemods['save_working']))
+            if copy_working:
+                m.ImageCollection_Model.reductionCopyWorking(self.collection,filemods,night_dir,
+                        self.config_model.config['directories']['working_dir'],
+                        self.config_model.config['directories']['master_dir'],
+                        self.collection.paths['master_dir'],
+                        move=delete)
+            if self.ccdreductionform.steps['DeleteDir'].get() == 'True':
+                m.ImageCollection_Model.reductionDeleteDirs(self.collection,
+                        self.config_model.config['directories']['working_dir'])
+
+            m.ImageCollection_Model.reductionWriteReport(self.collection,
+                    os.path.join(night_dir,self.config_model.config['directories']['output_dir']))
+        finally:
+            self.collection.releaseWorkingStore()
+            self.collection.source.close()
 
     def set_font(self,*args):
         font_size = self.settings['font size'].get()
@@ -667,5 +605,6 @@ class Application(tk.Tk):
     def set_imagesource(self,*args):
         self.populate_imagefileform()   
 
-    def reduction_status(self):  
-        self.ccdreductionform.inputs['Status'].set(self.collection.status.get()) 
\ No newline at end of file
+    def reduction_status(self,*args):  
+        self.ccdreductionform.inputs['Status'].set(self.collection.status.get()) 
+        self.update_idletasks()
\ No newline at end of file
@@ -0,0 +1,66 @@
+import os
+import re
+import fnmatch
+
+
+class FrameClassifier:
+    """Sort the frames of a night into bias, dark, flat and science in one pass
+
+    Each image type is matched either on its header image type value, case
+    insensitively as ImageFileCollection.files_filtered does, or on its
+    filename text as a '*text*' glob. The patterns are compiled once. When
+    the science filename text is empty, science is every frame whose name
+    matches none of the flat patterns; with filename rules, frames whose
+    names match the bias or dark text are never science.
+    """
+
+    def __init__(self,image_values,name_texts,use_header):
+        self.count = len(image_values)
+        self.use_header = [str(flag) == 'True' for flag in use_header]
+        self.header_patterns = [re.compile('^' + re.escape(str(value)) + '$',flags=re.IGNORECASE)
+                                for value in image_values]
+        self.name_patterns = [self.compileName(text) for text in name_texts]
+        self.science_text = bool(name_texts[-1])
+
+    @staticmethod
+    def compileName(text):
+        """Compiled '*text*' glob, matched as fnmatch.filter matches file names"""
+
+        return re.compile(fnmatch.translate(os.path.normcase('*' + str(text) + '*')))
+
+    def nameMatches(self,index,fname):
+        return self.name_patterns[index].match(os.path.normcase(fname)) is not None
+
+    def headerMatches(self,index,image_type):
+        if image_type is None:
+            return False
+        try:
+            return self.header_patterns[index].search(image_type) is not None
+        except TypeError:
+            return False
+
+    def matches(self,index,fname,image_type):
+        """Whether a frame with name fname and header image_type belongs to type index"""
+
+        if self.use_header[index]:
+            return self.headerMatches(index,image_type)
+
+        science = self.count - 1
+        if index != science:
+            return self.nameMatches(index,fname)
+
+        if self.science_text:
+            selected = self.nameMatches(science,fname)
+        else:
+            selected = not self.nameMatches(2,fname)
+        return selected and not self.nameMatches(0,fname) and not self.nameMatches(1,fname)
+
+    def classify(self,frames):
+        """Lists of frame names for each type from (name, header image type) pairs"""
+
+        classified = [[] for index in range(self.count)]
+        for fname, image_type in frames:
+            for index in range(self.count):
+                if self.matches(index,fname,image_type):
+                    classified[index].append(fname)
+        return classified
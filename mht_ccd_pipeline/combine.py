@@ -0,0 +1,88 @@
+import numpy as np
+from astropy.nddata import StdDevUncertainty
+from ccdproc import CCDData
+
+
+class RunningMean:
+    """Per-pixel running mean and variance of frames added one at a time
+
+    Uses Welford's update so only the mean, the sum of squared deviations
+    and the count are kept, whatever the number of frames.
+    """
+
+    def __init__(self):
+        self.count = None
+        self.mean = None
+        self.m2 = None
+
+    def add(self,data,reject=None):
+        """Add a frame, skipping pixels where reject is True"""
+
+        data = np.asarray(data,dtype=np.float64)
+        valid = np.isfinite(data)
+        if reject is not None:
+            valid &= ~reject
+
+        if self.mean is None:
+            self.count = np.zeros(data.shape,dtype=np.int32)
+            self.mean = np.zeros(data.shape)
+            self.m2 = np.zeros(data.shape)
+
+        self.count += valid
+        delta = np.where(valid,data - self.mean,0.0)
+        self.mean += delta / np.maximum(self.count,1)
+        self.m2 += delta * np.where(valid,data - self.mean,0.0)
+
+    def std(self):
+        """Population standard deviation, as numpy.ma.std"""
+
+        return np.sqrt(self.m2 / np.maximum(self.count,1))
+
+
+def stream_average(read_frames,sigma_clip=False,sigma_low=3.0,sigma_high=3.0,dtype=np.float64):
+    """Average combine frames read one at a time, as ccdproc.combine(method='average')
+
+    read_frames is called once per pass and must return an iterable of
+    CCDData. Without clipping one pass accumulates the mean and standard
+    deviation. With sigma_clip a first pass finds the per-pixel mean and
+    standard deviation, and a second pass averages only the values within
+    sigma_low and sigma_high deviations of it, like ccdproc's single
+    iteration mean/std sigma clipping. Only the accumulators and the frame
+    being added are held in memory. NCOMBINE in the header is the number of
+    frames combined.
+    """
+
+    template = None
+    count = 0
+    running = RunningMean()
+    for ccd in read_frames():
+        if template is None:
+            template = ccd
+        running.add(ccd.data,ccd.mask)
+        count += 1
+    if template is None:
+        raise ValueError('no frames to combine')
+
+    header = template.meta.copy()
+    header['NCOMBINE'] = count
+    unit = template.unit
+    template = None
+
+    if sigma_clip:
+        std = running.std()
+        lower = running.mean - abs(sigma_low) * std
+        upper = running.mean + abs(sigma_high) * std
+        del std
+        running = RunningMean()
+        for ccd in read_frames():
+            reject = (ccd.data < lower) | (ccd.data > upper)
+            if ccd.mask is not None:
+                reject |= ccd.mask
+            running.add(ccd.data,reject)
+
+    rejected = running.count == 0
+    uncertainty = running.std() / np.sqrt(np.maximum(running.count,1))
+
+    return CCDData(np.asarray(running.mean,dtype=dtype),
+                   uncertainty=StdDevUncertainty(uncertainty),
+                   mask=rejected,meta=header,unit=unit)
@@ -0,0 +1,99 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import ndimage
+
+try:
+    import astroscrappy
+except ImportError:
+    astroscrappy = None
+
+from .medianfilter import worker_count
+
+
+# pixels each tile reads beyond its own edges; L.A.Cosmic's 7x7 filters and
+# growth over its iterations reach well inside this
+tile_overlap = 32
+
+# full scale of the 16 bit converter, in ADU
+adc_saturation = 65535
+
+
+def tile_bounds(length,tile_size):
+    """(start, stop) of the tiles covering length, each at most tile_size long"""
+
+    if not tile_size or tile_size >= length:
+        return [(0,length)]
+    edges = list(range(0,length,int(tile_size))) + [length]
+    return list(zip(edges[:-1],edges[1:]))
+
+
+def _clean_tile(data,cleaned,mask,rows,cols,background,params):
+    """Clean the tile rows x cols of data into cleaned and mask, reading tile_overlap pixels around it
+
+    astroscrappy fills a cosmic ray pixel with no good pixel in the 5x5
+    box around it with the median of the image it is given; those take the
+    background of the whole frame instead, so they do not depend on the tile.
+    """
+
+    row_start = max(rows[0] - tile_overlap,0)
+    row_stop = min(rows[1] + tile_overlap,data.shape[0])
+    col_start = max(cols[0] - tile_overlap,0)
+    col_stop = min(cols[1] + tile_overlap,data.shape[1])
+    tile = data[row_start:row_stop,col_start:col_stop]
+
+    bad = ~np.isfinite(tile)
+    if bad.any():
+        tile = np.where(bad,0,tile)
+    else:
+        bad = None
+    tile_mask, tile_clean = astroscrappy.detect_cosmics(tile,inmask=bad,**params)
+    flagged = tile_mask if bad is None else (tile_mask | bad)
+    isolated = tile_mask & (ndimage.uniform_filter((~flagged).astype(np.float32),size=5,mode='constant') < 0.02)
+    tile_clean[isolated] = background
+
+    core = (slice(rows[0] - row_start,rows[1] - row_start),slice(cols[0] - col_start,cols[1] - col_start))
+    target = (slice(*rows),slice(*cols))
+    mask[target] = tile_mask[core]
+    cleaned[target] = np.where(tile_mask[core],tile_clean[core],data[target])
+
+
+def clean_cosmic_rays(data,gain,readnoise,tile_size=1024,threads=0,**params):
+    """Find and clean cosmic rays with L.A.Cosmic in overlapping tiles on worker threads
+
+    data is a 2D frame, gain converts it to electrons (1 for a frame already
+    in electrons) and readnoise is in electrons. Each tile of tile_size
+    pixels square is run through astroscrappy with tile_overlap pixels of
+    its neighbours around it, and only its own pixels are kept, so a tile
+    sees every pixel L.A.Cosmic looks at for them. astroscrappy releases the
+    GIL so the tiles run in parallel. Cosmic rays too large to fill from
+    their neighbours take the median of the frame. Pixels that are not
+    finite are left alone. params are passed on to
+    astroscrappy.detect_cosmics, whose satlevel is in electrons. Returns the
+    cleaned frame, in the units of data, and the mask of cosmic ray pixels.
+    """
+
+    if astroscrappy is None:
+        raise ImportError('cosmic_ray_removal needs the astroscrappy package, which is not installed')
+
+    data = np.asarray(data)
+    params = dict(params,gain=gain,readnoise=readnoise)
+
+    finite = data[np.isfinite(data)]
+    background = np.median(finite) if finite.size else 0
+    del finite
+
+    cleaned = np.empty_like(data)
+    mask = np.zeros(data.shape,dtype=bool)
+    tiles = [(rows,cols) for rows in tile_bounds(data.shape[0],tile_size) for cols in tile_bounds(data.shape[1],tile_size)]
+
+    if len(tiles) == 1:
+        _clean_tile(data,cleaned,mask,tiles[0][0],tiles[0][1],background,params)
+        return cleaned, mask
+
+    with ThreadPoolExecutor(max_workers=min(worker_count(threads),len(tiles))) as executor:
+        jobs = [executor.submit(_clean_tile,data,cleaned,mask,rows,cols,background,params) for rows, cols in tiles]
+        for job in jobs:
+            job.result()
+
+    return cleaned, mask
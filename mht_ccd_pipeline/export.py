@@ -0,0 +1,114 @@
+import os
+import shutil
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from .medianfilter import worker_count
+
+
+export_verifications = ['size', 'checksum']
+
+# bytes read and written at a time when copying a file
+copy_buffer = 16 * 1024 * 1024
+
+
+class ExportError(OSError):
+    """An exported file does not match its source"""
+
+
+def same_filesystem(source,destination):
+    """Whether destination, or its nearest existing parent, is on the filesystem of source"""
+
+    parent = os.path.abspath(destination)
+    while not os.path.exists(parent):
+        parent = os.path.dirname(parent)
+    return os.stat(source).st_dev == os.stat(parent).st_dev
+
+
+def _checksum(path):
+    crc = 0
+    with open(path,'rb') as fh:
+        while True:
+            block = fh.read(copy_buffer)
+            if not block:
+                return crc
+            crc = zlib.crc32(block,crc)
+
+
+def _copy_file(source,destination,checksum=False):
+    """Copy a file with a large buffer, returning its size and CRC-32 when checksum is set"""
+
+    crc = 0
+    with open(source,'rb') as src, open(destination,'wb') as dst:
+        while True:
+            block = src.read(copy_buffer)
+            if not block:
+                break
+            if checksum:
+                crc = zlib.crc32(block,crc)
+            dst.write(block)
+    shutil.copystat(source,destination)
+    return os.path.getsize(source), crc
+
+
+def copy_tree(source,destination,threads=0,verify='size'):
+    """Copy the tree source to destination, copying files on a pool of threads
+
+    Every copied file is checked against its source afterwards by size, or
+    with verify='checksum' by CRC-32 of the data read while copying and of
+    the copy read back. Raises ExportError when a file does not match.
+    Returns the number of bytes copied.
+    """
+
+    checksum = verify == 'checksum'
+    files = []
+    for directory, dirnames, filenames in os.walk(source):
+        target = os.path.join(destination,os.path.relpath(directory,source))
+        os.makedirs(target,exist_ok=True)
+        for filename in filenames:
+            files.append((os.path.join(directory,filename),os.path.join(target,filename)))
+
+    def copy(pair):
+        return _copy_file(pair[0],pair[1],checksum)
+
+    with ThreadPoolExecutor(max_workers=min(worker_count(threads),max(len(files),1))) as executor:
+        results = list(executor.map(copy,files))
+
+        def check(entry):
+            (src, dst), (size, crc) = entry
+            if os.path.getsize(dst) != size:
+                raise ExportError('{} is {} bytes, expected {}'.format(dst,os.path.getsize(dst),size))
+            if checksum and _checksum(dst) != crc:
+                raise ExportError('{} does not match the checksum of {}'.format(dst,src))
+
+        list(executor.map(check,zip(files,results)))
+
+    for directory, dirnames, filenames in os.walk(source):
+        shutil.copystat(directory,os.path.join(destination,os.path.relpath(directory,source)))
+    return sum(size for size, crc in results)
+
+
+def export_tree(source,destination,move=False,threads=0,verify='size'):
+    """Export the tree source to destination, replacing whatever is there
+
+    With move, when the source is no longer needed, a tree on the same
+    filesystem as destination is renamed into place, which is near
+    instant; across filesystems it is copied, verified and then removed.
+    Otherwise it is copied in parallel by copy_tree. Returns the number of
+    bytes copied, 0 for a rename.
+    """
+
+    if os.path.exists(destination) and os.path.samefile(source,destination):
+        return 0
+    if os.path.isdir(destination):
+        shutil.rmtree(destination)
+
+    if move and same_filesystem(source,destination):
+        os.makedirs(os.path.dirname(os.path.abspath(destination)),exist_ok=True)
+        os.rename(source,destination)
+        return 0
+
+    copied = copy_tree(source,destination,threads,verify)
+    if move:
+        shutil.rmtree(source)
+    return copied
@@ -0,0 +1,96 @@
+import hashlib
+import threading
+
+from .fitsscan import BLOCK, CARD
+
+
+def new_fingerprint(bitpix,shape):
+    """Hash of a data section, seeded with its type and shape so only identical arrays match"""
+
+    fingerprint = hashlib.blake2b(digest_size=16)
+    fingerprint.update('{} {}'.format(int(bitpix),tuple(int(n) for n in shape)).encode('ascii'))
+    return fingerprint
+
+
+def header_shape(header):
+    """BITPIX and axis lengths, NAXIS1 first, of a header dict or fits.Header"""
+
+    get = header.get
+    naxis = get('naxis',get('NAXIS',0)) or 0
+    shape = [get('naxis{}'.format(axis),get('NAXIS{}'.format(axis),0)) for axis in range(1,naxis + 1)]
+    return get('bitpix',get('BITPIX',8)), shape
+
+
+def data_fingerprint(header,data):
+    """Fingerprint of the primary data as stored, from its header and unscaled array"""
+
+    bitpix, shape = header_shape(header)
+    fingerprint = new_fingerprint(bitpix,shape)
+    if data is not None:
+        # big endian as in the file, decompressed images come back in native order
+        fingerprint.update(data.astype(data.dtype.newbyteorder('>'),copy=False).tobytes())
+    return fingerprint.hexdigest()
+
+
+def copy_fingerprinted(src,dst,header,buffer_size=BLOCK * 1024):
+    """Copy a FITS stream from src to dst, fingerprinting its primary data on the way
+
+    header is the primary header as a dict. The data section starts after
+    the block holding the END card and is hashed up to its unpadded length,
+    so the result equals data_fingerprint of the same frame.
+    """
+
+    bitpix, shape = header_shape(header)
+    fingerprint = new_fingerprint(bitpix,shape)
+    remaining = abs(int(bitpix)) // 8
+    for n in shape:
+        remaining *= int(n)
+    if not shape:
+        remaining = 0
+
+    # header blocks, copied as they are
+    while True:
+        block = src.read(BLOCK)
+        dst.write(block)
+        if len(block) < BLOCK or any(block[start:start + 3] == b'END' and not block[start + 3:start + CARD].strip()
+                                     for start in range(0,BLOCK,CARD)):
+            break
+
+    while True:
+        chunk = src.read(buffer_size)
+        if not chunk:
+            break
+        dst.write(chunk)
+        if remaining > 0:
+            fingerprint.update(chunk[:remaining])
+            remaining -= len(chunk)
+    return fingerprint.hexdigest()
+
+
+class FingerprintRegistry:
+    """Data fingerprints of the frames ingested in a run, by night and frame name
+
+    Shared by the nights of a multiple night pass so frames repeated across
+    nights are recognised as well as repeats within one night.
+    """
+
+    def __init__(self):
+        self.frames = {}
+        self.lock = threading.Lock()
+
+    def claim(self,fingerprint,night,frame):
+        """(night, frame) that had fingerprint before frame, None when it is the first
+
+        A repeat within the same night is returned before one from an
+        earlier night.
+        """
+
+        with self.lock:
+            sightings = self.frames.setdefault(fingerprint,{})
+            first = sightings.setdefault(night,frame)
+        if first != frame:
+            return night, first
+        for other_night, other_frame in sightings.items():
+            if other_night != night:
+                return other_night, other_frame
+        return None
@@ -0,0 +1,453 @@
+import io
+import os
+import re
+import fnmatch
+import bz2
+import gzip
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table, MaskedColumn
+from ccdproc import ImageFileCollection
+
+from .medianfilter import worker_count
+from .storage import LocalStorage
+
+
+logger = logging.getLogger('mht_ccd_pipeline')
+
+BLOCK = 2880
+CARD = 80
+
+# file name extensions of FITS files, plain and compressed, as ImageFileCollection recognises them
+fits_extensions = [extension + compression for compression in ('','.gz','.bz2','.Z','.zip','.fz')
+                   for extension in ('fit','fits','fts')]
+
+# binary table keywords of a tile compressed image that describe the table, not the image
+_table_keywords = {'xtension','bitpix','naxis','naxis1','naxis2','pcount','gcount','tfields',
+                   'extname','theap','zimage','zsimple','zextend','zblocked','ztension',
+                   'zpcount','zgcount','zcmptype','zquantiz','zdither0'}
+_table_prefixes = ('ttype','tform','tunit','tdim','tscal','tzero','tnull','tdisp','zname','zval','ztile')
+
+
+def _decompress(fh,name):
+    """File object decompressing a .gz or .bz2 file as it is read"""
+
+    if name.endswith('.gz'):
+        return gzip.GzipFile(fileobj=fh,mode='rb')
+    if name.endswith('.bz2'):
+        return bz2.BZ2File(fh,'rb')
+    return fh
+
+
+def _parse_value(text):
+    """Python value of the value field of a card, as astropy would give it"""
+
+    text = text.strip()
+    if text.startswith("'"):
+        value = []
+        i = 1
+        while i < len(text):
+            if text[i] == "'":
+                if text[i + 1:i + 2] == "'":
+                    value.append("'")
+                    i += 2
+                    continue
+                break
+            value.append(text[i])
+            i += 1
+        return ''.join(value).rstrip()
+
+    value = text.split('/',1)[0].strip()
+    if not value:
+        return None
+    if value == 'T':
+        return True
+    if value == 'F':
+        return False
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value.replace('D','E').replace('d','e'))
+    except ValueError:
+        return value
+
+
+def _read_cards(fh):
+    """Cards of the next header in fh as (keyword, value) pairs, None at end of file
+
+    Long strings continued on CONTINUE cards are joined into one value.
+    """
+
+    cards = []
+    first = True
+    while True:
+        block = fh.read(BLOCK)
+        if len(block) < BLOCK:
+            if first and not block:
+                return None
+            raise OSError('truncated FITS header')
+        if first and not block.startswith((b'SIMPLE',b'XTENSION')):
+            raise OSError('not a FITS header')
+        first = False
+        for start in range(0,BLOCK,CARD):
+            card = block[start:start + CARD].decode('ascii','replace')
+            keyword = card[:8].strip().upper()
+            if keyword == 'END':
+                return cards
+            if keyword == 'CONTINUE':
+                keyword, value = cards[-1] if cards else ('',None)
+                if isinstance(value,str) and value.endswith('&'):
+                    cards[-1] = (keyword,value[:-1] + _parse_value(card[8:]))
+                continue
+            if keyword == 'HIERARCH' and '=' in card:
+                name, text = card[9:].split('=',1)
+                cards.append((name.strip().upper(),_parse_value(text)))
+            elif keyword in ('COMMENT','HISTORY','') or card[8:10] != '= ':
+                cards.append((keyword,card[8:].strip()))
+            else:
+                cards.append((keyword,_parse_value(card[10:])))
+
+
+def _data_size(header):
+    """Bytes of data, padded to whole blocks, following a header"""
+
+    naxis = header.get('naxis',0) or 0
+    if not naxis:
+        return 0
+    pixels = 1
+    for axis in range(1,naxis + 1):
+        pixels *= header.get('naxis{}'.format(axis),0) or 0
+    size = abs(header.get('bitpix',8)) // 8 * (header.get('gcount',1) or 1) * ((header.get('pcount',0) or 0) + pixels)
+    return -(-size // BLOCK) * BLOCK
+
+
+def _to_header(cards):
+    """Dict of lower case keywords to first values, COMMENT and HISTORY joined with commas"""
+
+    header = {}
+    multi = {'comment':[],'history':[]}
+    for keyword, value in cards:
+        keyword = keyword.lower()
+        if keyword in multi:
+            multi[keyword].append(str(value))
+        elif keyword and keyword not in header:
+            header[keyword] = value
+    for keyword, values in multi.items():
+        if values:
+            header[keyword] = ','.join(values)
+    return header
+
+
+def _image_header(header):
+    """Image header of a tile compressed image from its binary table header"""
+
+    image = {}
+    for keyword, value in header.items():
+        if keyword in _table_keywords or keyword.startswith(_table_prefixes):
+            continue
+        image[keyword] = value
+    image['bitpix'] = header.get('zbitpix')
+    image['naxis'] = header.get('znaxis')
+    for axis in range(1,(header.get('znaxis') or 0) + 1):
+        image['naxis{}'.format(axis)] = header.get('znaxis{}'.format(axis))
+        image.pop('znaxis{}'.format(axis),None)
+    image.pop('zbitpix',None)
+    image.pop('znaxis',None)
+    return image
+
+
+def read_header(path,ext=0,storage=None):
+    """Header of HDU ext of a FITS file as a dict, reading only its header blocks
+
+    Keywords are lower case as in an ImageFileCollection summary. For a
+    tile compressed .fz file whose primary HDU has no data, ext 0 gives the
+    header of the compressed image. .Z and .zip files are read with astropy.
+    With a storage, path is the name of a file in it.
+    """
+
+    if storage is None:
+        storage = LocalStorage(os.path.dirname(path))
+        path = os.path.basename(path)
+
+    with storage.open(path) as raw:
+        if path.endswith(('.Z','.zip')):
+            return {key.lower():value for key, value in fits.getheader(raw,ext).items() if key}
+
+        fh = _decompress(raw,path)
+        header = _to_header(_read_cards(fh))
+        index = 0
+        compressed_primary = path.endswith('.fz') and ext == 0 and not header.get('naxis')
+        while index < ext or compressed_primary:
+            size = _data_size(header)
+            if size:
+                fh.seek(size,os.SEEK_CUR)
+            cards = _read_cards(fh)
+            if cards is None:
+                raise OSError('no HDU {} in {}'.format(ext,path))
+            header = _to_header(cards)
+            index += 1
+            compressed_primary = False
+        if header.get('zimage'):
+            header = _image_header(header)
+    return header
+
+
+def scan_headers(storage,files,keywords,threads=0,ext=0):
+    """Values of keywords in the headers of files, read in parallel
+
+    Returns a dict of columns, 'file' first, with None for keywords a file
+    does not have. Files whose header cannot be read are left out with a
+    warning, as ImageFileCollection does.
+    """
+
+    keys = [key.lower() for key in keywords]
+
+    def scan(fname):
+        try:
+            return fname, read_header(fname,ext,storage)
+        except (OSError, ValueError, UnicodeDecodeError, KeyError) as e:
+            logger.warning('unable to get FITS header for file %s: %s.',os.path.join(str(storage),fname),e)
+            return fname, None
+
+    workers = min(worker_count(threads),max(len(files),1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        headers = list(executor.map(scan,files))
+
+    columns = {'file':[]}
+    for key in keys:
+        columns[key] = []
+    for fname, header in headers:
+        if header is None:
+            continue
+        columns['file'].append(fname)
+        for key in keys:
+            columns[key].append(header.get(key))
+    return columns
+
+
+class HeaderCollection:
+    """Collection of the FITS files of a directory summarised by the parallel header scanner
+
+    Only the header blocks of each file are read, on a pool of threads,
+    which matters most on network mounted archives where each file open
+    costs a round trip. location, files, summary and files_filtered behave
+    as ImageFileCollection's: the summary has a 'file' column then one for
+    each keyword, named as given, masked where a file does not have it, and
+    is None for a collection with no files. Collections of all keywords
+    ('*') are summarised by ImageFileCollection itself. storage, by default
+    the directory location, is where the files are listed and read, so a
+    collection can be made of a night inside an archive.
+    """
+
+    def __init__(self,location=None,keywords=None,threads=0,storage=None,filenames=None,
+                 glob_include=None,glob_exclude=None,ext=0):
+        self.location = location or ''
+        self.threads = threads
+        self.storage = storage if storage is not None else LocalStorage(self.location)
+        self.glob_include = glob_include
+        self.glob_exclude = glob_exclude
+        self.ext = ext
+        self.files = self.fitsFiles() if filenames is None else list(filenames)
+        self.summary = self.headerSummary(keywords or [])
+
+    def relocate(self,location):
+        """Point the collection at the same files moved to the directory location"""
+
+        self.location = location
+        self.storage = LocalStorage(location)
+
+    def fitsFiles(self):
+        """Names of the FITS files in storage, compressed ones too, as ImageFileCollection finds them"""
+
+        all_files = self.storage.listdir()
+        files = []
+        for extension in fits_extensions:
+            files.extend(fnmatch.filter(all_files,'*.' + extension))
+        files.sort()
+        if self.glob_include is not None:
+            files = fnmatch.filter(files,self.glob_include)
+        if self.glob_exclude is not None:
+            files = [fname for fname in files if not fnmatch.fnmatch(fname,self.glob_exclude)]
+        return files
+
+    def headerSummary(self,keywords):
+        if not self.files:
+            logger.warning('no FITS files in the collection.')
+            return None
+        if '*' in keywords:
+            return ImageFileCollection(self.location,keywords='*',filenames=self.files,
+                                       glob_include=self.glob_include,glob_exclude=self.glob_exclude,ext=self.ext).summary
+
+        # one column for each keyword, spelled as first given
+        names = OrderedDict()
+        for keyword in keywords:
+            if keyword.lower() != 'file':
+                names.setdefault(keyword.lower(),keyword)
+        columns = scan_headers(self.storage,self.files,list(names),self.threads,self.ext)
+
+        # as ImageFileCollection, columns only for keywords some file has
+        summary_dict = OrderedDict((key,values) for key, values in columns.items()
+                                   if key == 'file' or any(value is not None for value in values))
+        summary_table = Table(summary_dict,masked=True)
+        for column in summary_table.colnames:
+            summary_table[column].mask = [value is None for value in summary_table[column].tolist()]
+
+        length = len(summary_table)
+        for key, name in names.items():
+            if key in summary_table.colnames:
+                summary_table.rename_column(key,name)
+            else:
+                summary_table.add_column(MaskedColumn(name=name,data=np.zeros(length),mask=np.ones(length)))
+
+        return summary_table[['file'] + list(names.values())]
+
+    def column(self,keyword):
+        for name in self.summary.colnames:
+            if name.lower() == keyword.lower():
+                return self.summary[name]
+        raise KeyError(keyword)
+
+    def files_filtered(self,include_path=False,**kwd):
+        """Files whose keywords have the given values, as ImageFileCollection.files_filtered
+
+        The value '*' matches any value and None a missing keyword. Strings
+        are compared case insensitively.
+        """
+
+        if self.summary is None:
+            return []
+
+        matches = np.ones(len(self.summary),dtype=bool)
+        for keyword, value in kwd.items():
+            column = self.column(keyword)
+            present = ~np.ma.getmaskarray(column)
+            if value is None:
+                matches &= ~present
+            elif value == '*':
+                matches &= present
+            elif isinstance(value,str):
+                pattern = re.compile('^' + re.escape(value) + '$',flags=re.IGNORECASE)
+                matches &= [is_present and isinstance(item,str) and pattern.search(item) is not None
+                            for is_present, item in zip(present,column.tolist())]
+            else:
+                matches &= present & (column.filled(np.nan if column.dtype.kind == 'f' else 0) == value)
+
+        files = [fname for fname, match in zip(self.summary['file'].tolist(),matches) if match]
+        if include_path:
+            files = [os.path.join(self.location,fname) for fname in files]
+        return files
+
+
+def _raw_cards(fh):
+    """80 character cards of the header at the position of fh, without END, and its block count"""
+
+    cards = []
+    blocks = 0
+    while True:
+        block = fh.read(BLOCK)
+        if len(block) < BLOCK:
+            raise OSError('truncated FITS header')
+        if not blocks and not block.startswith((b'SIMPLE',b'XTENSION')):
+            raise OSError('not a FITS header')
+        blocks += 1
+        for start in range(0,BLOCK,CARD):
+            card = block[start:start + CARD].decode('ascii')
+            if card[:8].rstrip() == 'END':
+                return cards, blocks
+            cards.append(card)
+
+
+def _card_keyword(card):
+    """Upper case keyword of a keyword = value card, HIERARCH ones included, None for any other card"""
+
+    if card[8:10] != '= ' and not card.startswith('HIERARCH '):
+        return None
+    return fits.Card.fromstring(card).keyword.upper()
+
+
+def _card_span(cards,index):
+    """Number of cards a keyword card at index takes, with its CONTINUE cards"""
+
+    span = 1
+    while index + span < len(cards) and cards[index + span][:8] == 'CONTINUE':
+        span += 1
+    return span
+
+
+def data_hdu(hdulist):
+    """First HDU of an open file holding data, the compressed image of a .fz file, else the primary"""
+
+    return next((hdu for hdu in hdulist if hdu.data is not None),hdulist[0])
+
+
+def patch_header(path,updates,ext=0):
+    """Set header keywords of a FITS file in place, rewriting only its header blocks
+
+    updates maps keywords to values. Existing keywords keep their place and
+    comment and new ones are added at the end of the header, as fits.setval
+    would. When the edited header still fits the blocks already allocated to
+    it only those blocks are written, leaving the data untouched; when it
+    has to grow, or the file is compressed, the file is rewritten by astropy.
+    Returns True when the header was patched in place.
+    """
+
+    if not path.endswith(('.gz','.bz2','.Z','.zip','.fz')):
+        with open(path,'r+b') as fh:
+            offset = 0
+            cards, blocks = _raw_cards(fh)
+            for index in range(ext):
+                fh.seek(_data_size(_to_header(_parsed(cards))),os.SEEK_CUR)
+                offset = fh.tell()
+                cards, blocks = _raw_cards(fh)
+
+            keywords = [_card_keyword(card) for card in cards]
+            for keyword, value in updates.items():
+                name = fits.Card(keyword).keyword.upper()
+                index = next((i for i, card_keyword in enumerate(keywords) if card_keyword == name),None)
+                if index is None:
+                    new = fits.Card(keyword,value)
+                    # keep trailing blank cards after the new keyword, as astropy appends
+                    end = len(cards)
+                    while end and not cards[end - 1].strip():
+                        end -= 1
+                    added = _split(new.image)
+                    cards[end:end] = added
+                    keywords[end:end] = [name] + [None] * (len(added) - 1)
+                else:
+                    span = _card_span(cards,index)
+                    card = fits.Card.fromstring(''.join(cards[index:index + span]))
+                    replaced = _split(fits.Card(card.keyword,value,card.comment).image)
+                    cards[index:index + span] = replaced
+                    keywords[index:index + span] = [name] + [None] * (len(replaced) - 1)
+
+            if len(cards) + 1 <= blocks * (BLOCK // CARD):
+                header = ''.join(cards) + 'END'.ljust(CARD)
+                fh.seek(offset)
+                fh.write(header.ljust(blocks * BLOCK).encode('ascii'))
+                return True
+
+    with fits.open(path,mode='update') as hdul:
+        hdu = hdul[ext]
+        if path.endswith('.fz') and ext == 0 and not hdu.header.get('naxis'):
+            # the image of a tile compressed file, as read_header gives for ext 0
+            hdu = next((hdu for hdu in hdul if isinstance(hdu,fits.CompImageHDU)),hdu)
+        for keyword, value in updates.items():
+            hdu.header[keyword] = value
+    return False
+
+
+def _split(image):
+    return [image[start:start + CARD] for start in range(0,len(image),CARD)]
+
+
+def _parsed(cards):
+    """(keyword, value) pairs of raw cards, as _read_cards gives them"""
+
+    return _read_cards(io.BytesIO((''.join(cards) + 'END'.ljust(CARD)).ljust(
+        -(-(len(cards) + 1) * CARD // BLOCK) * BLOCK).encode('ascii')))
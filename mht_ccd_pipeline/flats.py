@@ -0,0 +1,95 @@
+import numpy as np
+from astropy.io import fits
+from astropy.nddata import StdDevUncertainty
+from ccdproc import CCDData
+
+
+class InverseFlat:
+    """Normalised inverse of a master flat, ready to multiply science frames
+
+    Holds mean(flat) / flat as float32 together with the flat's relative
+    uncertainty and a mask of pixels that cannot be flat corrected, so
+    correcting a frame is one multiply per pixel instead of ccdproc's
+    normalise and divide. Values below min_value are raised to min_value
+    before normalising, as ccdproc.flat_correct does; pixels that are still
+    zero, negative or not finite get an inverse of zero and are masked.
+    """
+
+    def __init__(self,flat,min_value=None,name=None):
+        self.name = name
+        self.unit = flat.unit
+
+        data = np.array(flat.data,dtype=float)
+        if min_value:
+            data[data < min_value] = min_value
+        self.mean = data.mean()
+
+        bad = ~np.isfinite(data) | (data <= 0)
+        if flat.mask is not None:
+            bad |= flat.mask
+        self.mask = bad if bad.any() else None
+
+        safe = np.where(bad,1.0,data)
+        self.inverse = np.where(bad,0.0,self.mean / safe).astype(np.float32)
+
+        self.relative = None
+        if flat.uncertainty is not None:
+            relative = np.asarray(flat.uncertainty.array,dtype=float) / safe
+            self.relative = np.where(bad,0.0,relative).astype(np.float32)
+
+    @classmethod
+    def fromArrays(cls,inverse,relative,mask,mean,unit=None,name=None):
+        """InverseFlat over existing arrays, e.g. views of shared memory"""
+
+        inverse_flat = cls.__new__(cls)
+        inverse_flat.name = name
+        inverse_flat.unit = unit
+        inverse_flat.mean = mean
+        inverse_flat.mask = mask
+        inverse_flat.inverse = inverse
+        inverse_flat.relative = relative
+        return inverse_flat
+
+    @property
+    def nbytes(self):
+        return self.inverse.nbytes + (self.relative.nbytes if self.relative is not None else 0)
+
+    def apply(self,ccd,uncertainty=True):
+        """Flat correct ccd, propagating uncertainties as ccdproc.flat_correct does
+
+        With uncertainty False the result has no uncertainty, whatever ccd
+        and the flat carry.
+        """
+
+        data = ccd.data * self.inverse
+
+        propagate = uncertainty
+        uncertainty = None
+        if propagate and (ccd.uncertainty is not None or self.relative is not None):
+            variance = np.zeros(data.shape,dtype=data.dtype)
+            if ccd.uncertainty is not None:
+                variance += (ccd.uncertainty.array * self.inverse) ** 2
+            if self.relative is not None:
+                variance += (data * self.relative) ** 2
+            uncertainty = StdDevUncertainty(np.sqrt(variance))
+
+        mask = ccd.mask
+        if self.mask is not None:
+            mask = self.mask if mask is None else (mask | self.mask)
+
+        corrected = CCDData(data,uncertainty=uncertainty,mask=mask,
+                            meta=ccd.meta.copy(),unit=ccd.unit)
+        corrected.meta['flatcor'] = 'ccd=<CCDData>, inverse flat={}'.format(self.name or '<InverseFlat>')
+        return corrected
+
+    def write(self,path_file,header=None):
+        """Save the inverse flat, with its relative uncertainty and mask, as FITS"""
+
+        primary = fits.PrimaryHDU(self.inverse,header)
+        primary.header['flatmean'] = (self.mean,'Mean of the master flat')
+        hdus = [primary]
+        if self.relative is not None:
+            hdus.append(fits.ImageHDU(self.relative,name='RELUNC'))
+        if self.mask is not None:
+            hdus.append(fits.ImageHDU(self.mask.astype(np.uint8),name='MASK'))
+        fits.HDUList(hdus).writeto(path_file,overwrite=True)
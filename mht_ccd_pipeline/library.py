@@ -0,0 +1,136 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from datetime import datetime
+
+
+# kinds of master kept, by image type index
+master_kinds = ['bias', 'dark', 'flat']
+
+
+def params_key(params):
+    """Fingerprint of the combine parameters of a master"""
+
+    text = json.dumps(params,sort_keys=True,default=str)
+    return hashlib.blake2b(text.encode('utf-8'),digest_size=16).hexdigest()
+
+
+def master_key(params,fingerprints):
+    """Fingerprint of a master from its combine parameters and input frame fingerprints"""
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(params_key(params).encode('ascii'))
+    for fingerprint in sorted(fingerprints):
+        digest.update(fingerprint.encode('ascii'))
+    return digest.hexdigest()
+
+
+def parse_date(value):
+    """datetime of a FITS DATE-OBS style string, None when it cannot be read"""
+
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).strip()).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+class MasterLibrary:
+    """Directory of master frames shared by nights, indexed by fingerprint
+
+    Each master is kept as <key>.fit, where the key fingerprints the
+    parameters that made it and the data of every input frame, so a night
+    with the same calibration frames reduced the same way finds the master
+    instead of combining it again. index.json records for each key the kind
+    of master, its exposure or filter, frame shape, the night and date it
+    came from and the parameters fingerprint, which nearest() uses to pick
+    a compatible master for a night without calibration frames. The index is
+    re-read before each update so several runs can share a library.
+    """
+
+    index_name = 'index.json'
+
+    def __init__(self,directory):
+        self.directory = directory
+        os.makedirs(directory,exist_ok=True)
+        self.index_file = os.path.join(directory,self.index_name)
+        self.lock = threading.Lock()
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.index_file,encoding='utf-8') as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        temp_file = self.index_file + '.tmp'
+        with open(temp_file,'w',encoding='utf-8') as fh:
+            json.dump(self.entries,fh,indent=2,sort_keys=True)
+        os.replace(temp_file,self.index_file)
+
+    def path(self,entry):
+        return os.path.join(self.directory,entry['file'])
+
+    def fetch(self,key,destination):
+        """Copy the master for key to destination, returning its entry or None"""
+
+        entry = self.entries.get(key)
+        if entry is None or not os.path.exists(self.path(entry)):
+            return None
+        shutil.copyfile(self.path(entry),destination)
+        return entry
+
+    def store(self,key,path_file,**details):
+        """Add the master at path_file under key with details for the index"""
+
+        entry = dict(details,file=key + '.fit',stored=datetime.now().isoformat(timespec='seconds'))
+        with self.lock:
+            shutil.copyfile(path_file,self.path(entry))
+            self.entries = self.load()
+            self.entries[key] = entry
+            self.save()
+        return entry
+
+    def matching(self,kind,params,**match):
+        """(key, entry) of every master of kind made with params that agrees with match"""
+
+        wanted = params_key(params)
+        found = []
+        for key, entry in self.entries.items():
+            if entry.get('kind') != kind or entry.get('params') != wanted:
+                continue
+            if any(entry.get(name) != value for name, value in match.items()):
+                continue
+            if os.path.exists(self.path(entry)):
+                found.append((key,entry))
+        return found
+
+    def nearest(self,kind,params,date=None,max_days=0,**match):
+        """(key, entry) of the compatible master closest in time to date, None when there is none
+
+        Masters must be of kind, made with the same parameters and agree on
+        every keyword of match, such as filter, exposure or shape. Without a
+        date, or masters with dates, the most recently stored is chosen.
+        max_days, when set, is the largest date difference accepted.
+        """
+
+        candidates = self.matching(kind,params,**match)
+        if not candidates:
+            return None
+
+        night = parse_date(date)
+        dated = [(abs((parse_date(entry.get('date')) - night).total_seconds()),key,entry)
+                 for key, entry in candidates if night is not None and parse_date(entry.get('date')) is not None]
+        if dated:
+            seconds, key, entry = min(dated,key=lambda item: item[0])
+            if max_days and seconds > max_days * 86400:
+                return None
+            return key, entry
+        if max_days and night is not None:
+            return None
+        return max(candidates,key=lambda item: item[1].get('stored',''))
@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import logging
+import threading
+
+
+logger = logging.getLogger('mht_ccd_pipeline')
+
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(night)s %(step)s %(frame)s %(message)s%(duration_text)s'
+
+log_levels = ['DEBUG', 'INFO', 'WARNING', 'ERROR']
+
+
+class ContextFilter(logging.Filter):
+    """Give every record the step, night, frame and duration fields"""
+
+    def filter(self,record):
+        for key in ('step','night','frame'):
+            if getattr(record,key,None) is None:
+                setattr(record,key,'-')
+        duration = getattr(record,'duration',None)
+        record.duration_text = '' if duration is None else ' ({:.3f} s)'.format(duration)
+        return True
+
+
+def setup_logging(level='INFO',filename=None):
+    """Send pipeline log records to the console and optionally a file"""
+
+    logger.setLevel(getattr(logging,str(level).upper(),logging.INFO))
+
+    for handler in list(logger.handlers):
+        if getattr(handler,'_mht_handler',False):
+            logger.removeHandler(handler)
+            handler.close()
+
+    handlers = [logging.StreamHandler()]
+    if filename:
+        handlers.append(logging.FileHandler(filename,encoding='utf-8'))
+
+    for handler in handlers:
+        handler._mht_handler = True
+        handler.addFilter(ContextFilter())
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(handler)
+
+    logger.propagate = False
+    return logger
+
+
+class ReportLogger(logging.LoggerAdapter):
+    """Logger attaching the night and current step of a RunReport to each record
+
+    Calls accept frame= and duration= keywords, e.g.
+
+        self.log.info('Median filter', frame=fname)
+    """
+
+    def __init__(self,report,log=None):
+        super().__init__(log or logger,{})
+        self.report = report
+
+    def process(self,msg,kwargs):
+        extra = {
+            'night':os.path.basename(str(self.report.night)) if self.report.night else None,
+            'step':self.report.current_step(),
+            'frame':kwargs.pop('frame',None),
+            'duration':kwargs.pop('duration',None),
+        }
+        extra.update(kwargs.get('extra') or {})
+        kwargs['extra'] = extra
+        return msg, kwargs
+
+
+class TraceRecorder:
+    """Collect timed events in Chrome trace-event format
+
+    The written file opens in chrome://tracing or https://ui.perfetto.dev,
+    showing one row per process and thread so stragglers and idle workers
+    stand out. Events from worker processes are merged with extend().
+    """
+
+    def __init__(self):
+        self.events = []
+        self.origin = time.perf_counter()
+        self.origin_epoch = time.time()
+        self._threads = set()
+        self._lock = threading.Lock()
+
+    def timestamp(self,counter):
+        """Microseconds since the recorder was created for a perf_counter value"""
+
+        return (counter - self.origin) * 1e6
+
+    def _thread(self):
+        pid = os.getpid()
+        tid = threading.get_ident()
+        if (pid,tid) not in self._threads:
+            self._threads.add((pid,tid))
+            self.events.append({'name':'thread_name','ph':'M','pid':pid,'tid':tid,
+                                'args':{'name':threading.current_thread().name}})
+        return pid, tid
+
+    def complete(self,name,category,start,duration,args=None):
+        """Add an event that started at perf_counter start and lasted duration seconds"""
+
+        with self._lock:
+            pid, tid = self._thread()
+            self.events.append({
+                'name':name,
+                'cat':category,
+                'ph':'X',
+                'ts':self.timestamp(start),
+                'dur':duration * 1e6,
+                'pid':pid,
+                'tid':tid,
+                'args':args or {},
+            })
+
+    def instant(self,name,category,args=None):
+        with self._lock:
+            pid, tid = self._thread()
+            self.events.append({
+                'name':name,
+                'cat':category,
+                'ph':'i',
+                's':'t',
+                'ts':self.timestamp(time.perf_counter()),
+                'pid':pid,
+                'tid':tid,
+                'args':args or {},
+            })
+
+    def extend(self,events,origin_epoch=None):
+        """Merge events recorded by another TraceRecorder, e.g. in a worker process"""
+
+        shift = 0.0
+        if origin_epoch is not None:
+            shift = (origin_epoch - self.origin_epoch) * 1e6
+        with self._lock:
+            for event in events:
+                event = dict(event)
+                if 'ts' in event:
+                    event['ts'] += shift
+                self.events.append(event)
+
+    def drain(self):
+        """Remove and return the events recorded so far"""
+
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+    def write(self,path):
+        """Write the events as a Chrome trace-event JSON file"""
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with self._lock:
+            trace = {'traceEvents':list(self.events),'displayTimeUnit':'ms'}
+        with open(path,'w',encoding='utf-8') as fh:
+            json.dump(trace,fh)
+        return path
@@ -0,0 +1,129 @@
+import os
+import sys
+import time
+import threading
+import resource
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+class MemoryBudgetError(MemoryError):
+    """A reduction stage is predicted to need more memory than the configured budget"""
+
+    def __init__(self,stage,estimate,budget):
+        self.stage = stage
+        self.estimate = estimate
+        self.budget = budget
+        super().__init__('{}: estimated {:.1f} MB exceeds the memory budget of {:.1f} MB'.format(
+            stage,estimate / 1e6,budget / 1e6))
+
+
+def current_rss():
+    """Resident set size of this process in bytes"""
+
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        pass
+
+    # fall back to the peak, which is the best available on this platform
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss
+    return rss * 1024
+
+
+class MemorySampler(threading.Thread):
+    """Background thread sampling the process RSS while a step runs"""
+
+    def __init__(self,interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.start_rss = current_rss()
+        self.peak_rss = self.start_rss
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak_rss = max(self.peak_rss,current_rss())
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.peak_rss = max(self.peak_rss,current_rss())
+        return self.peak_rss
+
+
+class MemoryEstimate:
+    """Predict the peak memory of each reduction stage
+
+    Sizes follow what the stages hold at once: the ingested frames carry a
+    float64 data array plus an equally sized uncertainty array, and a median
+    combine keeps every input frame in memory plus its own working copies.
+    """
+
+    # bytes per pixel of a float64 CCDData with uncertainty and mask
+    ccd_pixel_bytes = 8 + 8 + 1
+
+    # frames alive at once in a per-frame stage, e.g. frame, master, scaled
+    # master and result while removing the dark
+    per_frame_copies = {
+        'Copy Images': 4,
+        'Bias Removal': 3,
+        'Dark Removal': 4,
+        'Reduce Science': 4,
+    }
+
+    # ccdproc.combine memory factors, median 3 and average 2, times 1.3
+    combine_factor = {'median': 3 * 1.3,'average': 2 * 1.3}
+
+    def __init__(self,shape,counts,methods):
+        self.shape = shape
+        self.counts = counts
+        self.methods = methods
+        self.pixels = shape[0] * shape[1]
+        self.frame_bytes = self.pixels * self.ccd_pixel_bytes
+
+    # the frame being added and the running mean, sum of squared deviations
+    # and count, which together take about as much as one frame
+    streaming_frames = 2
+
+    def combine_bytes(self,count,method):
+        """Memory to combine count frames, inputs plus combine workspace"""
+
+        if method == 'average':
+            # averages are streamed, see combine.stream_average
+            return self.streaming_frames * self.frame_bytes
+
+        factor = self.combine_factor.get(method,self.combine_factor['median'])
+        return count * self.frame_bytes * (1 + factor) + self.frame_bytes
+
+    def stages(self):
+        """Estimated peak bytes for each stage"""
+
+        estimate = {}
+        for stage, copies in self.per_frame_copies.items():
+            estimate[stage] = copies * self.frame_bytes
+
+        masters = 0
+        for image_type in ('bias','dark','flat'):
+            count = self.counts.get(image_type,0)
+            if count:
+                masters = max(masters,self.combine_bytes(count,self.methods.get(image_type,'median')))
+        estimate['Create Masters'] = masters
+
+        return estimate
+
+    def minimum(self,stage):
+        """Smallest memory a stage can run in, chunked where possible"""
+
+        if stage == 'Create Masters':
+            return 2 * self.frame_bytes
+        return self.stages().get(stage,0)
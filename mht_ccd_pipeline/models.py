@@ -1,5 +1,8 @@
 import os, fnmatch, shutil
+import re
 import json
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
 
 import ccdproc
 from ccdproc import CCDData
@@ -16,6 +19,24 @@ from configobj import ConfigObj
 import configparser
 
 from .constants import FieldTypes as FT
+from .report import RunReport, reportstep
+from .memory import MemoryEstimate, MemoryBudgetError
+from .logs import TraceRecorder, log_levels
+from .medianfilter import median_filter
+from .cosmicray import clean_cosmic_rays, adc_saturation
+from .stack import FrameCache, default_cache_bytes, default_tile_bytes, downsample, frame_offset, frame_rows, tile_rows, combine_tile
+from .flats import InverseFlat
+from .combine import stream_average
+from .uncertainty import uncertainty_modes, keeps_uncertainty, provenance_keys
+from .sharedmem import SharedFrames, attach
+from .pipeline import FramePipeline, prefetch
+from .classify import FrameClassifier
+from .fitsscan import HeaderCollection, read_header, patch_header, data_hdu
+from .storage import open_storage
+from .workstore import WorkingStore, working_stores, working_bytes
+from .export import export_tree, export_verifications, copy_buffer
+from .fingerprint import FingerprintRegistry, data_fingerprint, copy_fingerprinted
+from .library import MasterLibrary, master_kinds, master_key, params_key
 
 class ImageFile_Model:
     """FITS file required file details"""
@@ -140,6 +161,19 @@ class Configuration_Model:
         'ccd_readnoise': {'req': True,'type':FT.decimal,'value': 17.8,'min': 0, 'inc': .001},
         'file_usage': {'req': True,'type':FT.string_list,'values':['Combined', 'Calibration', 'Masters']},
         'ext_directory': {'req': False,'type':FT.string,'value': ''},
+        'memory_budget': {'req': False,'type':FT.integer,'value': 0,'min': 0, 'inc': 1},
+        'memory_tracking': {'req': False,'type':FT.boolean,'value':'False'},
+        'log_level': {'req': False,'type':FT.string_list,'value':'INFO','values':log_levels},
+        'trace_events': {'req': False,'type':FT.boolean,'value':'False'},
+        'worker_threads': {'req': False,'type':FT.integer,'value': 0,'min': 0, 'inc': 1},
+        'worker_processes': {'req': False,'type':FT.integer,'value': 0,'min': 0, 'inc': 1},
+        'prefetch_depth': {'req': False,'type':FT.integer,'value': 2,'min': 0, 'inc': 1},
+        'write_depth': {'req': False,'type':FT.integer,'value': 2,'min': 1, 'inc': 1},
+        'precision': {'req': False,'type':FT.string_list,'value':'float64','values':['float64','float32']},
+        'precision_validation': {'req': False,'type':FT.boolean,'value':'False'},
+        'uncertainty': {'req': False,'type':FT.string_list,'value':'full','values':uncertainty_modes},
+        'working_store': {'req': False,'type':FT.string_list,'value':'disk','values':working_stores},
+        'export_verify': {'req': False,'type':FT.string_list,'value':'size','values':export_verifications},
     }
 
     bias_details = {
@@ -182,6 +216,9 @@ class Configuration_Model:
         'update_fits_filter': {'req': True,'type':FT.boolean,'value':'True'},
         'perform_median_filter': {'req': True,'type':FT.boolean,'value':'False'},
         'median_filter_size': {'req': True,'type':FT.integer,'value': 1,'min': 0, 'inc': 1},
+        'cosmic_ray_removal': {'req': False,'type':FT.boolean,'value':'False'},
+        'cosmic_ray_sigclip': {'req': False,'type':FT.decimal,'value': 4.5,'min': 0, 'inc': .1},
+        'cosmic_ray_tile_size': {'req': False,'type':FT.integer,'value': 1024,'min': 0, 'inc': 64},
     }
 
     master_details = {
@@ -195,6 +232,13 @@ class Configuration_Model:
         'median_combine_dark': {'req': True,'type':FT.boolean,'value':'False'},
         'median_combine_flat': {'req': True,'type':FT.boolean,'value':'False'},
         'update_fits': {'req': True,'type':FT.boolean,'value':'True'},
+        'flat_min_value': {'req': False,'type':FT.decimal,'value': 0,'min': 0, 'inc': .001},
+        'sigma_clip': {'req': False,'type':FT.boolean,'value':'False'},
+        'sigma_clip_low': {'req': False,'type':FT.decimal,'value': 3.0,'min': 0, 'inc': .1},
+        'sigma_clip_high': {'req': False,'type':FT.decimal,'value': 3.0,'min': 0, 'inc': .1},
+        'save_inverse_flat': {'req': False,'type':FT.boolean,'value':'False'},
+        'library_dir': {'req': False,'type':FT.string,'value': ''},
+        'library_max_days': {'req': False,'type':FT.integer,'value': 0,'min': 0, 'inc': 1},
     }
 
     reduction_details = {
@@ -204,6 +248,10 @@ class Configuration_Model:
         'filename_reduced_stub': {'req': True,'type':FT.string,'value':'reduced'},
         'filename_stub_prefix': {'req': False,'type':FT.rstring,'value':'False'},
         'filename_prefix_suffix_modifier': {'req': True,'type':FT.string,'value':'_'},
+        'stack_frames': {'req': False,'type':FT.boolean,'value':'False'},
+        'filename_stack_stub': {'req': False,'type':FT.string,'value':'stack'},
+        'stack_median': {'req': False,'type':FT.boolean,'value':'False'},
+        'stack_downsample': {'req': False,'type':FT.integer,'value': 4,'min': 1, 'inc': 1},
     }
 
     fields = {'directories':directories,'general_details':general_details,'bias_details':bias_details,
@@ -227,9 +275,21 @@ class Configuration_Model:
 
         # Load the configuration file
         self.config = ConfigObj(filename)
+        self.add_missing_defaults()
 
         self.save()
 
+    def add_missing_defaults(self):
+        """Add default values for settings missing from older configuration files"""
+
+        for section, fields in self.fields.items():
+            if section not in self.config:
+                continue
+            existing = [key.lower() for key in self.config[section]]
+            for key, spec in fields.items():
+                if key.lower() not in existing and 'value' in spec:
+                    self.config[section][key] = spec['value']
+
     def save(self,filename=None):
         """Save the configuration to file"""
         if filename  is not None:
@@ -239,32 +299,219 @@ class Configuration_Model:
     def saveas(self,filename):
         """Save the configuration to a new file"""
         self.save(filename)
-        
+
+    def collection_arguments(self,working_dir=None):
+        """Arguments for ImageCollection_Model built from the configuration"""
+
+        if working_dir is None:
+            working_dir = self.config['directories']['working_dir']
+
+        filemods = {}
+        filemods['filename_mod_prefix'] = self.config['reduction_details'].as_bool('filename_stub_prefix')
+        filemods['filename_mod'] = self.config['reduction_details']['filename_prefix_suffix_modifier']
+        if filemods['filename_mod_prefix']:
+            filemods['bias_removal_mod'] = self.config['reduction_details']['filename_bias_stub'] + filemods['filename_mod']
+            filemods['dark_removal_mod'] = self.config['reduction_details']['filename_dark_stub'] + filemods['filename_mod']
+            filemods['flat_removal_mod'] = self.config['reduction_details']['filename_flat_stub'] + filemods['filename_mod']
+            filemods['reduced_removal_mod'] = self.config['reduction_details']['filename_reduced_stub'] + filemods['filename_mod']
+            filemods['stack_mod'] = self.config['reduction_details']['filename_stack_stub'] + filemods['filename_mod']
+        else:
+            filemods['bias_removal_mod'] = filemods['filename_mod'] + self.config['reduction_details']['filename_bias_stub']
+            filemods['dark_removal_mod'] = filemods['filename_mod'] + self.config['reduction_details']['filename_dark_stub']
+            filemods['flat_removal_mod'] = filemods['filename_mod'] + self.config['reduction_details']['filename_flat_stub']
+            filemods['reduced_removal_mod'] = filemods['filename_mod'] + self.config['reduction_details']['filename_reduced_stub']
+            filemods['stack_mod'] = filemods['filename_mod'] + self.config['reduction_details']['filename_stack_stub']
+
+        filemods['master_bias_name'] = self.config['master_details']['filename_bias']
+        filemods['master_dark_name'] = self.config['master_details']['filename_dark']
+        filemods['master_flat_name'] = self.config['master_details']['filename_flat']
+        filemods['master_bias_header_value'] = self.config['master_details']['fits_header_image_value_bias']
+        filemods['master_dark_header_value'] = self.config['master_details']['fits_header_image_value_dark']
+        filemods['master_flat_header_value'] = self.config['master_details']['fits_header_image_value_flat']
+        filemods['median_combine_bias'] = self.config['master_details'].as_bool('median_combine_bias')
+        filemods['median_combine_dark'] = self.config['master_details'].as_bool('median_combine_dark')
+        filemods['median_combine_flat'] = self.config['master_details'].as_bool('median_combine_flat')
+        filemods['sigma_clip'] = self.config['master_details'].as_bool('sigma_clip')
+        filemods['sigma_clip_low'] = self.config['master_details'].as_float('sigma_clip_low')
+        filemods['sigma_clip_high'] = self.config['master_details'].as_float('sigma_clip_high')
+        filemods['save_masters'] = self.config['directories'].as_bool('save_masters')
+        filemods['save_working'] = self.config['directories'].as_bool('save_working')
+        filemods['flat_min_value'] = self.config['master_details'].as_float('flat_min_value')
+        filemods['save_inverse_flat'] = self.config['master_details'].as_bool('save_inverse_flat')
+        filemods['library_dir'] = self.config['master_details']['library_dir']
+        filemods['library_max_days'] = self.config['master_details'].as_int('library_max_days')
+        filemods['cosmic_ray_removal'] = self.config['science_details'].as_bool('cosmic_ray_removal')
+        filemods['cosmic_ray_sigclip'] = self.config['science_details'].as_float('cosmic_ray_sigclip')
+        filemods['cosmic_ray_tile_size'] = self.config['science_details'].as_int('cosmic_ray_tile_size')
+        filemods['stack_frames'] = self.config['reduction_details'].as_bool('stack_frames')
+        filemods['stack_median'] = self.config['reduction_details'].as_bool('stack_median')
+        filemods['stack_downsample'] = self.config['reduction_details'].as_int('stack_downsample')
+        filemods['memory_budget'] = self.config['general_details'].as_int('memory_budget')
+        filemods['memory_tracking'] = self.config['general_details'].as_bool('memory_tracking')
+        filemods['trace_events'] = self.config['general_details'].as_bool('trace_events')
+        filemods['worker_threads'] = self.config['general_details'].as_int('worker_threads')
+        filemods['worker_processes'] = self.config['general_details'].as_int('worker_processes')
+        filemods['prefetch_depth'] = self.config['general_details'].as_int('prefetch_depth')
+        filemods['write_depth'] = self.config['general_details'].as_int('write_depth')
+        filemods['precision'] = self.config['general_details']['precision']
+        filemods['precision_validation'] = self.config['general_details'].as_bool('precision_validation')
+        filemods['uncertainty'] = self.config['general_details']['uncertainty']
+        filemods['working_store'] = self.config['general_details']['working_store']
+        filemods['export_verify'] = self.config['general_details']['export_verify']
+
+        paths = {}
+        paths['source_dir'] = self.config['directories']['source_dir']
+        paths['working_dir'] = working_dir
+        paths['base_bias_dir'] = self.config['directories']['bias_dir']
+        paths['base_dark_dir'] = self.config['directories']['dark_dir']
+        paths['base_flat_dir'] = self.config['directories']['flat_dir']
+        paths['bias_dir'] = os.path.join(
+                                working_dir,
+                                self.config['directories']['bias_dir'])
+        paths['dark_dir'] = os.path.join(
+                                working_dir,
+                                self.config['directories']['dark_dir'])
+        paths['flat_dir'] = os.path.join(
+                                working_dir,
+                                self.config['directories']['flat_dir'])
+        paths['master_dir'] = os.path.join(
+                                working_dir,
+                                self.config['directories']['master_dir'])
+        paths['science_dir'] = os.path.join(
+                                working_dir,
+                                self.config['directories']['science_dir'])
+        paths['output_dir'] = os.path.join(
+                                working_dir,
+                                self.config['directories']['output_dir'])
+
+        keywords = (self.config['general_details']['fits_header_image_type'],
+                         self.config['general_details']['fits_header_filter'],
+                         self.config['general_details']['fits_header_CCD_temp'],
+                         self.config['general_details']['fits_header_exposure'],
+                         "OBJECT")
+
+        imagelist = (self.config['bias_details']['fits_header_image_value'],
+                        self.config['dark_details']['fits_header_image_value'],
+                        self.config['flat_details']['fits_header_image_value'],
+                        self.config['science_details']['fits_header_image_value'],
+                        )
+
+        filelist = (self.config['bias_details']['filename_text'],
+                        self.config['dark_details']['filename_text'],
+                        self.config['flat_details']['filename_text'],
+                        self.config['science_details']['filename_text'],
+                        )
+
+        usefitslist = (self.config['bias_details']['use_fits'],
+                        self.config['dark_details']['use_fits'],
+                        self.config['flat_details']['use_fits'],
+                        self.config['science_details']['use_fits'],
+                        )
+        updatefitslist = (self.config['bias_details']['update_fits'],
+                        self.config['dark_details']['update_fits'],
+                        self.config['flat_details']['update_fits'],
+                        self.config['science_details']['update_fits'],
+                        self.config['master_details']['update_fits'],
+                        )
+        usefitsfilterlist = (self.config['flat_details']['use_fits_filter'],
+                        self.config['science_details']['use_fits_filter'],
+                        )
+        updatefitsfilterlist = (self.config['flat_details']['update_fits_filter'],
+                        self.config['science_details']['update_fits_filter'],
+                        )
+        ccd_details = (float(self.config['general_details']['ccd_gain']),
+                         float(self.config['general_details']['ccd_readnoise']))
+
+        flatfilterlist = (self.config['flat_details']['filename_text_filter'].split())
+
+        sciencefilterlist = (self.config['science_details']['filename_text_filter'].split())
+
+        medianfilter = (self.config['bias_details']['perform_median_filter'],
+                        self.config['dark_details']['perform_median_filter'],
+                        self.config['flat_details']['perform_median_filter'],
+                        self.config['science_details']['perform_median_filter'],
+                        )
+
+        medianfiltersize = (self.config['bias_details']['median_filter_size'],
+                            self.config['dark_details']['median_filter_size'],
+                            self.config['flat_details']['median_filter_size'],
+                            self.config['science_details']['median_filter_size'],
+                            )
+
+        directorylist = (paths['bias_dir'],
+                            paths['dark_dir'],
+                            paths['flat_dir'],
+                            paths['science_dir'],
+                            paths['master_dir'],
+                            paths['output_dir'])
+
+
+        collection_args = {
+            'keywords':keywords,
+            'paths':paths,
+            'filemods':filemods,
+            'image_list':imagelist,
+            'file_list':filelist,
+            'usefits_list':usefitslist,
+            'updatefits_list':updatefitslist,
+            'usefitsfilter_list':usefitsfilterlist,
+            'updatefitsfilter_list':updatefitsfilterlist,
+            'flatfilter_list':flatfilterlist,
+            'sciencefilter_list':sciencefilterlist,
+            'ccd_details':ccd_details,
+            'medianfilter':medianfilter,
+            'medianfiltersize':medianfiltersize,
+        }
+
+        return collection_args, directorylist
+
+
+class Status:
+    """Status of a reduction for scripts and sweeps, in place of the Tk variable the GUI shows"""
+
+    def __init__(self,value=''):
+        self.value = value
+
+    def set(self,value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+def source_collection(source_dir,keywords,threads=0):
+    """Header collection of the frames of a night, with the keywords a model reads from them"""
+
+    storage = open_storage(source_dir)
+    return HeaderCollection(str(storage),keywords=[*keywords,'naxis1','naxis2','date-obs'],
+                            threads=threads,storage=storage)
+
+
 class ImageCollection_Model():
     """Image collection model"""
 
+    # steps of a calibration the reduction form can turn off
+    calibration_steps = ('CreateDir','CopyImages','CreateMasters','BiasRemoval','DarkRemoval','PerformReduction')
+
+    # settings passed to science worker processes, see workerState
+    worker_attributes = ('filemods','paths','keywords','imagelist','ccd_details','dtype',
+                         'uncertainty_mode','worker_threads')
+
     def __init__(self,keywords,paths,filemods,image_list,file_list,usefits_list,updatefits_list,
                             usefitsfilter_list,updatefitsfilter_list,flatfilter_list,sciencefilter_list,ccd_details,medianfilter,
-                            medianfiltersize):
-        
-        self.paths = paths
-        self.filemods = filemods
-        self.keywords = keywords
-        self.imagelist = image_list
-        self.filelist = file_list
-        self.usefitslist = usefits_list
-        self.updatefitslist = updatefits_list
-        self.usefitsfilterlist = usefitsfilter_list
-        self.updatefitsfilterlist = updatefitsfilter_list
-        self.flatfilterlist = flatfilter_list
-        self.sciencefilterlist = sciencefilter_list
-        self.status = tk.StringVar()
-        self.ccd_details = ccd_details
-        self.medianfilter = medianfilter
-        self.medianfiltersize = medianfiltersize
-                
-        self.ic = ImageFileCollection(self.paths['source_dir'],keywords=self.keywords)
+                            medianfiltersize,status=None,header_collection=None):
+
+        self.configure(keywords,paths,filemods,image_list,file_list,usefits_list,updatefits_list,
+                       usefitsfilter_list,updatefitsfilter_list,flatfilter_list,sciencefilter_list,ccd_details,medianfilter,
+                       medianfiltersize,status)
+
+        # a header scan of the night may be shared by models of the same night, see sweep
+        if header_collection is None:
+            header_collection = source_collection(self.paths['source_dir'],self.keywords,self.worker_threads)
+        self.source = header_collection.storage
+        self.ic = header_collection
         self.table = self.ic.summary
+        self.source_frames = None
 
         self.stats = {}
 
@@ -283,6 +530,56 @@ class ImageCollection_Model():
         self.flat_names = self.fileNames(self.ic,flat_keys)
         self.science_names = self.fileNames(self.ic,science_keys)
 
+    def configure(self,keywords,paths,filemods,image_list,file_list,usefits_list,updatefits_list,
+                  usefitsfilter_list,updatefitsfilter_list,flatfilter_list,sciencefilter_list,ccd_details,medianfilter,
+                  medianfiltersize,status=None):
+        """Settings, run report and caches of the model, all but the scan of its night"""
+
+        # a copy, as the nights of a run share paths and a RAM working store rewrites them
+        self.paths = dict(paths)
+        self.filemods = filemods
+        self.keywords = keywords
+        self.imagelist = image_list
+        self.filelist = file_list
+        self.usefitslist = usefits_list
+        self.updatefitslist = updatefits_list
+        self.usefitsfilterlist = usefitsfilter_list
+        self.updatefitsfilterlist = updatefitsfilter_list
+        self.flatfilterlist = flatfilter_list
+        self.sciencefilterlist = sciencefilter_list
+        self.status = status if status is not None else tk.StringVar()
+        self.ccd_details = ccd_details
+        self.medianfilter = medianfilter
+        self.medianfiltersize = medianfiltersize
+        trace = TraceRecorder() if self.filemods.get('trace_events',False) else None
+        self.report = RunReport(night=self.paths['source_dir'],track_memory=self.filemods.get('memory_tracking',False),trace=trace)
+        self.log = self.report.log
+        self.memory_budget = self.filemods.get('memory_budget',0) * 1e6
+        self.report.memory_budget = self.memory_budget
+        self.chunk_combine = False
+        self.worker_threads = self.filemods.get('worker_threads',0)
+        self.inverse_flats = {}
+        self.dark_cache = {}
+        self.dtype = np.float32 if self.filemods.get('precision','float64') == 'float32' else np.float64
+        self.uncertainty_mode = self.filemods.get('uncertainty','full')
+        self.worker_processes = self.filemods.get('worker_processes',0)
+        self.prefetch_depth = self.filemods.get('prefetch_depth',2)
+        self.write_depth = self.filemods.get('write_depth',2)
+        self.shared_frames = {}
+        self.stack_cache = None
+        self.working_store = WorkingStore(self.paths['working_dir'])
+        self.fingerprints = FingerprintRegistry()
+        self.frame_fingerprints = {}
+        self.library = MasterLibrary(self.filemods['library_dir']) if self.filemods.get('library_dir') else None
+
+    @classmethod
+    def memoryModel(cls,status=None,**collection_args):
+        """Model for frames held in memory, with no night to scan, see api"""
+
+        model = cls.__new__(cls)
+        model.configure(status=status,**collection_args)
+        return model
+
     def createWorkingDirectories(self):
         """Create Image Directories"""
         for dir in self.directorylist:
@@ -308,10 +605,10 @@ class ImageCollection_Model():
                         try:
                             shutil.move(src_file,dest_dir)
                         except shutil.Error:
-                            print("file error")
+                            self.log.warning('File error, removing duplicate',frame=file)
                             os.remove(src_file)    
                 except KeyError:
-                    print("No %s in Header",self.imagelist[0])
+                    self.log.warning('No %s in Header',self.imagelist[0],frame=file)
         
     def splitFilters(self,source_dir):
         for file in os.listdir(source_dir):
@@ -327,72 +624,88 @@ class ImageCollection_Model():
                         try:
                             shutil.move(src_file,dest_dir)
                         except shutil.Error:
-                            print("file error")
+                            self.log.warning('File error, removing duplicate',frame=file)
                             os.remove(src_file)
                     except KeyError:
-                        print("No %s in Header",self.imagelist[1])
+                        self.log.warning('No %s in Header',self.imagelist[1],frame=file)
+
+    def sourceFrames(self):
+        """Frames of source_dir for each image type, classified once from the collection summary"""
+
+        if self.source_frames is None:
+            classifier = FrameClassifier(self.imagelist,self.filelist,self.usefitslist)
+            image_types = self.table[self.keywords[0]] if self.keywords[0] in self.table.colnames else None
+            frames = []
+            for row, fname in enumerate(self.table['file']):
+                image_type = None
+                if image_types is not None and not np.ma.is_masked(image_types[row]):
+                    image_type = image_types[row]
+                frames.append((fname,image_type))
+            self.source_frames = classifier.classify(frames)
+        return self.source_frames
 
     def copyImageTypes(self,gain,readnoise):
-        imagetypecount = 0
-
-        while imagetypecount < len(self.imagelist):
-            
-            if self.usefitslist[imagetypecount] == "True":
-                self.copyImageType(self.ic,self.directorylist[imagetypecount],self.updatefitslist[imagetypecount],self.imagelist[imagetypecount]
-                        ,gain,readnoise,self.medianfilter[imagetypecount],self.medianfiltersize[imagetypecount])
-            else:
-                if imagetypecount != 3 or (imagetypecount == 3 and self.filelist[3]):
-                    print("include")
-                    include = '*'+self.filelist[imagetypecount]+'*'
-                    print(repr(include))
-                    tempic = ImageFileCollection(self.paths['source_dir'],keywords=self.keywords,glob_include=include)
-                else:
-                    print("exclude")
-                    #exclude = '*'+self.filelist[0]+'*','*'+self.filelist[1]+'*','*'+self.filelist[2]+'*'
-                    exclude = '*'+self.filelist[2]+'*'
-                    print(repr(exclude))
-                    tempic = ImageFileCollection(self.paths['source_dir'],keywords=self.keywords,glob_exclude=exclude)
-                self.copyImageTypeFname(tempic,self.directorylist[imagetypecount],self.updatefitslist[imagetypecount],
-                            self.imagelist[imagetypecount],self.filelist[imagetypecount],gain,readnoise,self.medianfilter[imagetypecount],
-                            self.medianfiltersize[imagetypecount])
-                
-                if imagetypecount == 3:
-                    files = fnmatch.filter(os.listdir(self.directorylist[3]),'*'+self.filelist[0]+'*')
-                    for filename in files:
-                        filepath = os.path.join(self.directorylist[3],filename)
-                        os.remove(filepath)
-                    files = fnmatch.filter(os.listdir(self.directorylist[3]),'*'+self.filelist[1]+'*')
-                    for filename in files:
-                        filepath = os.path.join(self.directorylist[3],filename)
-                        os.remove(filepath)
-
-
-            imagetypecount = imagetypecount + 1
-
-    def copyImageType(self,ic,dest_dir,updatefits_list,image_type,gain,readnoise,medianfilter,medianfiltersize):
-        #imagetyp need changing here to be the item from keywords[0]
-
-        filtersize = int(medianfiltersize)
-
-        for hdu in ic.hdus(save_location=dest_dir, imagetyp=image_type, overwrite=True):
-            try:
-                units = hdu.header['bunit']
-            except:
-                hdu.header['bunit'] = 'adu'
-
-            try:
-                if medianfilter == 'True':
-                    print('filtering')
-                    hdu.data = ccdproc.median_filter(hdu.data,filtersize)
-                    hdu.header['medfilt'] = filtersize
-            except:
-                pass
-
-        self.create_deviation(dest_dir,gain,readnoise)
+        """Copy the frames of each image type to its working directory"""
+
+        for imagetypecount, fnames in enumerate(self.sourceFrames()):
+            dest_dir = self.directorylist[imagetypecount]
+
+            header_updates = {}
+            if self.usefitslist[imagetypecount] != "True" and self.updatefitslist[imagetypecount] == "True":
+                header_updates[self.keywords[0]] = self.imagelist[imagetypecount]
+
+            self.log.debug('%d %s frames',len(fnames),self.imagelist[imagetypecount])
+            filtersize = int(self.medianfiltersize[imagetypecount])
+            for fname in fnames:
+                self.copyFrame(self.source,fname,dest_dir,
+                               self.medianfilter[imagetypecount],filtersize,header_updates,imagetypecount)
+
+            self.create_deviation(dest_dir,gain,readnoise)
+
+    def isDuplicate(self,fingerprint,fname,image_type=None):
+        """Whether a frame repeats the data of one already ingested and should be skipped
+
+        Repeats within the night are always skipped. Science frames repeated
+        from another night of the run are skipped too, but calibration frames
+        are kept because each night builds its masters from its own frames.
+        """
+
+        self.frame_fingerprints[fname] = fingerprint
+        first = self.fingerprints.claim(fingerprint,self.paths['source_dir'],fname)
+        if first is None:
+            return False
+        first_night, first_frame = first
+        skip = first_night == self.paths['source_dir'] or image_type == 3
+        type_name = self.imagelist[image_type] if image_type is not None else None
+        self.report.duplicate(fname,type_name,first_night,first_frame,skip)
+        self.log.warning('Duplicate of %s%s%s',first_frame,
+                         '' if first_night == self.paths['source_dir'] else ' in ' + str(first_night),
+                         ', skipped' if skip else '',frame=fname)
+        return skip
+
+    def copyFrame(self,source,fname,dest_dir,medianfilter,filtersize,header_updates=None,image_type=None):
+        """Copy frame fname of the source storage into dest_dir, median filtering and updating the header on the way
+
+        Frames whose data duplicates a frame already ingested are skipped, see isDuplicate.
+        """
+
+        if medianfilter != 'True' and not fname.endswith(('.gz','.bz2','.Z','.zip','.fz')):
+            return self.copyFrameBytes(source,fname,dest_dir,header_updates,image_type)
+
+        with self.report.operation('read',fname,source.size(fname)):
+            src_file = source.open(fname)
+            hdulist = fits.open(src_file,do_not_scale_image_data=True)
+            # the primary HDU of a .fz file is empty, its image is in the next
+            hdu = data_hdu(hdulist)
+
+        with self.report.operation('compute',fname):
+            duplicate = self.isDuplicate(data_fingerprint(hdu.header,hdu.data),fname,image_type)
+        if duplicate:
+            hdulist.close()
+            src_file.close()
+            return
 
-    def copyImageTypeFname(self,ic,dest_dir,updatefits_list,image_list,file_list,gain,readnoise,medianfilter,medianfiltersize):
-        filtersize = int(medianfiltersize)
-        for hdu in ic.hdus(save_location=dest_dir, overwrite=True):
+        with self.report.operation('compute',fname):
             try:
                 units = hdu.header['bunit']
             except:
@@ -400,16 +713,44 @@ class ImageCollection_Model():
 
             try:
                 if medianfilter == 'True':
-                    print('filtering')
-                    hdu.data = ccdproc.median_filter(hdu.data,filtersize)
+                    self.log.debug('Median filter size %d',filtersize,frame=fname)
+                    hdu.data = median_filter(hdu.data,filtersize,self.worker_threads)
                     hdu.header['medfilt'] = filtersize
             except:
                 pass
 
-            if updatefits_list == "True":
-                hdu.header[self.keywords[0]] = image_list
-
-        self.create_deviation(dest_dir,gain,readnoise)
+            if header_updates:
+                for key, value in header_updates.items():
+                    hdu.header[key] = value
+
+        dest_file = os.path.join(dest_dir,fname)
+        with self.report.operation('write',fname) as op:
+            hdulist.writeto(dest_file,overwrite=True)
+            op['bytes'] = os.path.getsize(dest_file)
+        hdulist.close()
+        src_file.close()
+
+    def copyFrameBytes(self,source,fname,dest_dir,header_updates=None,image_type=None):
+        """Copy a frame that is not median filtered as it is, patching its header in place"""
+
+        dest_file = os.path.join(dest_dir,fname)
+        with self.report.operation('read',fname,source.size(fname)):
+            header = read_header(fname,0,source)
+
+        updates = {}
+        if 'bunit' not in header:
+            updates['bunit'] = 'adu'
+        updates.update(header_updates or {})
+
+        with self.report.operation('write',fname) as op:
+            with source.open(fname) as src, open(dest_file,'wb') as dst:
+                fingerprint = copy_fingerprinted(src,dst,header,copy_buffer)
+            if self.isDuplicate(fingerprint,fname,image_type):
+                os.remove(dest_file)
+                return
+            if updates:
+                patch_header(dest_file,updates)
+            op['bytes'] = os.path.getsize(dest_file)
 
     def copyImageTypesExt(self,source):
 
@@ -426,14 +767,81 @@ class ImageCollection_Model():
         self.copyFiles(source_dir,dest_dir)
 
     def create_deviation(self,location,gainval,readnoiseval):
-        
-        for filename in os.listdir(location):
-            if filename.endswith(".fit"):
-                pathfilename = os.path.join(location,filename)
-                data = CCDData.read(pathfilename)
-                data_deviation = ccdproc.create_deviation(data,gain = gainval*u.electron/u.adu,readnoise = readnoiseval*u.electron)
-                gain_corrected = ccdproc.gain_correct(data_deviation, gain = gainval*u.electron/u.adu)
-                gain_corrected.write(pathfilename,overwrite=True)
+
+        def read(filename):
+            return self.readCCD(os.path.join(location,filename),filename)
+
+        def compute(filename,data):
+            return self.gainCorrect(data,gainval,readnoiseval,filename)
+
+        def write(filename,gain_corrected):
+            self.writeCCD(gain_corrected,os.path.join(location,filename),filename)
+
+        filenames = [filename for filename in os.listdir(location) if filename.endswith(".fit")]
+        FramePipeline(read,compute,write,self.prefetch_depth,self.write_depth,self.report).run(filenames)
+
+    def gainCorrect(self,data,gainval,readnoiseval,frame=None):
+        """Gain correct a frame in electrons, with its deviation in full uncertainty mode"""
+
+        with self.report.operation('compute',frame):
+            # only full mode keeps a per frame uncertainty, masters get theirs from combine
+            if self.uncertainty_mode == 'full':
+                data = ccdproc.create_deviation(data,gain = gainval*u.electron/u.adu,readnoise = readnoiseval*u.electron)
+            return ccdproc.gain_correct(data, gain = gainval*u.electron/u.adu)
+
+    def readCCD(self,path_file,frame=None):
+        """Read a CCDData frame, recording the read in the run report"""
+
+        with self.report.operation('read',frame,os.path.getsize(path_file)):
+            ccd = CCDData.read(path_file)
+        return self.toPrecision(ccd)
+
+    def readMaster(self,path_file):
+        """Read a master frame, or take it from the masters held in memory"""
+
+        if path_file in self.shared_frames:
+            return self.shared_frames[path_file]
+        return self.readCCD(path_file)
+
+    def keepUncertainty(self,master=False):
+        """Whether frames, or masters when master is True, carry an uncertainty"""
+
+        return keeps_uncertainty(self.uncertainty_mode,master)
+
+    def dropUncertainty(self,ccd):
+        """ccd without its uncertainty, sharing its data, mask and header"""
+
+        if ccd.uncertainty is None:
+            return ccd
+        return CCDData(ccd.data,mask=ccd.mask,meta=ccd.meta,unit=ccd.unit)
+
+    def recordProvenance(self,ccd,**values):
+        """Note what an on-demand uncertainty is rebuilt from in the header of ccd"""
+
+        if self.uncertainty_mode != 'on-demand':
+            return
+        ccd.header['uncmode'] = (self.uncertainty_mode,provenance_keys['uncmode'])
+        for key, value in values.items():
+            ccd.header[key] = (value,provenance_keys[key])
+
+    def toPrecision(self,ccd):
+        """Cast the data and uncertainty of ccd to the working precision"""
+
+        if self.dtype == np.float64:
+            return ccd
+        if ccd.data.dtype != self.dtype:
+            ccd.data = ccd.data.astype(self.dtype)
+        if ccd.uncertainty is not None and ccd.uncertainty.array.dtype != self.dtype:
+            ccd.uncertainty = ccd.uncertainty.__class__(ccd.uncertainty.array.astype(self.dtype))
+        return ccd
+
+    def writeCCD(self,ccd,path_file,frame=None):
+        """Write a CCDData frame, recording the write in the run report"""
+
+        self.toPrecision(ccd)
+        with self.report.operation('write',frame) as op:
+            ccd.write(path_file,overwrite=True)
+            op['bytes'] = os.path.getsize(path_file)
 
     def fileNames(self,ImageCollection,keys,include_path= False):
         names = ImageCollection.files_filtered(**keys,include_path= include_path)
@@ -444,8 +852,8 @@ class ImageCollection_Model():
             dest_dir = os.path.join(source_dir,f)
             if not os.path.exists(dest_dir):
                 os.makedirs(dest_dir)
-                for heads in ImageCollection.headers(save_location=dest_dir, filter=f, overwrite=True):
-                    pass
+                for fname in ImageCollection.files_filtered(filter=f):
+                    self.copyPatched(os.path.join(source_dir,fname),os.path.join(dest_dir,fname))
 
     def copyFiltersFname(self, source_dir, filters, update):
         for filt in filters:
@@ -453,78 +861,386 @@ class ImageCollection_Model():
             dest_dir = os.path.join(source_dir,filtdir)
             if not os.path.exists(dest_dir):
                 os.makedirs(dest_dir)
-                ImageCollection = ImageFileCollection(source_dir,keywords=self.keywords,glob_include='*'+filt+'.*')
-                for heads in ImageCollection.headers(save_location=dest_dir, overwrite=True):
-                    if update == 'True':
-                        heads[self.keywords[1]] = filt
-
-    def copyExposures(self,ImageCollection, source_dir, exposures):
-        for e in exposures:
-            dir_name = 'exp_' + str(e)
-            dest_dir = os.path.join(source_dir,dir_name)
-            if not os.path.exists(dest_dir):
-                os.makedirs(dest_dir)
-                for heads in ImageCollection.headers(save_location=dest_dir, exposure=e, overwrite=True):
-                    pass
+                ImageCollection = HeaderCollection(source_dir,keywords=self.keywords,glob_include='*'+filt+'.*',threads=self.worker_threads)
+                header_updates = {self.keywords[1]: filt} if update == 'True' else None
+                fnames = ImageCollection.summary['file'] if ImageCollection.summary is not None else []
+                for fname in fnames:
+                    self.copyPatched(os.path.join(source_dir,fname),os.path.join(dest_dir,fname),header_updates)
+
+    def copyPatched(self,src_file,dest_file,header_updates=None):
+        """Copy a frame byte for byte, then set header keywords in place"""
+
+        fname = os.path.basename(src_file)
+        with self.report.operation('write',fname) as op:
+            shutil.copyfile(src_file,dest_file)
+            if header_updates:
+                patch_header(dest_file,header_updates)
+            op['bytes'] = os.path.getsize(dest_file)
+
+    def createMasters(self,ImageCollection,Directory,Filename,Masterheader,combine_method,image_type=None,**details):
+        path_files = [os.path.join(ImageCollection.location,fname) for fname in ImageCollection.files]
+        if self.fetchLibraryMaster(path_files,Directory,Filename,Masterheader,combine_method,image_type):
+            return
+        master_list = self.masterFrames(path_files,combine_method)
+
+        self.combineMaster(master_list,Directory,Filename,Masterheader,combine_method)
+        self.storeLibraryMaster(path_files,Directory,Filename,Masterheader,combine_method,image_type,**details)
+
+    def masterParams(self,image_type,Masterheader,combine_method):
+        """Settings a master of image_type depends on besides its frames"""
+
+        clip = None
+        if self.filemods.get('sigma_clip',False):
+            clip = [self.filemods.get('sigma_clip_low',3.0),self.filemods.get('sigma_clip_high',3.0)]
+        filtersize = None
+        if self.medianfilter[image_type] == 'True':
+            filtersize = int(self.medianfiltersize[image_type])
+        return {'kind':master_kinds[image_type],
+                'method':'median' if combine_method else 'average',
+                'sigma_clip':clip,
+                'median_filter':filtersize,
+                'gain':float(self.ccd_details[0]),
+                'readnoise':float(self.ccd_details[1]),
+                'precision':np.dtype(self.dtype).name,
+                'uncertainty':self.uncertainty_mode,
+                'header':Masterheader if self.updatefitslist[4] == 'True' else None}
+
+    def libraryKey(self,path_files,params):
+        """Library key of the master of path_files, None when a frame was not fingerprinted at ingest"""
+
+        fingerprints = [self.frame_fingerprints.get(os.path.basename(path_file)) for path_file in path_files]
+        if not fingerprints or None in fingerprints:
+            return None
+        return master_key(params,fingerprints)
+
+    def fetchLibraryMaster(self,path_files,Directory,Filename,Masterheader,combine_method,image_type):
+        """Copy the library master made from the same frames the same way, True when there is one"""
+
+        if self.library is None or image_type is None:
+            return False
+        key = self.libraryKey(path_files,self.masterParams(image_type,Masterheader,combine_method))
+        if key is None:
+            return False
+        m_file = os.path.join(Directory,Filename)
+        with self.report.operation('read',Filename) as op:
+            entry = self.library.fetch(key,m_file)
+            if entry is not None:
+                op['bytes'] = os.path.getsize(m_file)
+        if entry is None:
+            return False
+        self.log.info('Reused library master %s from %s',key,entry.get('night'),frame=Filename)
+        return True
+
+    def storeLibraryMaster(self,path_files,Directory,Filename,Masterheader,combine_method,image_type,**details):
+        """Add a newly combined master to the library"""
+
+        if self.library is None or image_type is None:
+            return
+        params = self.masterParams(image_type,Masterheader,combine_method)
+        key = self.libraryKey(path_files,params)
+        if key is None:
+            self.log.debug('Not added to the library, frames without fingerprints',frame=Filename)
+            return
+        with self.report.operation('write',Filename) as op:
+            self.library.store(key,os.path.join(Directory,Filename),kind=params['kind'],params=params_key(params),
+                               night=str(self.paths['source_dir']),date=self.nightDate(),shape=self.frameShape(),
+                               frames=len(path_files),**details)
+            op['bytes'] = os.path.getsize(os.path.join(Directory,Filename))
+
+    def nearestLibraryMaster(self,image_type,Masterheader,combine_method,**match):
+        """(key, entry) of the compatible library master closest in time to this night, None when there is none"""
+
+        if self.library is None:
+            return None
+        found = self.library.nearest(master_kinds[image_type],self.masterParams(image_type,Masterheader,combine_method),
+                                     self.nightDate(),self.filemods.get('library_max_days',0),
+                                     shape=self.frameShape(),**match)
+        if found is None:
+            self.log.warning('No library %s master for this night',master_kinds[image_type])
+        return found
+
+    def copyLibraryMaster(self,key,entry,Filename):
+        """Copy a library master into the master directory for a night without the frames to make it"""
+
+        with self.report.operation('read',Filename) as op:
+            self.library.fetch(key,os.path.join(self.paths['master_dir'],Filename))
+            op['bytes'] = os.path.getsize(self.library.path(entry))
+        self.log.info('Library master %s from %s (%s) used for this night',key,entry.get('night'),entry.get('date'),frame=Filename)
+
+    def nightDate(self):
+        """Earliest DATE-OBS of the night, None when the frames have none"""
 
-    def createMasters(self,ImageCollection,Directory,Filename,Masterheader,combine_method):
-        master_list = []
-        fnames = ImageCollection.summary['file']
+        try:
+            column = self.table['date-obs']
+        except KeyError:
+            return None
+        dates = [str(value).strip() for value in column if value is not np.ma.masked and str(value).strip()]
+        return min(dates,default=None)
+
+    def frameShape(self):
+        """Largest frame of the night as [rows, columns]"""
+
+        try:
+            return [int(np.max(self.table['naxis2'])),int(np.max(self.table['naxis1']))]
+        except (KeyError, ValueError, TypeError):
+            return [0,0]
+
+    def createDarkMasters(self,ImageCollection,Directory,Masterheader,combine_method):
+        """Combine the darks of each exposure time into its own master, reading each dark once"""
+
+        groups = {}
+        table = ImageCollection.summary
+        for fname, exposure in zip(table['file'],table[self.keywords[3]]):
+            path_file = os.path.join(ImageCollection.location,fname)
+            groups.setdefault(float(exposure),[]).append(path_file)
+
+        for exposure in sorted(groups):
+            self.log.info('Create Master Dark %s',self.exposureName(exposure))
+            Filename = self.masterDarkName(exposure)
+            if self.fetchLibraryMaster(groups[exposure],Directory,Filename,Masterheader,combine_method,1):
+                continue
+            self.combineMaster(self.masterFrames(groups[exposure],combine_method),Directory,Filename,Masterheader,combine_method)
+            self.storeLibraryMaster(groups[exposure],Directory,Filename,Masterheader,combine_method,1,exposure=exposure)
+
+        return sorted(groups)
+
+    def masterFrames(self,path_files,combine_method):
+        """Frames to combine for each path, read ahead when they are loaded in memory"""
+
+        if combine_method and not self.chunk_combine:
+            return list(self.streamFrames(path_files))
+        return [self.masterFrame(path_file,os.path.basename(path_file),combine_method) for path_file in path_files]
+
+    def masterFrame(self,path_file,fname,combine_method):
+        """Frame to combine, its path when it is streamed or combine reads it in chunks"""
+
+        if not combine_method:
+            return path_file
+        if self.chunk_combine:
+            self.report.record('read',0.0,nbytes=os.path.getsize(path_file),frame=fname)
+            return path_file
+        return self.readCCD(path_file,fname)
+
+    def streamFrames(self,path_files):
+        """Read the frames to combine one at a time, passing on frames already in memory"""
+
+        if path_files and isinstance(path_files[0],CCDData):
+            yield from path_files
+            return
+        yield from prefetch(lambda path_file: self.readCCD(path_file,os.path.basename(path_file)),
+                            path_files,self.prefetch_depth,self.report)
+
+    def combineMaster(self,master_list,Directory,Filename,Masterheader,combine_method):
+
+        master = self.combineFrames(master_list,Masterheader,combine_method)
+        self.writeCCD(master,os.path.join(Directory,Filename))
+
+    def combineFrames(self,master_list,Masterheader,combine_method):
+        """Combine frames, or the paths of frames, into a master held in memory"""
 
         if combine_method:
             method = 'median'
         else:
             method = 'average'
 
-        for fname in fnames:
-            path_file = os.path.join(ImageCollection.location,fname)
-            ccd = CCDData.read(path_file)
-            master_list.append(ccd)
-        
-        master = ccdproc.combine(master_list, method=method)
+        clip = {}
+        if self.filemods.get('sigma_clip',False):
+            clip = {'sigma_clip':True,
+                    'sigma_clip_low_thresh':self.filemods.get('sigma_clip_low',3.0),
+                    'sigma_clip_high_thresh':self.filemods.get('sigma_clip_high',3.0)}
+
+        if method == 'average':
+            # running mean over frames read one at a time, two passes when clipping
+            master = stream_average(lambda: self.streamFrames(master_list),
+                                    sigma_clip=bool(clip),
+                                    sigma_low=self.filemods.get('sigma_clip_low',3.0),
+                                    sigma_high=self.filemods.get('sigma_clip_high',3.0),
+                                    dtype=self.dtype)
+        elif self.chunk_combine:
+            # let combine read the frames tile by tile within the memory budget
+            with self.report.operation('compute'):
+                master = ccdproc.combine(master_list, method=method, mem_limit=self.memory_budget, dtype=self.dtype, **clip)
+        else:
+            with self.report.operation('compute'):
+                master = ccdproc.combine(master_list, method=method, dtype=self.dtype, **clip)
 
-        m_file = os.path.join(Directory,Filename)
+        if not self.keepUncertainty(master=True):
+            master.uncertainty = None
 
         if self.updatefitslist[4] == 'True':
             master.header[self.keywords[0]] = Masterheader
 
-        master.write(m_file, overwrite=True)
+        return master
 
-    def removeBias(self,Bias_Directory,Master_Directory,Dest_Directory, BiasFilename, SourceFilename, DestFilename, MasterDescription):
+    def removeBias(self,Bias_Directory,Master_Directory,Dest_Directory, BiasFilename, SourceFilename, DestFilename, MasterDescription, frame=None, science=False):
+        if frame is None:
+            frame = SourceFilename
         master_file = os.path.join(Master_Directory,SourceFilename)
-        ccd = CCDData.read(master_file)
-        bias_file = os.path.join(Bias_Directory,BiasFilename)
-        master = CCDData.read(bias_file)
-        master_br = ccdproc.subtract_bias(ccd,master)
-        master_br.header[self.keywords[0]]= MasterDescription + ' Bias Sub'
+        ccd = self.readCCD(master_file,frame)
+        master_br = self.biasCorrect(ccd,Bias_Directory,BiasFilename,MasterDescription,frame,science)
 
         mbr_file = os.path.join(Dest_Directory,DestFilename)
 
-        master_br.write(mbr_file, overwrite=True)
+        self.writeCCD(master_br,mbr_file,frame)
+
+    def biasCorrect(self,ccd,Bias_Directory,BiasFilename,MasterDescription,frame=None,science=False):
+        """Subtract the master bias from ccd"""
 
-    def removeDark(self,Dark_Directory,Master_Directory,Dest_Directory, DarkFilename, SourceFilename, DestFilename, MasterDescription):
+        master = self.readMaster(os.path.join(Bias_Directory,BiasFilename))
+        if not self.keepUncertainty(master=not science):
+            ccd = self.dropUncertainty(ccd)
+            master = self.dropUncertainty(master)
+        with self.report.operation('compute',frame):
+            master_br = ccdproc.subtract_bias(ccd,master)
+        master_br.header[self.keywords[0]]= MasterDescription + ' Bias Sub'
+        if science:
+            self.recordProvenance(master_br,uncraw=frame,uncgain=float(self.ccd_details[0]),
+                                  uncrdns=float(self.ccd_details[1]),uncbias=BiasFilename)
+        return master_br
+
+    def removeDark(self,Dark_Directory,Master_Directory,Dest_Directory, DarkFilename, SourceFilename, DestFilename, MasterDescription, frame=None, science=False):
+        if frame is None:
+            frame = SourceFilename
         master_file = os.path.join(Master_Directory,SourceFilename)
-        ccd = CCDData.read(master_file)
-        dark_file = os.path.join(Dark_Directory,DarkFilename)
-        master = CCDData.read(dark_file)
-        master_brds = ccdproc.subtract_dark(ccd=ccd,master=master,exposure_time=self.keywords[3],exposure_unit=u.second,scale=True)
-        master_brds.header[self.keywords[0]]= MasterDescription + ' Dark Rem'
+        ccd = self.readCCD(master_file,frame)
+        master_brds = self.darkCorrect(ccd,Dark_Directory,DarkFilename,MasterDescription,frame,science)
         
         mbrds_file = os.path.join(Dest_Directory,DestFilename)
 
-        master_brds.write(mbrds_file, overwrite=True)
+        self.writeCCD(master_brds,mbrds_file,frame)
+
+    def darkCorrect(self,ccd,Dark_Directory,DarkFilename,MasterDescription,frame=None,science=False):
+        """Subtract the bias subtracted master dark, scaled to the exposure of ccd"""
 
-    def reduceFlat(self,Flat_Directory, Source_Directory, Destination_Directory, FlatFilename,SourceFilename, DestFilename):
+        master = self.scaledDark(Dark_Directory,DarkFilename,ccd.header[self.keywords[3]])
+        if not self.keepUncertainty(master=not science):
+            ccd = self.dropUncertainty(ccd)
+            master = self.dropUncertainty(master)
+        with self.report.operation('compute',frame):
+            master_brds = ccdproc.subtract_dark(ccd=ccd,master=master,exposure_time=self.keywords[3],exposure_unit=u.second,scale=False)
+        master_brds.header[self.keywords[0]]= MasterDescription + ' Dark Rem'
+        if science:
+            self.recordProvenance(master_brds,uncdark=master.meta['uncdark'],uncdscl=master.meta['uncdscl'])
+        return master_brds
+
+    def exposureName(self,exposure):
+        return '{:g}'.format(float(exposure))
+
+    def masterDarkName(self,exposure=None,bias_removed=False):
+        """Filename of the master dark, or of the master for one exposure"""
+
+        name = self.filemods['master_dark_name']
+        if isinstance(exposure,str):
+            name = name + '_' + exposure
+        elif exposure is not None:
+            name = name + '_' + self.exposureName(exposure)
+        if bias_removed:
+            if self.filemods['filename_mod_prefix']:
+                name = self.filemods['bias_removal_mod'] + name
+            else:
+                name = name + self.filemods['bias_removal_mod']
+        return name + '.fit'
+
+    def exposureDarks(self,Dark_Directory):
+        """Bias subtracted per exposure master darks in Dark_Directory, by exposure"""
+
+        key = ('exposures',Dark_Directory)
+        if key not in self.dark_cache:
+            darks = {}
+            pattern = self.masterDarkName('*',bias_removed=True)
+            for filename in fnmatch.filter(os.listdir(Dark_Directory),pattern):
+                try:
+                    exposure = fits.getheader(os.path.join(Dark_Directory,filename))[self.keywords[3]]
+                except (OSError, KeyError):
+                    continue
+                darks[float(exposure)] = filename
+            self.dark_cache[key] = darks
+        return self.dark_cache[key]
+
+    def scaledDark(self,Dark_Directory,DarkFilename,exposure):
+        """Bias subtracted dark for an exposure time, scaled once and cached
+
+        The per exposure master closest in exposure is used, unscaled when
+        the exposures match. Without per exposure masters DarkFilename is
+        scaled to the exposure as subtract_dark(scale=True) would.
+        """
+
+        key = (Dark_Directory,DarkFilename,exposure)
+        if key in self.dark_cache:
+            return self.dark_cache[key]
+
+        darks = self.exposureDarks(Dark_Directory)
+        closest = min(darks,key=lambda e: abs(e - exposure)) if darks else None
+        if closest is not None and closest == exposure:
+            self.log.debug('Matched dark for exposure %s',self.exposureName(exposure))
+            filename = darks[closest]
+            master = self.readMaster(os.path.join(Dark_Directory,filename))
+            # a view of the master, so the provenance noted below stays off a master held in memory
+            dark = CCDData(master.data,uncertainty=master.uncertainty,mask=master.mask,meta=master.meta.copy(),unit=master.unit)
+            scale = 1.0
+        else:
+            if closest is not None:
+                self.log.debug('Dark %s scaled for exposure %s',darks[closest],self.exposureName(exposure))
+                filename = darks[closest]
+            else:
+                filename = DarkFilename
+            master = self.readMaster(os.path.join(Dark_Directory,filename))
+            scale = float(exposure) / float(master.header[self.keywords[3]])
+            with self.report.operation('compute'):
+                dark = master.multiply((exposure * u.second) / (master.header[self.keywords[3]] * u.second))
+            dark.meta = master.meta.copy()
+            dark.meta[self.keywords[3]] = exposure
+            self.toPrecision(dark)
+        dark.meta['uncdark'] = filename
+        dark.meta['uncdscl'] = scale
+
+        self.dark_cache[key] = dark
+        return dark
+
+    def prepareFlat(self,Flat_Directory,FlatFilename,filterType):
+        """Normalise a master flat into an inverse flat for the filter"""
+
+        flat_file = os.path.join(Flat_Directory,FlatFilename)
+        master = self.readMaster(flat_file)
+        with self.report.operation('compute',FlatFilename):
+            inverse_flat = InverseFlat(master,self.filemods.get('flat_min_value',0),FlatFilename)
+        self.inverse_flats[filterType] = inverse_flat
+
+        if self.filemods.get('save_inverse_flat',False):
+            inverse_file = os.path.join(Flat_Directory,os.path.splitext(FlatFilename)[0] + '_inverse.fit')
+            with self.report.operation('write',FlatFilename) as op:
+                inverse_flat.write(inverse_file,master.header)
+                op['bytes'] = os.path.getsize(inverse_file)
+
+        return inverse_flat
+
+    def reduceFlat(self,Flat_Directory, Source_Directory, Destination_Directory, FlatFilename,SourceFilename, DestFilename, frame=None, filterType=None, science=True):
+        if frame is None:
+            frame = SourceFilename
         master_file = os.path.join(Source_Directory,SourceFilename)
-        ccd = CCDData.read(master_file)
-        flat_file = os.path.join(Flat_Directory, FlatFilename)
-        master = CCDData.read(flat_file)
-        master_red = ccdproc.flat_correct(ccd=ccd, flat=master)
-        master_red.header[self.keywords[0]] = self.imagelist[3]+' Reduced'
+        ccd = self.readCCD(master_file,frame)
+        master_red = self.flatCorrect(ccd,Flat_Directory,FlatFilename,frame,filterType,science)
         
         mbrds_file = os.path.join(Destination_Directory,DestFilename)
 
-        master_red.write(mbrds_file, overwrite=True)
+        self.writeCCD(master_red,mbrds_file,frame)
+
+    def flatCorrect(self,ccd,Flat_Directory,FlatFilename,frame=None,filterType=None,science=True):
+        """Flat correct ccd with the inverse flat of filterType"""
+
+        if filterType is None:
+            filterType = FlatFilename
+        inverse_flat = self.inverse_flats.get(filterType)
+        if inverse_flat is None:
+            inverse_flat = self.prepareFlat(Flat_Directory,FlatFilename,filterType)
+        if not self.keepUncertainty(master=not science):
+            ccd = self.dropUncertainty(ccd)
+        with self.report.operation('compute',frame):
+            master_red = inverse_flat.apply(ccd,uncertainty=self.keepUncertainty(master=not science))
+        master_red.header[self.keywords[0]] = self.imagelist[3]+' Reduced'
+        if science:
+            self.recordProvenance(master_red,uncflat=FlatFilename,uncfmin=self.filemods.get('flat_min_value',0))
+        return master_red
 
     def performreduction(self,settings,directorylist):
         """All steps to perform CCD reduction"""
@@ -532,19 +1248,19 @@ class ImageCollection_Model():
         self.settings = settings
         self.directorylist = directorylist
 
-        print('Create Directories')
+        self.log.info('Create Directories')
         self.status.set('Create Directories')
         
         self.createWorkingDirectories()
 
-        print('Copy Images')
+        self.log.info('Copy Images')
         self.copyImageTypes()
 
-        print('Create Collections')
-        bias_ic = ImageFileCollection(self.paths['bias_dir'], self.keywords)
+        self.log.info('Create Collections')
+        bias_ic = HeaderCollection(self.paths['bias_dir'], self.keywords, threads=self.worker_threads)
         bias_table = bias_ic.summary
 
-        flat_ic = ImageFileCollection(self.paths['flat_dir'], self.keywords)
+        flat_ic = HeaderCollection(self.paths['flat_dir'], self.keywords, threads=self.worker_threads)
         flat_table = flat_ic.summary
 
         # check and handle empty table ie no FITS files so collection empty
@@ -552,16 +1268,16 @@ class ImageCollection_Model():
         flat_filters = np.unique(flat_table[self.keywords[1]].data).tolist()
         flat_exposures = np.unique(flat_table[self.keywords[3]].data).tolist()
 
-        print('Flat Exposures')
+        self.log.info('Flat Exposures')
 
-        dark_ic = ImageFileCollection(self.paths['dark_dir'], self.keywords)
+        dark_ic = HeaderCollection(self.paths['dark_dir'], self.keywords, threads=self.worker_threads)
         dark_table = dark_ic.summary
 
         dark_exposures = np.unique(dark_table[self.keywords[3]].data).tolist()
 
-        print('Dark Exposures')
+        self.log.info('Dark Exposures')
         
-        science_ic = ImageFileCollection(self.paths['science_dir'], self.keywords)
+        science_ic = HeaderCollection(self.paths['science_dir'], self.keywords, threads=self.worker_threads)
         science_table = science_ic.summary
 
         # need to handle 'None Type' in table
@@ -569,12 +1285,9 @@ class ImageCollection_Model():
         science_objects = np.unique(science_table[self.keywords[4]].data).tolist()
         science_exposures = np.unique(science_table[self.keywords[3]].data).tolist()
 
-        print('Science Exposures')
+        self.log.info('Science Exposures')
 
-        print('Copy Exposures')
-        self.copyExposures(dark_ic,self.paths['dark_dir'],dark_exposures)
-
-        print('Copy Filters')
+        self.log.info('Copy Filters')
         if self.usefitsfilterlist[0] == 'True':
             self.copyFilters(flat_ic,self.paths['flat_dir'],flat_filters)
         else:
@@ -585,30 +1298,30 @@ class ImageCollection_Model():
         else:
             self.copyFiltersFname(self.paths['science_dir'],self.sciencefilterlist,self.updatefitsfilterlist[1])
 
-        print('Create Master Bias')
+        self.log.info('Create Master Bias')
         self.createMasters(bias_ic,self.paths['master_dir'],self.filemods['master_bias_name'] + '.fit',
                     self.filemods['master_bias_header_value'],self.filemods['median_combine_bias'])
 
-        print('Create Master Darks')
+        self.log.info('Create Master Darks')
         self.createMasters(dark_ic,self.paths['master_dir'],self.filemods['master_dark_name'] + '.fit',
                     self.filemods['master_dark_header_value'],self.filemods['median_combine_dark'])
 
-        print('Create Master Flatsx')
+        self.log.info('Create Master Flats')
         if self.usefitsfilterlist[0] == 'True':
             filternames = flat_filters
         else:
             filternames = self.flatfilterlist
 
         for filterType in filternames:
-            print('Create Master Flat ' + filterType)
+            self.log.info('Create Master Flat %s',filterType)
             masterFile = self.filemods['master_flat_name'] + '_' + filterType + '.fit'
             filter_dir = os.path.join(self.paths['flat_dir'],filterType)
             ImageCollection = ImageFileCollection(filter_dir)
             self.createMasters(ImageCollection,self.paths['master_dir'],masterFile,
                         self.filemods['master_flat_header_value'],self.filemods['median_combine_flat'])
 
-        print('Bias Removal')
-        print('Bias Removal from Dark')
+        self.log.info('Bias Removal')
+        self.log.info('Bias Removal from Dark')
         if self.filemods['filename_mod_prefix']:
             self.removeBias(self.paths['master_dir'],self.paths['master_dir'],self.paths['master_dir'],self.filemods['master_bias_name'] + '.fit',
                 self.filemods['master_dark_name'] + '.fit',self.filemods['bias_removal_mod'] + self.filemods['master_dark_name'] + '.fit',self.filemods['master_dark_header_value'])
@@ -616,9 +1329,9 @@ class ImageCollection_Model():
             self.removeBias(self.paths['master_dir'],self.paths['master_dir'],self.paths['master_dir'],self.filemods['master_bias_name'] + '.fit',
                 self.filemods['master_dark_name'] + '.fit',self.filemods['master_dark_name'] + self.filemods['bias_removal_mod'] +'.fit',self.filemods['master_dark_header_value'])
 
-        print('Bias Removal from Flats')
+        self.log.info('Bias Removal from Flats')
         for filterType in filternames:
-            print('Bias Removal from Flat ' + filterType)
+            self.log.info('Bias Removal from Flat %s',filterType)
             masterFile = self.filemods['master_flat_name'] + '_' + filterType + '.fit'
             if self.filemods['filename_mod_prefix']:
                 masterFilebr = self.filemods['bias_removal_mod'] + self.filemods['master_flat_name'] + '_' + filterType + '.fit'
@@ -628,9 +1341,9 @@ class ImageCollection_Model():
             self.removeBias(self.paths['master_dir'],self.paths['master_dir'],self.paths['master_dir'],self.filemods['master_bias_name'] + '.fit',
                 masterFile,masterFilebr,self.filemods['master_flat_header_value'])
 
-        print('Dark Removal from Flats')
+        self.log.info('Dark Removal from Flats')
         for filterType in filternames:
-            print('Dark Removal from Flat ' + filterType)
+            self.log.info('Dark Removal from Flat %s',filterType)
             if self.filemods['filename_mod_prefix']:
                 masterFilebr = self.filemods['bias_removal_mod'] + self.filemods['master_flat_name'] +'_' + filterType + '.fit'
                 masterFilebrds = self.filemods['dark_removal_mod'] + self.filemods['bias_removal_mod'] + self.filemods['master_flat_name'] +'_' + filterType + '.fit'
@@ -642,9 +1355,9 @@ class ImageCollection_Model():
                 self.removeDark(self.paths['master_dir'],self.paths['master_dir'],self.paths['master_dir'],self.filemods['master_dark_name'] + self.filemods['bias_removal_mod'] +'.fit',
                     masterFilebr,masterFilebrds,self.filemods['master_flat_header_value'])
                    
-        print('Reduce Science File')
+        self.log.info('Reduce Science File')
 
-        print('Remove Bias & Dark')
+        self.log.info('Remove Bias & Dark')
         for fname in science_ic.files:
             fname_noext = os.path.splitext(fname)[0]
 
@@ -659,7 +1372,7 @@ class ImageCollection_Model():
                 self.removeDark(self.paths['master_dir'],self.paths['output_dir'],self.paths['output_dir'],self.filemods['master_dark_name'] + self.filemods['bias_removal_mod'] + '.fit',
                     fname_noext + self.filemods['bias_removal_mod'] +'.fit',fname_noext + self.filemods['bias_removal_mod'] + self.filemods['dark_removal_mod'] + '.fit',self.imagelist[3])
 
-        print('Flat Correction')
+        self.log.info('Flat Correction')
         for filterType in filternames:
 
             #need to do filenames by other than filter when not using fits header
@@ -675,7 +1388,7 @@ class ImageCollection_Model():
                 else:
                     self.reduceFlat(self.paths['master_dir'],self.paths['output_dir'],self.paths['output_dir'],self.filemods['master_flat_name'] + '_' + filterType + self.filemods['bias_removal_mod'] + self.filemods['dark_removal_mod'] + '.fit',fname_noext + self.filemods['bias_removal_mod'] + self.filemods['dark_removal_mod'] + '.fit',fname_noext + self.filemods['reduced_removal_mod'] + '.fit')
 
-        print('Reduction Complete')
+        self.log.info('Reduction Complete')
 
     def reductionSetupDir(self,settings,directorylist):
         """Settings required to perform CCD reduction"""
@@ -683,14 +1396,78 @@ class ImageCollection_Model():
         self.settings = settings
         self.directorylist = directorylist
 
+    def reductionCalibrate(self,settings,directorylist,steps=None,file_use='Combined',ext_directory=''):
+        """Create masters and calibrate the science frames, running the steps set in steps
+
+        steps maps each of calibration_steps to whether it runs, all of them
+        when None. file_use and ext_directory are the general settings of the
+        same names, for calibration frames or masters from another night.
+        """
+
+        steps = steps if steps is not None else {}
+        run = lambda step: steps.get(step,True)
+
+        self.reductionSetupDir(settings,directorylist)
+
+        self.reductionEstimateMemory()
+        self.reductionSetupWorkingStore()
+
+        if run('CreateDir'):
+            self.reductionCreateDirectories()
+
+        # copy all from same directory or calibration from External Directory
+        if run('CopyImages'):
+            self.spillWorkingStore()
+            self.reductionCopyImages()
+            if file_use == 'Calibration':
+                self.reductionCopyCalibrations(ext_directory)
+
+        self.reductionSetupCollections()
+
+        if run('CopyImages'):
+            self.spillWorkingStore()
+            self.reductionCopyFilters()
+
+        # create masters or copy from external directory
+        if run('CreateMasters'):
+            self.spillWorkingStore()
+            if file_use != 'Masters':
+                self.reductionCreateMasters()
+            else:
+                self.reductionCopyMasters(ext_directory)
+
+        if run('BiasRemoval'):
+            self.spillWorkingStore()
+            self.reductionBiasRemoval()
+        if run('DarkRemoval'):
+            self.spillWorkingStore()
+            self.reductionDarkRemoval()
+            self.reductionPrepareFlats()
+        if run('PerformReduction'):
+            self.spillWorkingStore()
+            self.reductionReduceScience()
+            self.reductionStackScience()
+
+    def precisionReference(self,config_model,working_dir,status=None):
+        """float64 model repeating this run in working_dir, with the directory list it calibrates into"""
+
+        reference_args, directorylist = config_model.collection_arguments(working_dir=working_dir)
+        reference_args['paths']['source_dir'] = self.paths['source_dir']
+        reference_args['filemods']['precision'] = 'float64'
+        reference_args['filemods']['trace_events'] = False
+
+        reference = ImageCollection_Model(status=status,**reference_args)
+        return reference, directorylist
+
+    @reportstep('Setup Collections')
     def reductionSetupCollections(self):
         """Set up Collections"""
 
-        print('Create Collections')
-        self.bias_ic = ImageFileCollection(self.paths['bias_dir'], self.keywords)
+        self.log.info('Create Collections')
+        self.bias_ic = HeaderCollection(self.paths['bias_dir'], self.keywords, threads=self.worker_threads)
         self.bias_table = self.bias_ic.summary
 
-        self.flat_ic = ImageFileCollection(self.paths['flat_dir'], self.keywords)
+        self.flat_ic = HeaderCollection(self.paths['flat_dir'], self.keywords, threads=self.worker_threads)
         self.flat_table = self.flat_ic.summary
 
         try:
@@ -702,7 +1479,7 @@ class ImageCollection_Model():
         except:
             self.flat_exposures = []
 
-        self.dark_ic = ImageFileCollection(self.paths['dark_dir'], self.keywords)
+        self.dark_ic = HeaderCollection(self.paths['dark_dir'], self.keywords, threads=self.worker_threads)
         self.dark_table = self.dark_ic.summary
 
         try:
@@ -710,38 +1487,154 @@ class ImageCollection_Model():
         except:
             self.dark_exposures = []
 
-        self.science_ic = ImageFileCollection(self.paths['science_dir'], self.keywords)
+        self.science_ic = HeaderCollection(self.paths['science_dir'], self.keywords, threads=self.worker_threads)
         self.science_table = self.science_ic.summary
 
-        self.science_filters = np.unique(self.science_table[self.keywords[1]].data).tolist()
-        self.science_objects = np.unique(self.science_table[self.keywords[4]].data).tolist()
-        self.science_exposures = np.unique(self.science_table[self.keywords[3]].data).tolist()
+        # every science frame may have been skipped as a repeat of another night
+        try:
+            self.science_filters = np.unique(self.science_table[self.keywords[1]].data).tolist()
+            self.science_objects = np.unique(self.science_table[self.keywords[4]].data).tolist()
+            self.science_exposures = np.unique(self.science_table[self.keywords[3]].data).tolist()
+        except:
+            self.science_filters = []
+            self.science_objects = []
+            self.science_exposures = []
+
+    def imageTypeCounts(self):
+        """Number of bias, dark and flat frames, the flats counted per filter"""
+
+        counts = {}
+        for image_type, index in (('bias',0),('dark',1),('flat',2)):
+            names = self.sourceFrames()[index]
+            counts[image_type] = len(names)
+
+            if image_type == 'flat' and len(names):
+                if self.usefitsfilterlist[0] == 'True':
+                    rows = [row for row in self.table if row['file'] in names]
+                    filters = [row[self.keywords[1]] for row in rows]
+                    counts[image_type] = max(filters.count(f) for f in set(filters))
+                else:
+                    per_filter = [len(fnmatch.filter(names,'*'+f+'.*')) for f in self.flatfilterlist]
+                    counts[image_type] = max(per_filter) if per_filter else len(names)
+        return counts
 
+    @reportstep('Memory Estimate')
+    def reductionEstimateMemory(self):
+        """Estimate peak memory per stage and check it against the budget"""
+
+        self.log.info('Memory Estimate')
+
+        try:
+            shape = (int(np.max(self.table['naxis2'])),int(np.max(self.table['naxis1'])))
+        except (KeyError, ValueError, TypeError):
+            return {}
+
+        methods = {}
+        for image_type in ('bias','dark','flat'):
+            methods[image_type] = 'median' if self.filemods.get('median_combine_' + image_type) else 'average'
+
+        estimate = MemoryEstimate(shape,self.imageTypeCounts(),methods)
+        stages = estimate.stages()
+        self.report.memory_estimate = {stage:value / 1e6 for stage, value in stages.items()}
+
+        if not self.memory_budget:
+            return stages
+
+        for stage, value in sorted(stages.items()):
+            if value <= self.memory_budget:
+                continue
+            if estimate.minimum(stage) > self.memory_budget:
+                error = MemoryBudgetError(stage,value,self.memory_budget)
+                self.status.set(str(error))
+                raise error
+            if stage == 'Create Masters':
+                self.chunk_combine = True
+                self.status.set('Create Masters: estimated {:.0f} MB exceeds budget of {:.0f} MB, combining in chunks'.format(
+                    value / 1e6,self.memory_budget / 1e6))
+                self.log.warning(self.status.get())
+
+        return stages
+
+    @reportstep('Working Store')
+    def reductionSetupWorkingStore(self):
+        """Keep the working directories in RAM when the night fits"""
+
+        mode = self.filemods.get('working_store','disk')
+        if mode != 'memory':
+            return self.working_store
+
+        self.log.info('Working Store')
+        shape = self.frameShape()
+        frames = self.sourceFrames()
+        required = working_bytes(shape,sum(len(names) for names in frames),len(frames[3]),
+                                 np.dtype(self.dtype).itemsize,self.keepUncertainty())
+        peak = max(self.report.memory_estimate.values(),default=0) * 1e6
+
+        self.working_store = WorkingStore(self.paths['working_dir'],mode,required,peak,self.memory_budget)
+        if not self.working_store.in_memory:
+            self.log.warning('Working store on disk: %s',self.working_store.reason)
+            return self.working_store
+
+        self.log.info('Working store in %s',self.working_store.location)
+        for key in ('working_dir','bias_dir','dark_dir','flat_dir','master_dir','science_dir','output_dir'):
+            self.paths[key] = self.working_store.path(self.paths[key])
+        self.directorylist = [self.working_store.path(directory) for directory in self.directorylist]
+        return self.working_store
+
+    def spillWorkingStore(self):
+        """Move a RAM working store to disk when the rest of the night no longer fits the free RAM
+
+        Called before each stage that writes to the working directories.
+        The paths, directory list and header collections of the night are
+        pointed at the disk copy; frames cached by their RAM path are read
+        again from disk.
+        """
+
+        location = self.working_store.spill()
+        if location is None:
+            return False
+
+        self.log.warning('Working store moved to disk: %s',self.working_store.reason)
+        for key in ('working_dir','bias_dir','dark_dir','flat_dir','master_dir','science_dir','output_dir'):
+            self.paths[key] = self.working_store.moved(self.paths[key],location)
+        self.directorylist = [self.working_store.moved(directory,location) for directory in self.directorylist]
+        for name in ('bias_ic','flat_ic','dark_ic','science_ic'):
+            collection = getattr(self,name,None)
+            if collection is not None:
+                collection.relocate(self.working_store.moved(collection.location,location))
+        return True
+
+    def releaseWorkingStore(self):
+        """Remove a RAM working store once its results have been copied out"""
+
+        self.working_store.release()
+
+    @reportstep('Create Directories')
     def reductionCreateDirectories(self):
         """Create Directories"""
 
-        print('Create Directories')        
+        self.log.info('Create Directories')        
         self.createWorkingDirectories()
 
+    @reportstep('Copy Images')
     def reductionCopyImages(self):
         """Copy Image Files"""
 
-        print('Copy Images')
+        self.log.info('Copy Images')
         self.copyImageTypes(self.ccd_details[0],self.ccd_details[1])
 
+    @reportstep('Copy Calibrations')
     def reductionCopyCalibrations(self,source):
         """Copy Calibration Files from External Directory"""
         
-        print('Copy External Calibrations')
+        self.log.info('Copy External Calibrations')
         self.copyImageTypesExt(source)
 
-    def reductionCopyExpFilt(self):
-        """Copy Exposures and Filters"""
+    @reportstep('Copy Filters')
+    def reductionCopyFilters(self):
+        """Copy Flat and Science Frames by Filter"""
 
-        print('Copy Exposures')
-        self.copyExposures(self.dark_ic,self.paths['dark_dir'],self.dark_exposures)
-
-        print('Copy Filters')
+        self.log.info('Copy Filters')
         if self.usefitsfilterlist[0] == 'True':
             self.copyFilters(self.flat_ic,self.paths['flat_dir'],self.flat_filters)
         else:
@@ -752,35 +1645,87 @@ class ImageCollection_Model():
         else:
             self.copyFiltersFname(self.paths['science_dir'],self.sciencefilterlist,self.updatefitsfilterlist[1])
 
+    @reportstep('Create Masters')
     def reductionCreateMasters(self):
         """Create Master Files"""
 
-        print('Create Master Bias')
-        self.createMasters(self.bias_ic,self.paths['master_dir'],self.filemods['master_bias_name'] + '.fit',
-                    self.filemods['master_bias_header_value'],self.filemods['median_combine_bias'])
+        if self.chunk_combine:
+            self.status.set('Create Masters (chunked to fit the memory budget)')
 
-        print('Create Master Darks')
-        self.createMasters(self.dark_ic,self.paths['master_dir'],self.filemods['master_dark_name'] + '.fit',
-                    self.filemods['master_dark_header_value'],self.filemods['median_combine_dark'])
+        self.log.info('Create Master Bias')
+        if self.bias_ic.files or not self.libraryBias():
+            self.createMasters(self.bias_ic,self.paths['master_dir'],self.filemods['master_bias_name'] + '.fit',
+                        self.filemods['master_bias_header_value'],self.filemods['median_combine_bias'],0)
+
+        self.log.info('Create Master Darks')
+        if self.dark_ic.files or not self.libraryDarks():
+            self.createDarkMasters(self.dark_ic,self.paths['master_dir'],
+                        self.filemods['master_dark_header_value'],self.filemods['median_combine_dark'])
 
-        print('Create Master Flats')
+        self.log.info('Create Master Flats')
         if self.usefitsfilterlist[0] == 'True':
             filternames = self.flat_filters
         else:
             filternames = self.flatfilterlist
 
         for filterType in filternames:
-            print('Create Master Flat ' + filterType)
+            self.log.info('Create Master Flat %s',filterType)
             masterFile = self.filemods['master_flat_name'] + '_' + filterType + '.fit'
             filter_dir = os.path.join(self.paths['flat_dir'],filterType)
             ImageCollection = ImageFileCollection(filter_dir)
+            if not ImageCollection.files and self.libraryFlat(filterType,masterFile):
+                continue
             self.createMasters(ImageCollection,self.paths['master_dir'],masterFile,
-                        self.filemods['master_flat_header_value'],self.filemods['median_combine_flat'])
-
+                        self.filemods['master_flat_header_value'],self.filemods['median_combine_flat'],2,filter=filterType)
+
+        # science filters without flats this night
+        if self.library is not None and self.usefitsfilterlist[0] == 'True':
+            for filterType in self.science_filters:
+                if filterType in self.flat_filters:
+                    continue
+                masterFile = self.filemods['master_flat_name'] + '_' + filterType + '.fit'
+                if self.libraryFlat(filterType,masterFile):
+                    self.flat_filters.append(filterType)
+
+    def libraryBias(self):
+        """Take the master bias from the library for a night without bias frames"""
+
+        found = self.nearestLibraryMaster(0,self.filemods['master_bias_header_value'],self.filemods['median_combine_bias'])
+        if found is None:
+            return False
+        self.copyLibraryMaster(*found,self.filemods['master_bias_name'] + '.fit')
+        return True
+
+    def libraryDarks(self):
+        """Take the master darks from the library for a night without dark frames
+
+        Every exposure is taken from the night of the nearest master dark so
+        the darks used together come from one night.
+        """
+
+        params = self.masterParams(1,self.filemods['master_dark_header_value'],self.filemods['median_combine_dark'])
+        found = self.nearestLibraryMaster(1,self.filemods['master_dark_header_value'],self.filemods['median_combine_dark'])
+        if found is None:
+            return False
+        for key, entry in self.library.matching('dark',params,shape=found[1]['shape'],night=found[1]['night']):
+            self.copyLibraryMaster(key,entry,self.masterDarkName(entry['exposure']))
+        return True
+
+    def libraryFlat(self,filterType,masterFile):
+        """Take the master flat for filterType from the library for a night without flats in it"""
+
+        found = self.nearestLibraryMaster(2,self.filemods['master_flat_header_value'],self.filemods['median_combine_flat'],
+                                          filter=filterType)
+        if found is None:
+            return False
+        self.copyLibraryMaster(*found,masterFile)
+        return True
+
+    @reportstep('Copy Masters')
     def reductionCopyMasters(self,source):
         """Copy Masters From External Directory"""
 
-        print('Copy External Masters')
+        self.log.info('Copy External Masters')
 
         temp = self.paths['master_dir']
 
@@ -788,7 +1733,7 @@ class ImageCollection_Model():
             shutil.rmtree(temp)
         shutil.copytree(source,temp)
 
-        self.flat_ic = ImageFileCollection(self.paths['master_dir'], self.keywords)
+        self.flat_ic = HeaderCollection(self.paths['master_dir'], self.keywords, threads=self.worker_threads)
         self.flat_table = self.flat_ic.summary
 
         try:
@@ -800,19 +1745,27 @@ class ImageCollection_Model():
         if self.flat_filters[0] is None:
             del self.flat_filters[0]
 
+    @reportstep('Bias Removal')
     def reductionBiasRemoval(self):
         """Perform Bias Removal"""
 
-        print('Bias Removal')
-        print('Bias Removal from Dark')
-        if self.filemods['filename_mod_prefix']:
+        self.log.info('Bias Removal')
+        self.log.info('Bias Removal from Dark')
+        if os.path.exists(os.path.join(self.paths['master_dir'],self.masterDarkName())):
             self.removeBias(self.paths['master_dir'],self.paths['master_dir'],self.paths['master_dir'],self.filemods['master_bias_name'] + '.fit',
-                self.filemods['master_dark_name'] + '.fit',self.filemods['bias_removal_mod'] + self.filemods['master_dark_name'] + '.fit',self.filemods['master_dark_header_value'])
-        else:
+                self.masterDarkName(),self.masterDarkName(bias_removed=True),self.filemods['master_dark_header_value'])
+
+        master_files = os.listdir(self.paths['master_dir'])
+        bias_removed = fnmatch.filter(master_files,self.masterDarkName('*',bias_removed=True))
+        for filename in sorted(fnmatch.filter(master_files,self.masterDarkName('*'))):
+            if filename in bias_removed:
+                continue
+            exposure = os.path.splitext(filename)[0][len(self.filemods['master_dark_name']) + 1:]
+            self.log.info('Bias Removal from Dark %s',exposure)
             self.removeBias(self.paths['master_dir'],self.paths['master_dir'],self.paths['master_dir'],self.filemods['master_bias_name'] + '.fit',
-                self.filemods['master_dark_name'] + '.fit',self.filemods['master_dark_name'] + self.filemods['bias_removal_mod'] +'.fit',self.filemods['master_dark_header_value'])
+                filename,self.masterDarkName(exposure,bias_removed=True),self.filemods['master_dark_header_value'])
 
-        print('Bias Removal from Flats')
+        self.log.info('Bias Removal from Flats')
 
         if self.usefitsfilterlist[0] == 'True':
             filternames = self.flat_filters
@@ -820,7 +1773,7 @@ class ImageCollection_Model():
             filternames = self.flatfilterlist
 
         for filterType in filternames:
-            print('Bias Removal from Flat ' + filterType)
+            self.log.info('Bias Removal from Flat %s',filterType)
             masterFile = self.filemods['master_flat_name'] + '_' + filterType + '.fit'
             if self.filemods['filename_mod_prefix']:
                 masterFilebr = self.filemods['bias_removal_mod'] + self.filemods['master_flat_name'] + '_' + filterType + '.fit'
@@ -830,10 +1783,11 @@ class ImageCollection_Model():
             self.removeBias(self.paths['master_dir'],self.paths['master_dir'],self.paths['master_dir'],self.filemods['master_bias_name'] + '.fit',
                 masterFile,masterFilebr,self.filemods['master_flat_header_value'])
 
+    @reportstep('Dark Removal')
     def reductionDarkRemoval(self):
         """Perform Dark Removal"""
 
-        print('Dark Removal from Flats')
+        self.log.info('Dark Removal from Flats')
 
         if self.usefitsfilterlist[0] == 'True':
             filternames = self.flat_filters
@@ -841,7 +1795,7 @@ class ImageCollection_Model():
             filternames = self.flatfilterlist
 
         for filterType in filternames:
-            print('Dark Removal from Flat ' + filterType)
+            self.log.info('Dark Removal from Flat %s',filterType)
             if self.filemods['filename_mod_prefix']:
                 masterFilebr = self.filemods['bias_removal_mod'] + self.filemods['master_flat_name'] +'_' + filterType + '.fit'
                 masterFilebrds = self.filemods['dark_removal_mod'] + self.filemods['bias_removal_mod'] + self.filemods['master_flat_name'] +'_' + filterType + '.fit'
@@ -853,85 +1807,424 @@ class ImageCollection_Model():
                 self.removeDark(self.paths['master_dir'],self.paths['master_dir'],self.paths['master_dir'],self.filemods['master_dark_name'] + self.filemods['bias_removal_mod'] +'.fit',
                     masterFilebr,masterFilebrds,self.filemods['master_flat_header_value'])
 
-    def reductionReduceScience(self):
-        """Perform Science Reduction"""
+    @reportstep('Prepare Flats')
+    def reductionPrepareFlats(self):
+        """Prepare normalised inverse master flats"""
 
-        print('Reduce Science File')
+        self.log.info('Prepare Flats')
 
-        print('Remove Bias & Dark')
-        for fname in self.science_ic.files:
-            fname_noext = os.path.splitext(fname)[0]
+        if self.usefitsfilterlist[0] == 'True':
+            filternames = self.flat_filters
+        else:
+            filternames = self.flatfilterlist
 
+        for filterType in filternames:
+            self.log.info('Prepare Flat %s',filterType)
             if self.filemods['filename_mod_prefix']:
-                self.removeBias(self.paths['master_dir'],self.paths['science_dir'],self.paths['output_dir'],self.filemods['master_bias_name'] + '.fit',
-                    fname,self.filemods['bias_removal_mod'] + fname_noext + '.fit',self.imagelist[3])
-                self.removeDark(self.paths['master_dir'],self.paths['output_dir'],self.paths['output_dir'],self.filemods['bias_removal_mod'] + self.filemods['master_dark_name'] + '.fit',
-                    self.filemods['bias_removal_mod'] + fname_noext + '.fit',self.filemods['dark_removal_mod'] + self.filemods['bias_removal_mod'] + fname_noext + '.fit',self.imagelist[3])
+                masterFilebrds = self.filemods['dark_removal_mod'] + self.filemods['bias_removal_mod'] + self.filemods['master_flat_name'] +'_' + filterType + '.fit'
             else:
-                self.removeBias(self.paths['master_dir'],self.paths['science_dir'],self.paths['output_dir'],self.filemods['master_bias_name'] + '.fit',
-                    fname,fname_noext + self.filemods['bias_removal_mod'] + '.fit',self.imagelist[3])
-                self.removeDark(self.paths['master_dir'],self.paths['output_dir'],self.paths['output_dir'],self.filemods['master_dark_name'] + self.filemods['bias_removal_mod'] + '.fit',
-                    fname_noext + self.filemods['bias_removal_mod'] +'.fit',fname_noext + self.filemods['bias_removal_mod'] + self.filemods['dark_removal_mod'] + '.fit',self.imagelist[3])
+                masterFilebrds = self.filemods['master_flat_name'] +'_' + filterType + self.filemods['bias_removal_mod'] + self.filemods['dark_removal_mod'] + '.fit'
+            self.prepareFlat(self.paths['master_dir'],masterFilebrds,filterType)
+
+    def scienceFilters(self):
+        """Filter of each science frame, from the filter directories"""
 
-        print('Flat Correction')
-        
         if self.usefitsfilterlist[1] == 'True':
             filternames = self.science_filters
         else:
             filternames = self.sciencefilterlist
 
+        filters = {}
         for filterType in filternames:
 
             #need to do filenames by other than filter when not using fits header
 
             filter_dir = os.path.join(self.paths['science_dir'],filterType)
-            ImageCollection = ImageFileCollection(filter_dir)
-
             try:
+                ImageCollection = ImageFileCollection(filter_dir)
                 for fname in ImageCollection.summary['file']:
-                    fname_noext = os.path.splitext(fname)[0]
+                    filters[fname] = filterType
+            except Exception:
+                self.log.warning('No science frames for filter %s',filterType)
+        return filters
 
-                    if self.filemods['filename_mod_prefix']:
-                        self.reduceFlat(self.paths['master_dir'],self.paths['output_dir'],self.paths['output_dir'],self.filemods['dark_removal_mod'] + self.filemods['bias_removal_mod'] + self.filemods['master_flat_name'] + '_' + filterType + '.fit',self.filemods['dark_removal_mod'] + self.filemods['bias_removal_mod'] + fname_noext + '.fit',self.filemods['reduced_removal_mod'] + fname_noext + '.fit')
-                    else:
-                        self.reduceFlat(self.paths['master_dir'],self.paths['output_dir'],self.paths['output_dir'],self.filemods['master_flat_name'] + '_' + filterType + self.filemods['bias_removal_mod'] + self.filemods['dark_removal_mod'] + '.fit',fname_noext + self.filemods['bias_removal_mod'] + self.filemods['dark_removal_mod'] + '.fit',fname_noext + self.filemods['reduced_removal_mod'] + '.fit')
-            except:
-                pass
+    def scienceFlatName(self,filterType):
+        """Bias and dark subtracted master flat for a filter"""
+
+        return self.masterFlatName(filterType,bias_removed=True,dark_removed=True)
 
-        print('Reduction Complete')
+    def masterFlatName(self,filterType,bias_removed=False,dark_removed=False):
+        """Filename of the master flat for a filter, after bias and dark removal when set"""
+
+        bias = self.filemods['bias_removal_mod'] if bias_removed else ''
+        dark = self.filemods['dark_removal_mod'] if dark_removed else ''
+        if self.filemods['filename_mod_prefix']:
+            return dark + bias + self.filemods['master_flat_name'] + '_' + filterType + '.fit'
+        return self.filemods['master_flat_name'] + '_' + filterType + bias + dark + '.fit'
+
+    def scienceNames(self,fname):
+        """Bias subtracted, dark subtracted and reduced filenames of a science frame"""
+
+        fname_noext = os.path.splitext(fname)[0]
+
+        if self.filemods['filename_mod_prefix']:
+            brFile = self.filemods['bias_removal_mod'] + fname_noext + '.fit'
+            brdsFile = self.filemods['dark_removal_mod'] + self.filemods['bias_removal_mod'] + fname_noext + '.fit'
+            redFile = self.filemods['reduced_removal_mod'] + fname_noext + '.fit'
+        else:
+            brFile = fname_noext + self.filemods['bias_removal_mod'] + '.fit'
+            brdsFile = fname_noext + self.filemods['bias_removal_mod'] + self.filemods['dark_removal_mod'] + '.fit'
+            redFile = fname_noext + self.filemods['reduced_removal_mod'] + '.fit'
+        return brFile, brdsFile, redFile
 
-    def reductionCopyResults(self,source,destination,working):
-        """Copy Results Files"""
+    def calibrateScience(self,fname,ccd,filterType=None):
+        """Bias, dark and flat correct a science frame in memory
 
-        print('Copy Results')
+        Returns the bias subtracted, dark subtracted and reduced frames with
+        the paths to write them to, each cast to the working precision as it
+        would be when written and read back.
+        """
+
+        brFile, brdsFile, redFile = self.scienceNames(fname)
+        outputs = []
+
+        master_br = self.biasCorrect(ccd,self.paths['master_dir'],self.filemods['master_bias_name'] + '.fit',
+            self.imagelist[3],fname,science=True)
+        outputs.append((self.toPrecision(master_br),os.path.join(self.paths['output_dir'],brFile)))
+
+        master_brds = self.darkCorrect(master_br,self.paths['master_dir'],self.masterDarkName(bias_removed=True),
+            self.imagelist[3],fname,science=True)
+        outputs.append((self.toPrecision(master_brds),os.path.join(self.paths['output_dir'],brdsFile)))
+
+        if filterType is not None:
+            try:
+                master_red = self.flatCorrect(master_brds,self.paths['master_dir'],self.scienceFlatName(filterType),
+                    fname,filterType)
+                outputs.append((self.toPrecision(master_red),os.path.join(self.paths['output_dir'],redFile)))
+            except Exception as e:
+                self.log.warning('Flat correction failed: %s',e,frame=fname)
+
+        if self.filemods.get('cosmic_ray_removal'):
+            self.cosmicRayClean(outputs[-1][0],fname)
+
+        return outputs
+
+    def cosmicRayClean(self,ccd,frame=None):
+        """Clean cosmic rays from the last calibrated frame in place, masking them
+
+        The frame is in electrons once gain corrected, so L.A.Cosmic takes a
+        gain of 1 and the configured read noise, and counts pixels above the
+        converter's full scale in electrons as saturated.
+        """
+
+        gain = 1.0 if ccd.unit == u.electron else self.ccd_details[0]
+        with self.report.operation('compute',frame):
+            cleaned, mask = clean_cosmic_rays(ccd.data,gain,self.ccd_details[1],
+                                              self.filemods['cosmic_ray_tile_size'],self.worker_threads,
+                                              sigclip=self.filemods['cosmic_ray_sigclip'],
+                                              satlevel=adc_saturation * self.ccd_details[0])
+        ccd.data = cleaned
+        ccd.mask = mask if ccd.mask is None else (ccd.mask | mask)
+        ccd.header['crclean'] = (int(mask.sum()),'Cosmic ray pixels cleaned')
+        self.log.debug('%d cosmic ray pixels cleaned',int(mask.sum()),frame=frame)
+        return ccd
+
+    def readScience(self,fname):
+        return self.readCCD(os.path.join(self.paths['science_dir'],fname),fname)
+
+    def writeOutputs(self,fname,outputs):
+        for ccd, path_file in outputs:
+            self.writeCCD(ccd,path_file,fname)
+        # the reduced frame stays in memory for stacking while there is room
+        if self.stack_cache is not None and os.path.basename(outputs[-1][1]) == self.scienceNames(fname)[2]:
+            self.stack_cache.keep(outputs[-1][1],outputs[-1][0])
+
+    def reduceScienceFrame(self,fname,filterType=None):
+        """Remove bias and dark from a science frame and flat correct it for filterType"""
+
+        ccd = self.readScience(fname)
+        self.writeOutputs(fname,self.calibrateScience(fname,ccd,filterType))
+
+    def workerState(self):
+        """Picklable settings a science worker process needs"""
+
+        return {name:getattr(self,name) for name in self.worker_attributes}
+
+    @classmethod
+    def scienceWorker(cls,state,frames,trace=False):
+        """Model for a worker process reducing science frames against shared masters"""
+
+        worker = cls.__new__(cls)
+        for name, value in state.items():
+            setattr(worker,name,value)
+        worker.report = RunReport(night=worker.paths['source_dir'],track_memory=False,
+                                  trace=TraceRecorder() if trace else None)
+        worker.log = worker.report.log
+        worker.worker_processes = 0
+        worker.prefetch_depth = 0
+        worker.write_depth = 1
+        worker.dark_cache = {}
+        worker.inverse_flats = {}
+        worker.shared_frames = {}
+        worker.stack_cache = None
+        for key, frame in frames.items():
+            if key[0] == 'dark':
+                worker.dark_cache[key[1:]] = frame
+            elif key[0] == 'flat':
+                worker.inverse_flats[key[1]] = frame
+            else:
+                worker.shared_frames[key[1]] = frame
+        return worker
+
+    def reduceScienceParallel(self,filters):
+        """Reduce science frames in worker processes sharing one copy of the masters"""
+
+        with SharedFrames() as shared:
+            bias_file = os.path.join(self.paths['master_dir'],self.filemods['master_bias_name'] + '.fit')
+            shared.publishCCD(('file',bias_file),self.readCCD(bias_file))
+            for key, dark in self.dark_cache.items():
+                if key[0] != 'exposures':
+                    shared.publishCCD(('dark',*key),dark)
+            for filterType in sorted(set(filters.values())):
+                inverse_flat = self.inverse_flats.get(filterType)
+                if inverse_flat is None:
+                    try:
+                        inverse_flat = self.prepareFlat(self.paths['master_dir'],self.scienceFlatName(filterType),filterType)
+                    except Exception as e:
+                        self.log.warning('No flat for filter %s: %s',filterType,e)
+                        continue
+                shared.publishInverseFlat(('flat',filterType),inverse_flat)
+
+            self.log.info('Shared %.1f MB of masters with %d worker processes',shared.nbytes / 1e6,self.worker_processes)
+
+            tasks = [(fname,filters.get(fname)) for fname in self.science_ic.files]
+            with ProcessPoolExecutor(max_workers=self.worker_processes,initializer=_init_science_worker,
+                                     initargs=(self.workerState(),shared.registry(),self.report.trace is not None)) as executor:
+                for result in executor.map(_reduce_science_frame,tasks):
+                    self.report.merge(result['step'])
+                    if self.report.trace is not None:
+                        self.report.trace.extend(result['events'],result['origin_epoch'])
+
+    @reportstep('Reduce Science')
+    def reductionReduceScience(self):
+        """Perform Science Reduction"""
+
+        self.log.info('Reduce Science File')
+
+        self.log.info('Scale Darks')
+        for exposure in self.science_exposures:
+            self.scaledDark(self.paths['master_dir'],self.masterDarkName(bias_removed=True),exposure)
+
+        filters = self.scienceFilters()
+
+        if self.filemods.get('stack_frames'):
+            self.stack_cache = FrameCache(self.memory_budget / 4 if self.memory_budget else default_cache_bytes)
+
+        if self.worker_processes > 1:
+            self.reduceScienceParallel(filters)
+        else:
+            bias_file = os.path.join(self.paths['master_dir'],self.filemods['master_bias_name'] + '.fit')
+            self.shared_frames[bias_file] = self.readCCD(bias_file)
+            pipeline = FramePipeline(self.readScience,
+                                     lambda fname, ccd: self.calibrateScience(fname,ccd,filters.get(fname)),
+                                     self.writeOutputs,self.prefetch_depth,self.write_depth,self.report)
+            pipeline.run(self.science_ic.files)
+            self.shared_frames = {}
+
+        self.dark_cache = {}
+
+        self.log.info('Reduction Complete')
+
+    def stackName(self,obj,filterType):
+        """Filename of the stack of an object in a filter"""
+
+        name = re.sub(r'[^A-Za-z0-9._+-]','_',str(obj).strip()) + '_' + filterType
+        if self.filemods['filename_mod_prefix']:
+            return self.filemods['stack_mod'] + name + '.fit'
+        return name + self.filemods['stack_mod'] + '.fit'
+
+    def stackGroups(self):
+        """Reduced science frames by object and filter"""
+
+        filters = self.scienceFilters()
+        objects = {}
+        if self.keywords[4] in self.science_table.colnames:
+            for row in self.science_table:
+                if not np.ma.is_masked(row[self.keywords[4]]) and str(row[self.keywords[4]]).strip():
+                    objects[row['file']] = str(row[self.keywords[4]]).strip()
+
+        groups = {}
+        for fname in self.science_ic.files:
+            path_file = os.path.join(self.paths['output_dir'],self.scienceNames(fname)[2])
+            if fname not in objects or fname not in filters:
+                self.log.warning('Not stacked, no object or filter',frame=fname)
+            elif not os.path.exists(path_file):
+                self.log.warning('Not stacked, no flat corrected frame',frame=fname)
+            else:
+                groups.setdefault((objects[fname],filters[fname]),[]).append(path_file)
+        return groups
+
+    def stackFrame(self,path_file,files):
+        """Data, mask, header and unit of a reduced frame, from memory or memory mapped from disk"""
+
+        ccd = self.stack_cache.get(path_file) if self.stack_cache is not None else None
+        if ccd is not None:
+            return ccd.data, ccd.mask, ccd.header, ccd.unit
+        hdulist = files.enter_context(fits.open(path_file,memmap=True))
+        header = hdulist[0].header
+        mask = hdulist['MASK'].data if 'MASK' in hdulist else None
+        return hdulist[0].data, mask, header, u.Unit(header.get('bunit','electron'))
+
+    def stackFrames(self,path_files,files):
+        """Align frames on the first and combine them a tile of rows at a time"""
+
+        factor = max(self.filemods.get('stack_downsample',4),1)
+        frames = [self.stackFrame(path_file,files) for path_file in path_files]
+        reference, reference_mask, header, unit = frames[0]
+
+        with self.report.operation('compute'):
+            reference_small = downsample(np.where(reference_mask,np.nan,reference) if reference_mask is not None else reference,factor)
+            offsets = [(0,0)]
+            for path_file, (data, mask, _, _) in zip(path_files[1:],frames[1:]):
+                offsets.append(frame_offset(reference,reference_small,np.where(mask,np.nan,data) if mask is not None else data,factor))
+                self.log.debug('Offset %d %d',*offsets[-1],frame=os.path.basename(path_file))
+
+        combined = np.empty(reference.shape,dtype=self.dtype)
+        count = np.zeros(reference.shape,dtype=np.int32)
+        rows = tile_rows(len(frames),reference.shape[1],self.memory_budget / 4 if self.memory_budget else default_tile_bytes)
+        for start in range(0,reference.shape[0],rows):
+            stop = min(start + rows,reference.shape[0])
+            with self.report.operation('compute'):
+                tile = [frame_rows(data,mask,dy,dx,start,stop) for (data, mask, _, _), (dy, dx) in zip(frames,offsets)]
+                combined[start:stop], count[start:stop] = combine_tile(tile,self.filemods.get('stack_median',False))
+
+        header = header.copy()
+        header[self.keywords[0]] = self.imagelist[3] + ' Stacked'
+        header['ncombine'] = (len(frames),'Frames stacked')
+        for path_file, (dy, dx) in zip(path_files,offsets):
+            header.add_history('Stacked {} moved by {} {}'.format(os.path.basename(path_file),dy,dx))
+        return CCDData(combined,mask=count == 0,meta=header,unit=unit)
+
+    @reportstep('Stack Science')
+    def reductionStackScience(self):
+        """Align and combine the reduced science frames of each object and filter"""
+
+        if not self.filemods.get('stack_frames'):
+            return
+
+        self.log.info('Stack Science')
+        for (obj, filterType), path_files in sorted(self.stackGroups().items()):
+            self.status.set('Stack {} {}'.format(obj,filterType))
+            name = self.stackName(obj,filterType)
+            with contextlib.ExitStack() as files:
+                stacked = self.stackFrames(path_files,files)
+                self.writeCCD(stacked,os.path.join(self.paths['output_dir'],name),name)
+            self.log.info('Stacked %d frames of %s in %s',len(path_files),obj,filterType)
+
+        self.stack_cache = None
+
+    @reportstep('Copy Results')
+    def reductionCopyResults(self,source,destination,working,move=False):
+        """Copy Results Files, moving them when the working files are deleted afterwards"""
+
+        self.log.info('Copy Results')
 
         temp = os.path.join(source,destination)
-        if os.path.isdir(temp):
-            shutil.rmtree(temp)
-        shutil.copytree(working,temp)
+        self.exportTree(working,temp,move)
 
-    def reductionCopyWorking(self,filemods,source,working,masters,masterworking):
-        """Copy Working Files"""
+    @reportstep('Copy Working')
+    def reductionCopyWorking(self,filemods,source,working,masters,masterworking,move=False):
+        """Copy Working Files, moving them when they are deleted afterwards"""
 
-        print('Copy Working')
+        self.log.info('Copy Working')
 
-        if filemods['save_working']:
-            temp = os.path.join(source, working)
-            if os.path.isdir(temp):
-                shutil.rmtree(temp)
-            shutil.copytree(working,temp)
-        
+        # the masters are inside the working tree, so export them before it can be moved
         if filemods['save_masters']:
             temp = os.path.join(source, masters)
-            if os.path.isdir(temp):
-                shutil.rmtree(temp)
-            shutil.copytree(masterworking,temp)
+            self.exportTree(masterworking,temp,move and not filemods['save_working'])
 
+        if filemods['save_working']:
+            temp = os.path.join(source, working)
+            self.exportTree(self.paths['working_dir'],temp,move)
+
+    def exportTree(self,source,destination,move=False):
+        """Export a directory tree, recording the bytes copied in the run report"""
+
+        with self.report.operation('write',os.path.basename(destination)) as op:
+            op['bytes'] = export_tree(source,destination,move,self.worker_threads,
+                                      self.filemods.get('export_verify','size'))
+            self.log.debug('%s %s to %s',source,'moved' if move else 'copied',destination)
+
+    @reportstep('Delete Directories')
     def reductionDeleteDirs(self,working):
         """Delete Directories"""
 
-        print('Delete Working')
+        self.log.info('Delete Working')
         if os.path.isdir(working):
             shutil.rmtree(working)
 
-
+    @reportstep('Validate Precision')
+    def reductionValidatePrecision(self,reference):
+        """Compare masters and results with those of a float64 reference run"""
+
+        self.log.info('Validate Precision')
+
+        deviations = {}
+        for directory in ('master_dir','output_dir'):
+            for filename in sorted(os.listdir(self.paths[directory])):
+                reference_file = os.path.join(reference.paths[directory],filename)
+                if not filename.endswith('.fit') or not os.path.exists(reference_file):
+                    continue
+                with fits.open(os.path.join(self.paths[directory],filename)) as hdul, fits.open(reference_file) as ref_hdul:
+                    data = hdul[0].data.astype(np.float64)
+                    ref_data = ref_hdul[0].data.astype(np.float64)
+                finite = np.isfinite(data) & np.isfinite(ref_data)
+                if not finite.any():
+                    continue
+                difference = np.abs(data[finite] - ref_data[finite])
+                scale = np.abs(ref_data[finite]).max()
+                deviations[filename] = {
+                    'max_abs':float(difference.max()),
+                    'max_rel':float(difference.max() / scale) if scale > 0 else 0.0,
+                }
+
+        self.report.precision_validation = deviations
+        if deviations:
+            worst = max(deviations,key=lambda name: deviations[name]['max_rel'])
+            self.log.info('Largest deviation from float64 %.3g (%.3g relative) in %s',
+                          deviations[worst]['max_abs'],deviations[worst]['max_rel'],worst)
+        return deviations
+
+    def reductionWriteReport(self,directory):
+        """Write the Run Report"""
+
+        self.log.info('Write Report')
+        if self.report.trace is not None:
+            self.report.trace.write(os.path.join(directory,'reduction_trace.json'))
+        return self.report.write(directory)
+
+
+# model of a science worker process, set by its pool initializer
+_science_worker = None
+
+
+def _init_science_worker(state,registry,trace=False):
+    """Pool initializer attaching the shared masters in a worker process"""
+
+    global _science_worker
+    _science_worker = ImageCollection_Model.scienceWorker(state,attach(registry),trace)
+
+
+def _reduce_science_frame(task):
+    """Reduce one science frame in a worker process"""
+
+    worker = _science_worker
+    fname, filterType = task
+    step = worker.report.collect('Reduce Science')
+    worker.reduceScienceFrame(fname,filterType)
+    trace = worker.report.trace
+    return {
+        'step':step,
+        'events':trace.drain() if trace is not None else [],
+        'origin_epoch':trace.origin_epoch if trace is not None else None,
+    }
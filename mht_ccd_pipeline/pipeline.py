@@ -0,0 +1,194 @@
+import queue
+import threading
+import time
+
+
+# marks the end of the items on a queue
+_finished = object()
+
+
+class StageError(Exception):
+    """Raised in the consuming thread when another stage of a pipeline failed"""
+
+
+class _Stages:
+    """Bounded queues between threads, with the time each stage spends blocked"""
+
+    poll = 0.1
+
+    def __init__(self,report=None):
+        self.report = report
+        self.stop = threading.Event()
+        self.errors = []
+
+    def stalled(self,stage,seconds):
+        if self.report is not None and seconds > 0:
+            self.report.stall(stage,seconds)
+
+    def put(self,stage,q,item):
+        """Put item on q, counting the time stage waits for space as a stall"""
+
+        start = time.perf_counter()
+        while not self.stop.is_set():
+            try:
+                q.put(item,timeout=self.poll)
+                break
+            except queue.Full:
+                continue
+        self.stalled(stage,time.perf_counter() - start)
+        if self.stop.is_set():
+            raise StageError('pipeline stopped')
+
+    def get(self,stage,q):
+        """Take an item from q, counting the time stage waits for one as a stall"""
+
+        start = time.perf_counter()
+        while True:
+            try:
+                item = q.get(timeout=self.poll)
+                break
+            except queue.Empty:
+                if self.stop.is_set():
+                    self.stalled(stage,time.perf_counter() - start)
+                    raise StageError('pipeline stopped')
+        self.stalled(stage,time.perf_counter() - start)
+        return item
+
+    def thread(self,name,target,*args):
+        """Start a daemon thread that stops the pipeline if target fails"""
+
+        def run():
+            try:
+                target(*args)
+            except StageError:
+                pass
+            except BaseException as e:
+                self.errors.append(e)
+                self.stop.set()
+
+        thread = threading.Thread(target=run,name=name,daemon=True)
+        thread.start()
+        return thread
+
+    def raise_error(self):
+        if self.errors:
+            raise self.errors[0]
+
+
+class FramePipeline:
+    """Overlap reading, computing and writing frames
+
+    A reader thread prefetches up to read_depth frames ahead of the compute
+    stage, which runs on the calling thread, and a writer thread flushes up
+    to write_depth results behind it, so the disk and the CPU are busy at
+    the same time. read(item) returns the input of compute(item,data), whose
+    result is passed to write(item,result) unless it is None. With a
+    RunReport the time each stage spends waiting on the others is added to
+    the current step as stalls: read waiting for a free prefetch slot,
+    compute waiting for input or for room to hand on its result, write
+    waiting for results. A read_depth of 0 runs the stages one after the
+    other on the calling thread.
+    """
+
+    def __init__(self,read,compute,write,read_depth=2,write_depth=2,report=None):
+        self.read = read
+        self.compute = compute
+        self.write = write
+        self.read_depth = max(int(read_depth),0)
+        self.write_depth = max(int(write_depth),1)
+        self.report = report
+
+    def run(self,items):
+        """Process every item, returning the number processed"""
+
+        if not self.read_depth:
+            count = 0
+            for item in items:
+                result = self.compute(item,self.read(item))
+                if result is not None:
+                    self.write(item,result)
+                count += 1
+            return count
+
+        stages = _Stages(self.report)
+        read_queue = queue.Queue(self.read_depth)
+        write_queue = queue.Queue(self.write_depth)
+
+        def reader():
+            for item in items:
+                if stages.stop.is_set():
+                    return
+                stages.put('read',read_queue,(item,self.read(item)))
+            stages.put('read',read_queue,_finished)
+
+        def writer():
+            while True:
+                entry = stages.get('write',write_queue)
+                if entry is _finished:
+                    return
+                self.write(*entry)
+
+        threads = [stages.thread('pipeline-reader',reader),stages.thread('pipeline-writer',writer)]
+        count = 0
+        try:
+            while True:
+                entry = stages.get('compute',read_queue)
+                if entry is _finished:
+                    break
+                item, data = entry
+                result = self.compute(item,data)
+                del data, entry
+                if result is not None:
+                    stages.put('compute',write_queue,(item,result))
+                count += 1
+            stages.put('compute',write_queue,_finished)
+        except StageError:
+            pass
+        except BaseException:
+            stages.stop.set()
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+        stages.raise_error()
+        return count
+
+
+def prefetch(read,items,depth=2,report=None):
+    """Yield read(item) for each item, reading up to depth items ahead on a thread
+
+    Stalls are recorded as for FramePipeline, read when the consumer is
+    behind and compute when it waits for a frame. A depth of 0 reads each
+    item when it is needed.
+    """
+
+    if not depth:
+        for item in items:
+            yield read(item)
+        return
+
+    stages = _Stages(report)
+    read_queue = queue.Queue(int(depth))
+
+    def reader():
+        for item in items:
+            if stages.stop.is_set():
+                return
+            stages.put('read',read_queue,read(item))
+        stages.put('read',read_queue,_finished)
+
+    thread = stages.thread('prefetch-reader',reader)
+    try:
+        while True:
+            try:
+                data = stages.get('compute',read_queue)
+            except StageError:
+                break
+            if data is _finished:
+                break
+            yield data
+            del data
+    finally:
+        stages.stop.set()
+        thread.join()
+    stages.raise_error()
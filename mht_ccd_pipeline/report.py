@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from .memory import MemorySampler
+from .logs import ReportLogger
+
+
+class RunReport:
+    """Timing and throughput record for a reduction run
+
+    Steps are the coarse reduction stages (Copy Images, Create Masters, ...).
+    Operations are the per-frame read, compute and write actions performed
+    while a step is active and are accumulated into that step. With
+    track_memory each step also records its tracemalloc peak and the peak
+    RSS sampled while it ran. Given a TraceRecorder, steps and operations
+    are also recorded as trace events.
+    """
+
+    operation_kinds = ('read', 'compute', 'write')
+
+    def __init__(self,night=None,track_memory=False,trace=None):
+        self.night = night
+        self.track_memory = track_memory
+        self.trace = trace
+        self.log = ReportLogger(self)
+        self.started = datetime.now().isoformat(timespec='seconds')
+        self.memory_estimate = {}
+        self.memory_budget = 0
+        self.precision_validation = {}
+        self.duplicates = []
+        self.steps = []
+        self._current = None
+        self._lock = threading.Lock()
+
+    def _new_step(self,name):
+        step = {
+            'step':name,
+            'night':self.night,
+            'wall':0.0,
+            'cpu':0.0,
+            'frames':0,
+            'bytes_read':0,
+            'bytes_written':0,
+            'operations':{},
+            'stalls':{},
+        }
+        step['_frames'] = set()
+        return step
+
+    def current_step(self):
+        step = self._current
+        return step['step'] if step is not None else None
+
+    @contextmanager
+    def step(self,name):
+        """Time a reduction step"""
+
+        step = self._new_step(name)
+        previous = self._current
+        self._current = step
+
+        sampler = None
+        if self.track_memory:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            elif hasattr(tracemalloc,'reset_peak'):
+                tracemalloc.reset_peak()
+            step['traced_start'] = tracemalloc.get_traced_memory()[0]
+            sampler = MemorySampler()
+            sampler.start()
+
+        self.log.debug('Started')
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield step
+        finally:
+            step['wall'] = time.perf_counter() - wall_start
+            step['cpu'] = time.process_time() - cpu_start
+            if sampler is not None:
+                step['traced_peak'] = tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+                step['rss_start'] = sampler.start_rss
+                step['rss_peak'] = sampler.stop()
+            step['frames'] = len(step.pop('_frames'))
+            step['fps'] = step['frames'] / step['wall'] if step['wall'] > 0 else 0.0
+            self.log.info('Finished %d frames',step['frames'],duration=step['wall'])
+            if self.trace is not None:
+                self.trace.complete(name,'step',wall_start,step['wall'],
+                                    {'night':self.night,'frames':step['frames'],'cpu':step['cpu']})
+            self._current = previous
+            with self._lock:
+                self.steps.append(step)
+
+    def stall(self,stage,seconds):
+        """Add time a pipeline stage spent waiting on another to the current step"""
+
+        step = self._current
+        if step is None:
+            return
+
+        with self._lock:
+            step['stalls'][stage] = step['stalls'].get(stage,0.0) + seconds
+
+    def collect(self,name):
+        """Start a step that only collects operations, for a worker process to return and merge"""
+
+        self._current = self._new_step(name)
+        return self._current
+
+    def merge(self,step):
+        """Add the operations, bytes and frames of a worker's step to the current step"""
+
+        current = self._current
+        if current is None:
+            return
+
+        with self._lock:
+            for kind, ops in step['operations'].items():
+                total = current['operations'].setdefault(kind,{'count':0,'wall':0.0,'cpu':0.0,'bytes':0})
+                for key in total:
+                    total[key] += ops[key]
+            current['bytes_read'] += step['bytes_read']
+            current['bytes_written'] += step['bytes_written']
+            current['_frames'].update(step['_frames'])
+            for stage, seconds in step['stalls'].items():
+                current['stalls'][stage] = current['stalls'].get(stage,0.0) + seconds
+
+    @contextmanager
+    def operation(self,kind,frame=None,nbytes=0):
+        """Time a single per-frame operation within the current step"""
+
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        op = {'bytes':nbytes}
+        try:
+            yield op
+        finally:
+            wall = time.perf_counter() - wall_start
+            self.record(kind,wall,time.thread_time() - cpu_start,op['bytes'],frame)
+            self.log.debug('%s %d bytes',kind,op['bytes'],frame=frame,duration=wall)
+            if self.trace is not None:
+                self.trace.complete(kind,'operation',wall_start,wall,
+                                    {'step':self.current_step(),'night':self.night,'frame':frame,'bytes':op['bytes']})
+
+    def record(self,kind,wall,cpu=0.0,nbytes=0,frame=None):
+        """Add an operation to the current step"""
+
+        step = self._current
+        if step is None:
+            return
+
+        with self._lock:
+            ops = step['operations'].setdefault(kind,{'count':0,'wall':0.0,'cpu':0.0,'bytes':0})
+            ops['count'] += 1
+            ops['wall'] += wall
+            ops['cpu'] += cpu
+            ops['bytes'] += nbytes
+
+            if kind == 'read':
+                step['bytes_read'] += nbytes
+            elif kind == 'write':
+                step['bytes_written'] += nbytes
+
+            if frame is not None:
+                step['_frames'].add(frame)
+
+    def timed(self,iterable,kind,frame=None):
+        """Yield from iterable, recording the time spent producing each item"""
+
+        iterator = iter(iterable)
+        while True:
+            with self.operation(kind,frame):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def duplicate(self,frame,image_type,first_night,first_frame,skipped):
+        """Record a frame whose data repeats one ingested before"""
+
+        with self._lock:
+            self.duplicates.append({
+                'frame':str(frame),
+                'image_type':image_type,
+                'night':self.night,
+                'duplicate_of':str(first_frame),
+                'duplicate_of_night':first_night,
+                'skipped':skipped,
+            })
+
+    def summary(self):
+        """One row per step for display"""
+
+        rows = []
+        for step in self.steps:
+            rows.append({
+                'Night':os.path.basename(str(step['night'])) if step['night'] else '',
+                'Step':step['step'],
+                'Wall':format(step['wall'],'.2f'),
+                'CPU':format(step['cpu'],'.2f'),
+                'Frames':step['frames'],
+                'Read MB':format(step['bytes_read'] / 1e6,'.1f'),
+                'Written MB':format(step['bytes_written'] / 1e6,'.1f'),
+                'FPS':format(step['fps'],'.2f'),
+                'Peak MB':format(step.get('rss_peak',0) / 1e6,'.0f'),
+                'Stalls':'/'.join(format(step['stalls'].get(stage,0.0),'.2f') for stage in self.operation_kinds),
+            })
+        return rows
+
+    def as_dict(self):
+        return {
+            'night':self.night,
+            'started':self.started,
+            'total_wall':sum(step['wall'] for step in self.steps),
+            'total_cpu':sum(step['cpu'] for step in self.steps),
+            'memory_budget':self.memory_budget,
+            'memory_estimate':self.memory_estimate,
+            'precision_validation':self.precision_validation,
+            'duplicates':self.duplicates,
+            'steps':self.steps,
+        }
+
+    def write(self,directory,filename='reduction_report.json'):
+        """Write the report as JSON into directory"""
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        report_file = os.path.join(directory,filename)
+        with open(report_file,'w',encoding='utf-8') as fh:
+            json.dump(self.as_dict(),fh,indent=2)
+        return report_file
+
+
+def reportstep(name):
+    """Decorator timing an ImageCollection_Model reduction step"""
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self,*args,**kwargs):
+            self.status.set(name)
+            with self.report.step(name):
+                return method(self,*args,**kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,143 @@
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+from astropy.io import fits
+from astropy import units as u
+from astropy.nddata import StdDevUncertainty
+from ccdproc import CCDData
+
+from .flats import InverseFlat
+
+
+def _release(blocks):
+    """Close and unlink shared memory blocks, ignoring ones already gone"""
+
+    for block in blocks:
+        try:
+            block.close()
+            block.unlink()
+        except FileNotFoundError:
+            pass
+    blocks.clear()
+
+
+class SharedFrames:
+    """Registry of master frames published once into shared memory
+
+    Each array of a CCDData or InverseFlat is copied into its own
+    multiprocessing.shared_memory block. registry() returns a small picklable
+    description of the blocks that worker processes pass to attach() to get
+    read-only NumPy views of the same memory instead of their own copies.
+    The blocks are unlinked by close(), when the registry is garbage
+    collected or at interpreter exit; if the process is killed, the
+    multiprocessing resource tracker unlinks them.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.blocks = []
+        self._finalizer = weakref.finalize(self,_release,self.blocks)
+
+    @property
+    def nbytes(self):
+        return sum(block.size for block in self.blocks)
+
+    def publishArray(self,array):
+        """Copy array into a new shared memory block and return its descriptor"""
+
+        if array is None:
+            return None
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True,size=max(array.nbytes,1))
+        self.blocks.append(block)
+        shared = np.ndarray(array.shape,dtype=array.dtype,buffer=block.buf)
+        shared[...] = array
+        return (block.name,array.shape,array.dtype.str)
+
+    def publishCCD(self,key,ccd):
+        """Publish the data, uncertainty and mask of a CCDData under key"""
+
+        uncertainty = ccd.uncertainty.array if ccd.uncertainty is not None else None
+        self.entries[key] = {
+            'kind':'ccd',
+            'data':self.publishArray(ccd.data),
+            'uncertainty':self.publishArray(uncertainty),
+            'mask':self.publishArray(ccd.mask),
+            'header':fits.Header(ccd.meta).tostring(),
+            'unit':ccd.unit.to_string() if ccd.unit is not None else None,
+        }
+
+    def publishInverseFlat(self,key,inverse_flat):
+        """Publish the arrays of an InverseFlat under key"""
+
+        self.entries[key] = {
+            'kind':'inverse_flat',
+            'inverse':self.publishArray(inverse_flat.inverse),
+            'relative':self.publishArray(inverse_flat.relative),
+            'mask':self.publishArray(inverse_flat.mask),
+            'mean':inverse_flat.mean,
+            'name':inverse_flat.name,
+            'unit':inverse_flat.unit.to_string() if inverse_flat.unit is not None else None,
+        }
+
+    def registry(self):
+        return dict(self.entries)
+
+    def close(self):
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+
+# blocks attached in this process, kept open while their views are in use
+_attached = []
+
+
+def attach_array(descriptor):
+    """Read-only view of a published array"""
+
+    if descriptor is None:
+        return None
+    name, shape, dtype = descriptor
+    # pool workers share the resource tracker of the publishing process, which
+    # stays responsible for unlinking the block
+    block = shared_memory.SharedMemory(name=name)
+    _attached.append(block)
+    array = np.ndarray(shape,dtype=np.dtype(dtype),buffer=block.buf)
+    array.flags.writeable = False
+    return array
+
+
+def attach(registry):
+    """Frames of a SharedFrames registry as CCDData and InverseFlat over shared memory"""
+
+    frames = {}
+    for key, entry in registry.items():
+        unit = u.Unit(entry['unit']) if entry['unit'] is not None else None
+        if entry['kind'] == 'ccd':
+            uncertainty = attach_array(entry['uncertainty'])
+            if uncertainty is not None:
+                uncertainty = StdDevUncertainty(uncertainty,copy=False)
+            frames[key] = CCDData(attach_array(entry['data']),
+                                  uncertainty=uncertainty,
+                                  mask=attach_array(entry['mask']),
+                                  meta=fits.Header.fromstring(entry['header']),
+                                  unit=unit)
+        else:
+            frames[key] = InverseFlat.fromArrays(attach_array(entry['inverse']),
+                                                 attach_array(entry['relative']),
+                                                 attach_array(entry['mask']),
+                                                 entry['mean'],unit,entry['name'])
+    return frames
+
+
+def detach():
+    """Close the blocks attached in this process"""
+
+    while _attached:
+        _attached.pop().close()
@@ -0,0 +1,138 @@
+import warnings
+import threading
+
+import numpy as np
+
+
+# bytes of reduced frames kept in memory for stacking when there is no memory budget
+default_cache_bytes = 1024 ** 3
+
+# bytes of frame rows held at once by a tiled combine when there is no memory budget
+default_tile_bytes = 256 * 1024 ** 2
+
+# side of the central region whose full resolution cross correlation refines an offset
+refine_size = 1024
+
+
+class FrameCache:
+    """Reduced frames kept in memory after they are written, up to a number of bytes
+
+    Frames beyond the limit are not kept and are read back from disk when
+    they are stacked.
+    """
+
+    def __init__(self,limit):
+        self.limit = limit
+        self.nbytes = 0
+        self.frames = {}
+        self.lock = threading.Lock()
+
+    def keep(self,path_file,ccd):
+        size = ccd.data.nbytes + (ccd.mask.nbytes if ccd.mask is not None else 0)
+        with self.lock:
+            if self.nbytes + size > self.limit:
+                return False
+            self.frames[path_file] = ccd
+            self.nbytes += size
+        return True
+
+    def get(self,path_file):
+        return self.frames.get(path_file)
+
+
+def downsample(data,factor):
+    """Block mean of data in factor x factor blocks, background subtracted and with no NaNs"""
+
+    data = np.asarray(data,dtype=np.float32)
+    if factor > 1:
+        rows = data.shape[0] // factor * factor
+        cols = data.shape[1] // factor * factor
+        data = data[:rows,:cols].reshape(rows // factor,factor,cols // factor,factor)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore',RuntimeWarning)
+            data = np.nanmean(data,axis=(1,3))
+    finite = np.isfinite(data)
+    if not finite.any():
+        return np.zeros(data.shape,dtype=np.float32)
+    return np.where(finite,data - np.median(data[finite]),0).astype(np.float32)
+
+
+def correlation_peak(reference,image):
+    """(dy, dx) that image must move by to line up with reference, from their FFT cross correlation
+
+    Both are zero padded to twice their size so the correlation does not
+    wrap.
+    """
+
+    shape = (2 * reference.shape[0],2 * reference.shape[1])
+    correlation = np.fft.irfft2(np.fft.rfft2(reference,shape) * np.conj(np.fft.rfft2(image,shape)),shape)
+    correlation = np.fft.fftshift(correlation)
+    centre = (shape[0] // 2,shape[1] // 2)
+    peak = np.unravel_index(np.argmax(correlation),correlation.shape)
+    return int(peak[0] - centre[0]), int(peak[1] - centre[1])
+
+
+def shifted_rows(data,dy,dx,start,stop):
+    """Rows start to stop of data moved by (dy, dx), NaN where data does not reach"""
+
+    rows = np.full((stop - start,data.shape[1]),np.nan,dtype=np.float32)
+    src_start, src_stop = max(start - dy,0), min(stop - dy,data.shape[0])
+    col_start, col_stop = max(-dx,0), min(data.shape[1] - dx,data.shape[1])
+    if src_stop > src_start and col_stop > col_start:
+        rows[src_start + dy - start:src_stop + dy - start,col_start + dx:col_stop + dx] = data[src_start:src_stop,col_start:col_stop]
+    return rows
+
+
+def frame_offset(reference,reference_small,data,factor):
+    """Integer (dy, dx) moving data onto reference
+
+    The offset is found by FFT cross correlation of the downsampled copies,
+    then refined at full resolution over a central region, trying each of
+    the offsets within factor pixels of it that downsampling cannot tell
+    apart.
+    """
+
+    dy, dx = correlation_peak(reference_small,downsample(data,factor))
+    dy, dx = dy * factor, dx * factor
+    if factor <= 1:
+        return dy, dx
+
+    size = max(min(refine_size,reference.shape[0] - 2 * factor,reference.shape[1] - 2 * factor),1)
+    top = (reference.shape[0] - size) // 2
+    left = (reference.shape[1] - size) // 2
+    centre = downsample(reference[top:top + size,left:left + size],1)
+    moved = downsample(shifted_rows(data,dy,dx,top - factor,top + size + factor)[:,left - factor:left + size + factor],1)
+
+    scores = {}
+    for fine_dy in range(-factor,factor + 1):
+        for fine_dx in range(-factor,factor + 1):
+            window = moved[factor - fine_dy:factor - fine_dy + size,factor - fine_dx:factor - fine_dx + size]
+            scores[(fine_dy,fine_dx)] = float(np.dot(centre.ravel(),window.ravel()))
+    fine_dy, fine_dx = max(scores,key=scores.get)
+    return dy + fine_dy, dx + fine_dx
+
+
+def frame_rows(data,mask,dy,dx,start,stop):
+    """Rows start to stop of a frame moved by (dy, dx), NaN where it is masked or does not reach"""
+
+    rows = shifted_rows(data,dy,dx,start,stop)
+    if mask is not None:
+        rows[shifted_rows(mask,dy,dx,start,stop) == 1] = np.nan
+    return rows
+
+
+def tile_rows(frames,width,tile_bytes):
+    """Rows per tile so a tile of every frame, as float32, fits in tile_bytes"""
+
+    return max(1,int(tile_bytes // max(frames * width * 4,1)))
+
+
+def combine_tile(rows,median=False):
+    """Combined rows and the number of frames covering each pixel"""
+
+    stack = np.stack(rows)
+    count = np.isfinite(stack).sum(axis=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore',RuntimeWarning)
+        combined = np.nanmedian(stack,axis=0) if median else np.nanmean(stack,axis=0)
+    return combined, count
@@ -0,0 +1,298 @@
+import io
+import os
+import abc
+import fnmatch
+import tarfile
+import threading
+import zipfile
+
+
+archive_extensions = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.zip')
+
+
+def is_archive(location):
+    return os.path.isfile(location) and location.lower().endswith(archive_extensions)
+
+
+def archive_stem(location):
+    """Name of an archive without its archive extension"""
+
+    name = os.path.basename(location)
+    for extension in archive_extensions:
+        if name.lower().endswith(extension):
+            return name[:-len(extension)]
+    return name
+
+
+class Storage(abc.ABC):
+    """Flat store of frames addressed by name
+
+    Backends list, open and size the files of one night. Names are plain
+    file names with no directory part, as in an ImageFileCollection.
+    Storage covers the source frames of a night only; the working, master
+    and output directories are local directories, read and written with
+    os and astropy.io.fits, or placed in RAM by workstore.WorkingStore.
+    """
+
+    read_only = False
+
+    @abc.abstractmethod
+    def listdir(self):
+        """Names of the files of the night"""
+
+    @abc.abstractmethod
+    def open(self,name):
+        """Binary file object for name, seekable where the backend allows it"""
+
+    @abc.abstractmethod
+    def size(self,name):
+        """Size of file name in bytes"""
+
+    def exists(self,name):
+        return name in self.listdir()
+
+    def files(self,pattern='*'):
+        return sorted(fnmatch.filter(self.listdir(),pattern))
+
+    def read(self,name):
+        with self.open(name) as fh:
+            return fh.read()
+
+    def write(self,name,data):
+        raise PermissionError('{} is read only'.format(self))
+
+    @abc.abstractmethod
+    def outputDirectory(self):
+        """Local directory that results for this night are copied into"""
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+
+class LocalStorage(Storage):
+    """Files of a directory on the local filesystem"""
+
+    def __init__(self,root):
+        self.root = root
+
+    def __str__(self):
+        return self.root
+
+    def path(self,name):
+        return os.path.join(self.root,name)
+
+    def listdir(self):
+        return [name for name in os.listdir(self.root) if os.path.isfile(self.path(name))]
+
+    def exists(self,name):
+        return os.path.isfile(self.path(name))
+
+    def open(self,name):
+        return open(self.path(name),'rb')
+
+    def size(self,name):
+        return os.path.getsize(self.path(name))
+
+    def write(self,name,data):
+        with open(self.path(name),'wb') as fh:
+            fh.write(data)
+
+    def outputDirectory(self):
+        return self.root
+
+
+class _MemberFile(io.RawIOBase):
+    """Read-only window onto one member of an uncompressed tar file
+
+    Each member file has its own file handle, so members can be read from
+    several threads at once.
+    """
+
+    def __init__(self,path,offset,size):
+        self.fh = open(path,'rb')
+        self.offset = offset
+        self.length = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self,position,whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            position += self.position
+        elif whence == io.SEEK_END:
+            position += self.length
+        self.position = min(max(position,0),self.length)
+        return self.position
+
+    def readinto(self,buffer):
+        count = min(len(buffer),self.length - self.position)
+        if count <= 0:
+            return 0
+        self.fh.seek(self.offset + self.position)
+        data = self.fh.read(count)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def close(self):
+        self.fh.close()
+        super().close()
+
+
+class ArchiveStorage(Storage):
+    """Frames read in place from a tar or zip archive of a night
+
+    Members are indexed once when the archive is opened. Members of zip
+    files and of uncompressed tar files are read at random, only as much of
+    each as is asked for, so the header scan reads just the header blocks.
+    Compressed tarballs can only be read in order and each member is
+    decompressed whole when it is opened. prefix selects a directory inside
+    the archive; by default it is the single top level directory when every
+    member is inside one. The archive is never written to.
+    """
+
+    read_only = True
+
+    def __init__(self,path,prefix=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.members = {}
+        if path.lower().endswith('.zip'):
+            self.archive = zipfile.ZipFile(path)
+            entries = [(info.filename,info) for info in self.archive.infolist() if not info.is_dir()]
+            self.random_access = True
+        else:
+            self.archive = tarfile.open(path)
+            entries = [(info.name,info) for info in self.archive.getmembers() if info.isfile()]
+            self.random_access = isinstance(self.archive.fileobj,io.BufferedReader)
+
+        names = [name for name, info in entries]
+        if prefix is None:
+            tops = {name.split('/',1)[0] for name in names}
+            prefix = tops.pop() if len(tops) == 1 and all('/' in name for name in names) else ''
+        self.prefix = prefix.strip('/')
+        start = self.prefix + '/' if self.prefix else ''
+        for name, info in entries:
+            if name.startswith(start) and '/' not in name[len(start):]:
+                self.members[name[len(start):]] = info
+
+    def __str__(self):
+        return os.path.join(self.path,self.prefix) if self.prefix else self.path
+
+    def listdir(self):
+        return list(self.members)
+
+    def exists(self,name):
+        return name in self.members
+
+    def size(self,name):
+        info = self.members[name]
+        return info.file_size if isinstance(info,zipfile.ZipInfo) else info.size
+
+    def open(self,name):
+        info = self.members[name]
+        if isinstance(info,zipfile.ZipInfo):
+            return self.archive.open(info)
+        if self.random_access:
+            return io.BufferedReader(_MemberFile(self.path,info.offset_data,info.size))
+        with self.lock:
+            return io.BytesIO(self.archive.extractfile(info).read())
+
+    def outputDirectory(self):
+        """Directory beside the archive named after it, as extraction would give"""
+
+        directory = os.path.join(os.path.dirname(os.path.abspath(self.path)),archive_stem(self.path))
+        if self.prefix:
+            directory = os.path.join(directory,self.prefix)
+        os.makedirs(directory,exist_ok=True)
+        return directory
+
+    def close(self):
+        self.archive.close()
+
+
+class MemoryStorage(Storage):
+    """Frames held as bytes in memory, for tests and scratch data
+
+    A night in memory has no directory of its own, so results are copied
+    into output_dir.
+    """
+
+    def __init__(self,files=None,name='memory',output_dir=None):
+        self.data = dict(files or {})
+        self.name = name
+        self.output_dir = output_dir
+        self.lock = threading.Lock()
+
+    def __str__(self):
+        return self.name
+
+    def listdir(self):
+        with self.lock:
+            return list(self.data)
+
+    def exists(self,name):
+        return name in self.data
+
+    def open(self,name):
+        return io.BytesIO(self.data[name])
+
+    def size(self,name):
+        return len(self.data[name])
+
+    def write(self,name,data):
+        with self.lock:
+            self.data[name] = bytes(data)
+
+    def outputDirectory(self):
+        if self.output_dir is None:
+            raise ValueError('no output directory given for {}'.format(self))
+        os.makedirs(self.output_dir,exist_ok=True)
+        return self.output_dir
+
+
+def open_storage(location):
+    """Storage for a night: a directory, an archive, or a directory inside an archive
+
+    'night.tar' and 'archive.zip/2023-01-05' both name archive nights.
+    """
+
+    if isinstance(location,Storage):
+        return location
+    if os.path.isdir(location):
+        return LocalStorage(location)
+    if is_archive(location):
+        return ArchiveStorage(location)
+
+    parent, inner = location, []
+    while parent and not os.path.exists(parent):
+        parent, tail = os.path.split(parent)
+        if not tail:
+            break
+        inner.insert(0,tail)
+    if is_archive(parent):
+        return ArchiveStorage(parent,'/'.join(inner))
+    return LocalStorage(location)
+
+
+def night_locations(location):
+    """Nights below location: its sub-directories and the archives in it"""
+
+    nights = []
+    for entry in os.scandir(location):
+        if entry.is_dir() or is_archive(entry.path):
+            nights.append(entry.name)
+    return nights
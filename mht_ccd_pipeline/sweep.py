@@ -0,0 +1,347 @@
+"""Reduce a night under several variants of a configuration, ingesting it once
+
+Each variant is a set of overrides of the configuration, given as
+'section.key' names or nested by section. From the command line, with the
+variants in a JSON file mapping variant names to their overrides:
+
+    python -m mht_ccd_pipeline.sweep config.ini variants.json sweep_dir
+
+    {"median": {"master_details.median_combine_flat": "True"},
+     "average": {"master_details.median_combine_flat": "False"}}
+
+Every variant's output and masters directories are written to
+sweep_dir/<name>, and sweep_report.json compares them with the first.
+"""
+
+import os
+import copy
+import json
+import shutil
+import argparse
+
+import numpy as np
+from astropy.io import fits
+from configobj import ConfigObj
+
+from . import models as m
+from .logs import setup_logging
+from .storage import LocalStorage, open_storage
+from .export import copy_tree, export_tree
+
+
+# stages of a reduction in order, with the steps each runs
+sweep_stages = (
+    ('ingest', ('reductionCreateDirectories','reductionCopyImages','reductionSetupCollections')),
+    ('filters', ('reductionCopyFilters',)),
+    ('masters', ('reductionCreateMasters',)),
+    ('calibrate', ('reductionBiasRemoval','reductionDarkRemoval','reductionPrepareFlats','reductionReduceScience',
+                   'reductionStackScience')),
+)
+
+# settings that change how a reduction runs but not what it produces
+run_settings = {
+    'directories': ('output_dir','working_dir','save_masters','save_working'),
+    'general_details': ('file_usage','ext_directory','memory_budget','memory_tracking','log_level',
+                        'trace_events','worker_threads','worker_processes','prefetch_depth',
+                        'write_depth','precision_validation','working_store','export_verify'),
+    'master_details': ('library_dir',),
+}
+
+# settings used from the filters stage on
+filter_settings = ('filename_text_filter','use_fits_filter','update_fits_filter')
+
+# master and science settings used from the calibrate stage on
+calibrate_settings = ('flat_min_value','save_inverse_flat','cosmic_ray_removal','cosmic_ray_sigclip',
+                      'cosmic_ray_tile_size')
+
+
+def setting_stage(section,key):
+    """Index of the first stage a setting changes the results of, None when it changes none"""
+
+    if key in run_settings.get(section,()):
+        return None
+    if section in ('flat_details','science_details') and key in filter_settings:
+        return 1
+    if section == 'master_details' and key not in calibrate_settings:
+        return 2
+    if section in ('master_details','reduction_details') or key in calibrate_settings:
+        return 3
+    return 0
+
+
+def stage_signature(config,stage):
+    """The settings that decide the results of the stages up to stage"""
+
+    signature = []
+    for section in config.sections:
+        for key, value in config[section].items():
+            index = setting_stage(section,key)
+            if index is not None and index <= stage:
+                signature.append((section,key,str(value)))
+    return tuple(sorted(signature))
+
+
+def apply_overrides(config,overrides):
+    """Set the overrides, as 'section.key' names or nested by section, in a ConfigObj"""
+
+    for name, value in overrides.items():
+        if isinstance(value,dict):
+            settings = [(name,key,item) for key, item in value.items()]
+        else:
+            section, _, key = name.partition('.')
+            settings = [(section,key,value)]
+        for section, key, item in settings:
+            if section not in config or key not in config[section]:
+                raise KeyError('Unknown setting {}.{}'.format(section,key))
+            config[section][key] = str(item)
+
+
+def frame_statistics(path):
+    """Median and robust noise of the primary data of a frame"""
+
+    data = fits.getdata(path).astype(float)
+    median = np.nanmedian(data)
+    return {'median':float(median),'noise':float(1.4826 * np.nanmedian(np.abs(data - median)))}
+
+
+def frame_difference(path,reference):
+    """Largest and RMS difference of the primary data of a frame from a reference frame"""
+
+    data = fits.getdata(path).astype(float)
+    base = fits.getdata(reference).astype(float)
+    if data.shape != base.shape:
+        return {'max_difference':None,'rms_difference':None}
+    difference = data - base
+    difference = difference[np.isfinite(difference)]
+    if not difference.size:
+        return {'max_difference':0.0,'rms_difference':0.0}
+    return {'max_difference':float(np.max(np.abs(difference))),
+            'rms_difference':float(np.sqrt(np.mean(difference ** 2)))}
+
+
+class Variant:
+    """One configuration of a sweep and the stages it ran in"""
+
+    def __init__(self,name,overrides,config_model):
+        self.name = name
+        self.overrides = overrides
+        self.config_model = copy.copy(config_model)
+        self.config_model.config = ConfigObj(config_model.config.dict())
+        apply_overrides(self.config_model.config,overrides)
+        self.signatures = [stage_signature(self.config_model.config,stage) for stage in range(len(sweep_stages))]
+        self.stages = {}
+
+
+class Sweep:
+    """Reduce one night under several variants of a configuration
+
+    The reduction is split into the stages of sweep_stages, and variants
+    whose settings agree up to a stage share that stage's run: the night
+    is ingested and classified once for every group of variants with the
+    same ingest settings, and the working tree is only copied where the
+    variants part. A tree is copied for each branch but the last, which
+    carries on in place, so a sweep over master settings copies the
+    ingested night once per extra variant instead of reading it again.
+    The header scan of the source is shared by every run, and an archived
+    night read by more than one ingest is extracted once.
+    """
+
+    def __init__(self,config_model,variants,sweep_dir,keep_stages=False,status=None):
+        self.config_model = config_model
+        self.sweep_dir = os.path.abspath(sweep_dir)
+        self.stages_dir = os.path.join(self.sweep_dir,'stages')
+        self.keep_stages = keep_stages
+        self.status = status if status is not None else m.Status()
+
+        if isinstance(variants,dict):
+            variants = list(variants.items())
+        self.variants = []
+        for index, variant in enumerate(variants):
+            name, overrides = variant if isinstance(variant,(tuple,list)) else ('variant_{}'.format(index),variant)
+            self.variants.append(Variant(name,overrides,config_model))
+        names = [variant.name for variant in self.variants]
+        if len(set(names)) != len(names):
+            raise ValueError('Variant names must be unique')
+
+        self.collections = {}
+        self.runs = []
+
+    def run(self):
+        """Run every variant and write the comparison report, returning its path"""
+
+        os.makedirs(self.stages_dir,exist_ok=True)
+        try:
+            self.stageSources()
+            self.runStage(self.variants,0,None)
+        finally:
+            for collection in self.collections.values():
+                collection.storage.close()
+        if not self.keep_stages:
+            shutil.rmtree(self.stages_dir)
+        return self.writeReport()
+
+    def stageSources(self):
+        """Extract each archived night that more than one ingest would read"""
+
+        sources = {}
+        for variant in self.variants:
+            sources.setdefault(variant.config_model.config['directories']['source_dir'],set()).add(variant.signatures[0])
+
+        for index, (source_dir, ingests) in enumerate(sorted(sources.items())):
+            if len(ingests) < 2:
+                continue
+            with open_storage(source_dir) as storage:
+                if isinstance(storage,LocalStorage):
+                    continue
+                staged_dir = os.path.join(self.stages_dir,'source_{}'.format(index))
+                os.makedirs(staged_dir,exist_ok=True)
+                for name in storage.files():
+                    with storage.open(name) as src, open(os.path.join(staged_dir,name),'wb') as dst:
+                        shutil.copyfileobj(src,dst)
+            for variant in self.variants:
+                if variant.config_model.config['directories']['source_dir'] == source_dir:
+                    variant.config_model.config['directories']['source_dir'] = staged_dir
+
+    def headerCollection(self,collection_args):
+        """Header scan of the source frames, made once for each source and set of keywords"""
+
+        source_dir = collection_args['paths']['source_dir']
+        key = (source_dir,tuple(collection_args['keywords']))
+        if key not in self.collections:
+            self.collections[key] = m.source_collection(source_dir,collection_args['keywords'],
+                                                        collection_args['filemods'].get('worker_threads',0))
+        return self.collections[key]
+
+    def runStage(self,variants,stage,parent_dir):
+        """Run stage for each group of variants that agree on it, then the stages after it"""
+
+        groups = {}
+        for variant in variants:
+            groups.setdefault(variant.signatures[stage],[]).append(variant)
+        groups = list(groups.values())
+
+        for index, group in enumerate(groups):
+            if parent_dir is not None and index == len(groups) - 1:
+                working_dir = parent_dir
+            else:
+                working_dir = os.path.join(self.stages_dir,'{}_{}'.format(sweep_stages[stage][0],len(self.runs)))
+                if parent_dir is not None:
+                    copy_tree(parent_dir,working_dir)
+            collection = self.runSteps(group,stage,working_dir)
+
+            if stage + 1 < len(sweep_stages):
+                self.runStage(group,stage + 1,working_dir)
+            else:
+                for variant in group:
+                    self.exportVariant(variant,collection)
+
+    def runSteps(self,group,stage,working_dir):
+        """Run the steps of stage in working_dir with the settings of group"""
+
+        variant = group[0]
+        collection_args, directorylist = variant.config_model.collection_arguments(working_dir=working_dir)
+        collection = m.ImageCollection_Model(status=self.status,header_collection=self.headerCollection(collection_args),
+                                             **collection_args)
+        collection.reductionSetupDir({},directorylist)
+        collection.reductionEstimateMemory()
+        if stage > 0:
+            collection.reductionSetupCollections()
+        for step in sweep_stages[stage][1]:
+            getattr(collection,step)()
+
+        run = {'stage':sweep_stages[stage][0],
+               'directory':working_dir,
+               'variants':[variant.name for variant in group],
+               'wall':collection.report.as_dict()['total_wall'],
+               'steps':collection.report.summary()}
+        self.runs.append(run)
+        for variant in group:
+            variant.stages[run['stage']] = len(self.runs) - 1
+        return collection
+
+    def variantDirectory(self,variant):
+        return os.path.join(self.sweep_dir,variant.name)
+
+    def exportVariant(self,variant,collection):
+        """Copy the output and masters of a variant into its own directory"""
+
+        directories = variant.config_model.config['directories']
+        for key in ('output_dir','master_dir'):
+            export_tree(collection.paths[key],os.path.join(self.variantDirectory(variant),directories[key]),
+                        threads=collection.worker_threads)
+
+    def compare(self):
+        """Statistics of each variant's output frames and their differences from the first variant"""
+
+        baseline = self.variants[0]
+        baseline_dir = os.path.join(self.variantDirectory(baseline),baseline.config_model.config['directories']['output_dir'])
+        results = []
+        for variant in self.variants:
+            output_dir = os.path.join(self.variantDirectory(variant),variant.config_model.config['directories']['output_dir'])
+            frames = {}
+            for fname in sorted(os.listdir(output_dir)):
+                if not fname.endswith('.fit'):
+                    continue
+                path = os.path.join(output_dir,fname)
+                frames[fname] = frame_statistics(path)
+                reference = os.path.join(baseline_dir,fname)
+                if variant is not baseline and os.path.exists(reference):
+                    frames[fname].update(frame_difference(path,reference))
+
+            differences = [frame['max_difference'] for frame in frames.values() if frame.get('max_difference') is not None]
+            rms = [frame['rms_difference'] for frame in frames.values() if frame.get('rms_difference') is not None]
+            results.append({
+                'name':variant.name,
+                'overrides':variant.overrides,
+                'directory':self.variantDirectory(variant),
+                'stages':{stage:self.runs[index]['directory'] for stage, index in variant.stages.items()},
+                'shared_stages':[stage for stage, index in variant.stages.items() if len(self.runs[index]['variants']) > 1],
+                'frames':frames,
+                'compared':len(differences),
+                'max_difference':max(differences,default=None),
+                'rms_difference':float(np.mean(rms)) if rms else None,
+            })
+        return results
+
+    def writeReport(self,filename='sweep_report.json'):
+        """Write the comparison report into the sweep directory"""
+
+        report = {'baseline':self.variants[0].name,
+                  'stages':[{key:value for key, value in run.items() if key != 'steps'} for run in self.runs],
+                  'variants':self.compare(),
+                  'steps':[dict(row,Stage=run['stage'],Variants=','.join(run['variants']))
+                           for run in self.runs for row in run['steps']]}
+        report_file = os.path.join(self.sweep_dir,filename)
+        with open(report_file,'w',encoding='utf-8') as fh:
+            json.dump(report,fh,indent=2)
+        return report_file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reduce a night under several variants of a configuration')
+    parser.add_argument('config', help='configuration file the variants start from')
+    parser.add_argument('variants', help='JSON file of variant names and their overrides')
+    parser.add_argument('sweep_dir', help='directory for the variants and the report')
+    parser.add_argument('--source', help='night to reduce, instead of source_dir of the configuration')
+    parser.add_argument('--keep-stages', action='store_true', help='keep the working trees of every stage')
+    args = parser.parse_args(argv)
+
+    config_model = m.Configuration_Model(args.config)
+    if args.source:
+        config_model.config['directories']['source_dir'] = args.source
+    setup_logging(config_model.config['general_details'].get('log_level','INFO'))
+
+    with open(args.variants,encoding='utf-8') as fh:
+        variants = json.load(fh)
+
+    report_file = Sweep(config_model,variants,args.sweep_dir,args.keep_stages).run()
+    with open(report_file,encoding='utf-8') as fh:
+        report = json.load(fh)
+    for variant in report['variants']:
+        print('{:20} shared {:30} max difference {}'.format(
+            variant['name'],','.join(variant['shared_stages']) or '-',variant['max_difference']))
+    print(report_file)
+
+
+if __name__ == '__main__':
+    main()
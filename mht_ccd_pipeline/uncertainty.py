@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+from astropy.io import fits
+from astropy.nddata import StdDevUncertainty
+from ccdproc import CCDData
+
+from .flats import InverseFlat
+from .medianfilter import median_filter
+
+
+uncertainty_modes = ['full', 'masters-only', 'none', 'on-demand']
+
+# header keywords written on reduced frames in on-demand mode
+provenance_keys = {
+    'uncmode':'Uncertainty mode of the reduction',
+    'uncraw':'Raw frame the reduced frame came from',
+    'uncgain':'CCD gain used (electron/adu)',
+    'uncrdns':'CCD readnoise used (electron)',
+    'uncbias':'Master bias subtracted',
+    'uncdark':'Master dark subtracted',
+    'uncdscl':'Exposure scale applied to the master dark',
+    'uncflat':'Master flat divided',
+    'uncfmin':'Minimum value applied to the master flat',
+}
+
+
+def keeps_uncertainty(mode,master=False):
+    """Whether frames, or masters when master is True, carry an uncertainty in mode"""
+
+    if mode == 'full':
+        return True
+    if mode in ('masters-only','on-demand'):
+        return master
+    return False
+
+
+def _master_deviation(path_file):
+    """Standard deviation array of a master, None when it was saved without one"""
+
+    with fits.open(path_file) as hdul:
+        if 'UNCERT' not in hdul:
+            return None
+        return np.asarray(hdul['UNCERT'].data,dtype=np.float64)
+
+
+def reconstruct_uncertainty(path_file,raw_directory,master_directory,threads=0):
+    """Rebuild the uncertainty of a frame reduced in on-demand mode
+
+    The reduced frame's header names the raw frame, the masters and the gain
+    and readnoise of the reduction. The raw frame's Poisson and readnoise
+    deviation is recomputed as ccdproc.create_deviation and gain_correct
+    would, the master uncertainties are added in quadrature as the bias and
+    dark subtraction would, and the result is flat corrected as
+    InverseFlat.apply would. Returns a StdDevUncertainty in electrons.
+    """
+
+    reduced = CCDData.read(path_file)
+    header = reduced.header
+    missing = [key for key in ('uncraw','uncgain','uncrdns') if key not in header]
+    if missing:
+        raise KeyError('{} has no on-demand uncertainty provenance ({})'.format(
+                            os.path.basename(path_file),', '.join(missing)))
+
+    data = fits.getdata(os.path.join(raw_directory,header['uncraw'])).astype(np.float64)
+    if header.get('medfilt'):
+        data = median_filter(data,header['medfilt'],threads)
+
+    with np.errstate(invalid='ignore'):
+        electrons = data * float(header['uncgain'])
+        electrons[electrons < 0] = np.nan
+        variance = electrons + float(header['uncrdns']) ** 2
+    del data, electrons
+
+    if header.get('uncbias'):
+        deviation = _master_deviation(os.path.join(master_directory,header['uncbias']))
+        if deviation is not None:
+            variance += deviation ** 2
+
+    if header.get('uncdark'):
+        deviation = _master_deviation(os.path.join(master_directory,header['uncdark']))
+        if deviation is not None:
+            variance += (deviation * float(header.get('uncdscl',1.0))) ** 2
+
+    if header.get('uncflat'):
+        flat = CCDData.read(os.path.join(master_directory,header['uncflat']))
+        inverse_flat = InverseFlat(flat,header.get('uncfmin',0),header['uncflat'])
+        variance *= np.asarray(inverse_flat.inverse,dtype=np.float64) ** 2
+        if inverse_flat.relative is not None:
+            variance += (np.asarray(reduced.data,dtype=np.float64) * inverse_flat.relative) ** 2
+
+    return StdDevUncertainty(np.sqrt(variance))
@@ -619,6 +619,84 @@ class CCDReductionForm(tk.Frame):
 
         redstepsframe.grid(row=1, column=0, sticky=tk.W + tk.E)
 
+        # Status
+        statusframe = tk.LabelFrame(self, 
+                                   text="Status",
+                                   bg="grey85",
+                                   padx=10,
+                                   pady=10
+                                   )
+
+        self.inputs['Status'] = w.LabelInput(
+                statusframe, "Current Step",
+                input_class=ttk.Label,
+                input_var=tk.StringVar(),
+                label_args={'style':'statusframe.TLabel'},
+                input_args={'style':'statusframe.TLabel'})
+        self.inputs['Status'].grid(row=0, column=0)
+
+        statusframe.grid(row=2, column=0, sticky=tk.W + tk.E)
+
+        # Run Report
+        reportframe = tk.LabelFrame(self, 
+                                   text="Run Report",
+                                   bg="grey85",
+                                   padx=10,
+                                   pady=10
+                                   )
+
+        self.report_column_defs = {
+            '#0':{'label':'ID','width':30},
+            'Night':{'label':'Night','width':100,'anchor':tk.W},
+            'Step':{'label':'Step','width':170,'anchor':tk.W},
+            'Wall':{'label':'Wall (s)','width':70,'anchor':tk.E},
+            'CPU':{'label':'CPU (s)','width':70,'anchor':tk.E},
+            'Frames':{'label':'Frames','width':60,'anchor':tk.E},
+            'Read MB':{'label':'Read MB','width':80,'anchor':tk.E},
+            'Written MB':{'label':'Written MB','width':80,'anchor':tk.E},
+            'FPS':{'label':'Frames/s','width':70,'anchor':tk.E},
+            'Peak MB':{'label':'Peak MB','width':70,'anchor':tk.E},
+            'Stalls':{'label':'Stall R/C/W (s)','width':120,'anchor':tk.E},
+           }
+
+        self.reportview = ttk.Treeview(
+            reportframe,
+            columns=list(self.report_column_defs.keys())[1:],
+            selectmode='none',
+            height=12
+        )
+        self.reportscrollbar = ttk.Scrollbar(
+            reportframe,
+            orient=tk.VERTICAL,
+            command=self.reportview.yview
+        )
+        self.reportview.configure(yscrollcommand=self.reportscrollbar.set)
+        self.reportview.configure(show='headings')
+        self.reportview.grid(row=0,column=0,sticky='NSEW')
+        self.reportscrollbar.grid(row=0,column=1,sticky='NSW')
+
+        for name, definition in self.report_column_defs.items():
+            label = definition.get('label','')
+            anchor = definition.get('anchor',self.default_anchor)
+            width = definition.get('width',self.default_width)
+
+            self.reportview.heading(name,text=label,anchor=anchor)
+            self.reportview.column(name,anchor=anchor,minwidth=self.default_minwidth,
+                                 width=width, stretch=False)
+
+        reportframe.grid(row=3, column=0, sticky=tk.W + tk.E)
+
+    def populate_report(self,rows):
+        """Clear the run report and write the supplied step rows to it."""
+
+        for row in self.reportview.get_children():
+            self.reportview.delete(row)
+
+        valuekeys = list(self.report_column_defs.keys())[1:]
+        for rownum, rowdata in enumerate(rows):
+            values = [rowdata[key] for key in valuekeys]
+            self.reportview.insert('','end',text=str(rownum),values=values)
+
 class DirectoriesConfigurationForm(tk.Frame):
     """The directories configuration form"""
     
@@ -842,6 +920,94 @@ class GeneralConfigurationForm(tk.Frame):
                 label_args={'style':'GeneralDetails.TLabel'})
         self.inputs['External Directory'].grid(row=3, column=1)
 
+        # Line 5
+        self.inputs['Memory Budget (MB)'] = w.LabelInput(
+                GeneralDetails, "Memory Budget (MB)",
+                field_spec=fields['memory_budget'],
+                label_args={'style':'GeneralDetails.TLabel'})
+        self.inputs['Memory Budget (MB)'].grid(row=4, column=0)
+
+        self.inputs['Memory Tracking'] = w.LabelInput(
+                GeneralDetails, "Memory Tracking",
+                field_spec=fields['memory_tracking'],
+                label_args={'style':'GeneralDetails.TLabel'},
+                input_args={'style':'GeneralDetails.TCheckbutton'})
+        self.inputs['Memory Tracking'].grid(row=4, column=1)
+
+        # Line 6
+        self.inputs['Log Level'] = w.LabelInput(
+                GeneralDetails, "Log Level",
+                field_spec=fields['log_level'],
+                label_args={'style':'GeneralDetails.TLabel'})
+        self.inputs['Log Level'].grid(row=5, column=0)
+
+        self.inputs['Trace Events'] = w.LabelInput(
+                GeneralDetails, "Trace Events",
+                field_spec=fields['trace_events'],
+                label_args={'style':'GeneralDetails.TLabel'},
+                input_args={'style':'GeneralDetails.TCheckbutton'})
+        self.inputs['Trace Events'].grid(row=5, column=1)
+
+        # Line 7
+        self.inputs['Worker Threads'] = w.LabelInput(
+                GeneralDetails, "Worker Threads",
+                field_spec=fields['worker_threads'],
+                label_args={'style':'GeneralDetails.TLabel'})
+        self.inputs['Worker Threads'].grid(row=6, column=0)
+
+        self.inputs['Precision'] = w.LabelInput(
+                GeneralDetails, "Precision",
+                field_spec=fields['precision'],
+                label_args={'style':'GeneralDetails.TLabel'})
+        self.inputs['Precision'].grid(row=6, column=1)
+
+        # Line 8
+        self.inputs['Precision Validation'] = w.LabelInput(
+                GeneralDetails, "Precision Validation",
+                field_spec=fields['precision_validation'],
+                label_args={'style':'GeneralDetails.TLabel'},
+                input_args={'style':'GeneralDetails.TCheckbutton'})
+        self.inputs['Precision Validation'].grid(row=7, column=0)
+
+        self.inputs['Uncertainty'] = w.LabelInput(
+                GeneralDetails, "Uncertainty",
+                field_spec=fields['uncertainty'],
+                label_args={'style':'GeneralDetails.TLabel'})
+        self.inputs['Uncertainty'].grid(row=7, column=1)
+
+        # Line 9
+        self.inputs['Worker Processes'] = w.LabelInput(
+                GeneralDetails, "Worker Processes",
+                field_spec=fields['worker_processes'],
+                label_args={'style':'GeneralDetails.TLabel'})
+        self.inputs['Worker Processes'].grid(row=8, column=0)
+
+        self.inputs['Prefetch Depth'] = w.LabelInput(
+                GeneralDetails, "Prefetch Depth",
+                field_spec=fields['prefetch_depth'],
+                label_args={'style':'GeneralDetails.TLabel'})
+        self.inputs['Prefetch Depth'].grid(row=8, column=1)
+
+        # Line 10
+        self.inputs['Write Queue Depth'] = w.LabelInput(
+                GeneralDetails, "Write Queue Depth",
+                field_spec=fields['write_depth'],
+                label_args={'style':'GeneralDetails.TLabel'})
+        self.inputs['Write Queue Depth'].grid(row=9, column=0)
+
+        self.inputs['Working Store'] = w.LabelInput(
+                GeneralDetails, "Working Store",
+                field_spec=fields['working_store'],
+                label_args={'style':'GeneralDetails.TLabel'})
+        self.inputs['Working Store'].grid(row=9, column=1)
+
+        # Line 11
+        self.inputs['Export Verify'] = w.LabelInput(
+                GeneralDetails, "Export Verify",
+                field_spec=fields['export_verify'],
+                label_args={'style':'GeneralDetails.TLabel'})
+        self.inputs['Export Verify'].grid(row=10, column=0)
+
         GeneralDetails.grid(row=0, column=0, sticky=tk.W + tk.E)
  
         self.reset()
@@ -873,6 +1039,19 @@ class GeneralConfigurationForm(tk.Frame):
         self.inputs['CCD Readnoise'].set(fields['ccd_readnoise'])
         self.inputs['File Use'].set(fields['file_usage'])
         self.inputs['External Directory'].set(fields['ext_directory'])
+        self.inputs['Memory Budget (MB)'].set(fields['memory_budget'])
+        self.inputs['Memory Tracking'].set(fields.as_bool('memory_tracking'))
+        self.inputs['Log Level'].set(fields['log_level'])
+        self.inputs['Trace Events'].set(fields.as_bool('trace_events'))
+        self.inputs['Worker Threads'].set(fields['worker_threads'])
+        self.inputs['Precision'].set(fields['precision'])
+        self.inputs['Precision Validation'].set(fields.as_bool('precision_validation'))
+        self.inputs['Uncertainty'].set(fields['uncertainty'])
+        self.inputs['Worker Processes'].set(fields['worker_processes'])
+        self.inputs['Prefetch Depth'].set(fields['prefetch_depth'])
+        self.inputs['Write Queue Depth'].set(fields['write_depth'])
+        self.inputs['Working Store'].set(fields['working_store'])
+        self.inputs['Export Verify'].set(fields['export_verify'])
 
     def save_form(self,fields):
         """ Save Form"""
@@ -885,6 +1064,19 @@ class GeneralConfigurationForm(tk.Frame):
         fields['ccd_readnoise'] = self.inputs['CCD Readnoise'].get()
         fields['file_usage'] = self.inputs['File Use'].get()
         fields['ext_directory'] = self.inputs['External Directory'].get()
+        fields['memory_budget'] = self.inputs['Memory Budget (MB)'].get()
+        fields['memory_tracking'] = self.inputs['Memory Tracking'].get()
+        fields['log_level'] = self.inputs['Log Level'].get()
+        fields['trace_events'] = self.inputs['Trace Events'].get()
+        fields['worker_threads'] = self.inputs['Worker Threads'].get()
+        fields['precision'] = self.inputs['Precision'].get()
+        fields['precision_validation'] = self.inputs['Precision Validation'].get()
+        fields['uncertainty'] = self.inputs['Uncertainty'].get()
+        fields['worker_processes'] = self.inputs['Worker Processes'].get()
+        fields['prefetch_depth'] = self.inputs['Prefetch Depth'].get()
+        fields['write_depth'] = self.inputs['Write Queue Depth'].get()
+        fields['working_store'] = self.inputs['Working Store'].get()
+        fields['export_verify'] = self.inputs['Export Verify'].get()
 
         return fields
 
@@ -1436,6 +1628,26 @@ class ScienceDetailsConfigurationForm(tk.Frame):
                 label_args={'style':'ScienceDetails.TLabel'})
         self.inputs['Median Filter Size'].grid(row=6, column=1)
 
+        #Line 8
+        self.inputs['Cosmic Ray Removal'] = w.LabelInput(
+                ScienceDetails, "Cosmic Ray Removal",
+                field_spec=fields['cosmic_ray_removal'],
+                label_args={'style':'ScienceDetails.TLabel'},
+                input_args={'style':'ScienceDetails.TCheckbutton'})
+        self.inputs['Cosmic Ray Removal'].grid(row=7, column=0, columnspan=1)
+
+        self.inputs['Cosmic Ray Sigma Clip'] = w.LabelInput(
+                ScienceDetails, "Sigma Clip",
+                field_spec=fields['cosmic_ray_sigclip'],
+                label_args={'style':'ScienceDetails.TLabel'})
+        self.inputs['Cosmic Ray Sigma Clip'].grid(row=7, column=1)
+
+        self.inputs['Cosmic Ray Tile Size'] = w.LabelInput(
+                ScienceDetails, "Tile Size",
+                field_spec=fields['cosmic_ray_tile_size'],
+                label_args={'style':'ScienceDetails.TLabel'})
+        self.inputs['Cosmic Ray Tile Size'].grid(row=7, column=2)
+
         ScienceDetails.grid(row=0, column=0, sticky=tk.W + tk.E)
  
         self.reset()
@@ -1468,6 +1680,9 @@ class ScienceDetailsConfigurationForm(tk.Frame):
         self.inputs['Update FITS Header Filter'].set(fields.as_bool('update_fits_filter'))
         self.inputs['Median Filter'].set(fields.as_bool('perform_median_filter'))
         self.inputs['Median Filter Size'].set(fields['median_filter_size'])
+        self.inputs['Cosmic Ray Removal'].set(fields.as_bool('cosmic_ray_removal'))
+        self.inputs['Cosmic Ray Sigma Clip'].set(fields['cosmic_ray_sigclip'])
+        self.inputs['Cosmic Ray Tile Size'].set(fields['cosmic_ray_tile_size'])
 
     def save_form(self,fields):
         """ Save Form"""
@@ -1481,6 +1696,9 @@ class ScienceDetailsConfigurationForm(tk.Frame):
         fields['update_fits_filter'] = self.inputs['Update FITS Header Filter'].get()
         fields['perform_median_filter'] = self.inputs['Median Filter'].get()
         fields['median_filter_size'] = self.inputs['Median Filter Size'].get()
+        fields['cosmic_ray_removal'] = self.inputs['Cosmic Ray Removal'].get()
+        fields['cosmic_ray_sigclip'] = self.inputs['Cosmic Ray Sigma Clip'].get()
+        fields['cosmic_ray_tile_size'] = self.inputs['Cosmic Ray Tile Size'].get()
 
         return fields
 
@@ -1578,6 +1796,52 @@ class MasterDetailsConfigurationForm(tk.Frame):
                 label_args={'style':'MasterDetails.TLabel'},
                 input_args={'style':'MasterDetails.TCheckbutton'})
         self.inputs['Update FITS Header'].grid(row=3, column=0, columnspan=1)
+
+        self.inputs['Flat Minimum Value'] = w.LabelInput(
+                MasterDetails, "Flat Minimum Value",
+                field_spec=fields['flat_min_value'],
+                label_args={'style':'MasterDetails.TLabel'})
+        self.inputs['Flat Minimum Value'].grid(row=3, column=1)
+
+        self.inputs['Save Inverse Flat'] = w.LabelInput(
+                MasterDetails, "Save Inverse Flat",
+                field_spec=fields['save_inverse_flat'],
+                label_args={'style':'MasterDetails.TLabel'},
+                input_args={'style':'MasterDetails.TCheckbutton'})
+        self.inputs['Save Inverse Flat'].grid(row=3, column=2)
+
+        # Line 5
+        self.inputs['Sigma Clip'] = w.LabelInput(
+                MasterDetails, "Sigma Clip",
+                field_spec=fields['sigma_clip'],
+                label_args={'style':'MasterDetails.TLabel'},
+                input_args={'style':'MasterDetails.TCheckbutton'})
+        self.inputs['Sigma Clip'].grid(row=4, column=0)
+
+        self.inputs['Sigma Clip Low'] = w.LabelInput(
+                MasterDetails, "Sigma Clip Low",
+                field_spec=fields['sigma_clip_low'],
+                label_args={'style':'MasterDetails.TLabel'})
+        self.inputs['Sigma Clip Low'].grid(row=4, column=1)
+
+        self.inputs['Sigma Clip High'] = w.LabelInput(
+                MasterDetails, "Sigma Clip High",
+                field_spec=fields['sigma_clip_high'],
+                label_args={'style':'MasterDetails.TLabel'})
+        self.inputs['Sigma Clip High'].grid(row=4, column=2)
+
+        # Line 6
+        self.inputs['Library Directory'] = w.LabelInput(
+                MasterDetails, "Library Directory",
+                field_spec=fields['library_dir'],
+                label_args={'style':'MasterDetails.TLabel'})
+        self.inputs['Library Directory'].grid(row=5, column=0)
+
+        self.inputs['Library Max Days'] = w.LabelInput(
+                MasterDetails, "Library Max Days",
+                field_spec=fields['library_max_days'],
+                label_args={'style':'MasterDetails.TLabel'})
+        self.inputs['Library Max Days'].grid(row=5, column=1)
         
         MasterDetails.grid(row=0, column=0, sticky=tk.W + tk.E)
  
@@ -1612,6 +1876,13 @@ class MasterDetailsConfigurationForm(tk.Frame):
         self.inputs['Median Combine Dark'].set(fields.as_bool('median_combine_dark'))
         self.inputs['Median Combine Flat'].set(fields.as_bool('median_combine_flat'))
         self.inputs['Update FITS Header'].set(fields.as_bool('update_fits'))
+        self.inputs['Flat Minimum Value'].set(fields['flat_min_value'])
+        self.inputs['Save Inverse Flat'].set(fields.as_bool('save_inverse_flat'))
+        self.inputs['Sigma Clip'].set(fields.as_bool('sigma_clip'))
+        self.inputs['Sigma Clip Low'].set(fields['sigma_clip_low'])
+        self.inputs['Sigma Clip High'].set(fields['sigma_clip_high'])
+        self.inputs['Library Directory'].set(fields['library_dir'])
+        self.inputs['Library Max Days'].set(fields['library_max_days'])
 
     def save_form(self,fields):
         """ Save Form"""
@@ -1626,6 +1897,13 @@ class MasterDetailsConfigurationForm(tk.Frame):
         fields['median_combine_dark'] = self.inputs['Median Combine Dark'].get()
         fields['median_combine_flat'] = self.inputs['Median Combine Flat'].get()
         fields['update_fits'] = self.inputs['Update FITS Header'].get()
+        fields['flat_min_value'] = self.inputs['Flat Minimum Value'].get()
+        fields['save_inverse_flat'] = self.inputs['Save Inverse Flat'].get()
+        fields['sigma_clip'] = self.inputs['Sigma Clip'].get()
+        fields['sigma_clip_low'] = self.inputs['Sigma Clip Low'].get()
+        fields['sigma_clip_high'] = self.inputs['Sigma Clip High'].get()
+        fields['library_dir'] = self.inputs['Library Directory'].get()
+        fields['library_max_days'] = self.inputs['Library Max Days'].get()
 
         return fields
 
@@ -1714,6 +1992,34 @@ class ReducedDetailsConfigurationForm(tk.Frame):
                                 'value':'False'})
         self.inputs['Filename Modifier Suffix'].grid(row=5, column=1, columnspan=1)
 
+        # Line 7
+        self.inputs['Stack Frames'] = w.LabelInput(
+                ReductionDetails, "Stack Frames",
+                field_spec=fields['stack_frames'],
+                label_args={'style':'ReductionDetails.TLabel'},
+                input_args={'style':'ReductionDetails.TCheckbutton'})
+        self.inputs['Stack Frames'].grid(row=6, column=0, columnspan=1)
+
+        self.inputs['Filename Stack Stub'] = w.LabelInput(
+                ReductionDetails, "Filename Stacked",
+                field_spec=fields['filename_stack_stub'],
+                label_args={'style':'ReductionDetails.TLabel'})
+        self.inputs['Filename Stack Stub'].grid(row=6, column=1)
+
+        # Line 8
+        self.inputs['Stack Median'] = w.LabelInput(
+                ReductionDetails, "Median Stack",
+                field_spec=fields['stack_median'],
+                label_args={'style':'ReductionDetails.TLabel'},
+                input_args={'style':'ReductionDetails.TCheckbutton'})
+        self.inputs['Stack Median'].grid(row=7, column=0, columnspan=1)
+
+        self.inputs['Stack Downsample'] = w.LabelInput(
+                ReductionDetails, "Alignment Downsample",
+                field_spec=fields['stack_downsample'],
+                label_args={'style':'ReductionDetails.TLabel'})
+        self.inputs['Stack Downsample'].grid(row=7, column=1)
+
         ReductionDetails.grid(row=0, column=0, sticky=tk.W + tk.E)
 
         self.reset()
@@ -1743,6 +2049,10 @@ class ReducedDetailsConfigurationForm(tk.Frame):
         self.inputs['Filename Reduced Stub'].set(fields['filename_reduced_stub'])
         self.inputs['Filename Stub Modifier'].set(fields['filename_prefix_suffix_modifier'])
         self.inputs['Filename Modifier Prefix'].set(fields['filename_stub_prefix'])
+        self.inputs['Stack Frames'].set(fields.as_bool('stack_frames'))
+        self.inputs['Filename Stack Stub'].set(fields['filename_stack_stub'])
+        self.inputs['Stack Median'].set(fields.as_bool('stack_median'))
+        self.inputs['Stack Downsample'].set(fields['stack_downsample'])
 
     def save_form(self,fields):
         """ Save Form"""
@@ -1753,6 +2063,10 @@ class ReducedDetailsConfigurationForm(tk.Frame):
         fields['filename_reduced_stub'] = self.inputs['Filename Reduced Stub'].get()
         fields['filename_prefix_suffix_modifier'] = self.inputs['Filename Stub Modifier'].get()
         fields['filename_stub_prefix'] = self.inputs['Filename Modifier Prefix'].get()
+        fields['stack_frames'] = self.inputs['Stack Frames'].get()
+        fields['filename_stack_stub'] = self.inputs['Filename Stack Stub'].get()
+        fields['stack_median'] = self.inputs['Stack Median'].get()
+        fields['stack_downsample'] = self.inputs['Stack Downsample'].get()
 
         return fields
 
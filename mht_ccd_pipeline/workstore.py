@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+
+
+working_stores = ['disk', 'memory']
+
+# RAM backed filesystems tried in turn for the memory working store
+ram_roots = ('/dev/shm', '/run/shm')
+
+# fraction of the free RAM filesystem a night may take
+ram_headroom = 0.8
+
+
+def ram_root():
+    """First writable RAM backed filesystem, None when the platform has none"""
+
+    for root in ram_roots:
+        if os.path.isdir(root) and os.access(root,os.W_OK):
+            return root
+    return None
+
+
+def ram_free(root):
+    """Bytes free on the filesystem of root"""
+
+    stats = os.statvfs(root)
+    return stats.f_bavail * stats.f_frsize
+
+
+def working_bytes(shape,frames,science,itemsize=8,uncertainty=True):
+    """Estimated bytes written to the working directory for a night
+
+    Every source frame is copied in and each science frame gives three
+    outputs (bias, dark and flat corrected), each a data array, an equally
+    sized uncertainty when one is kept and a one byte mask. A dozen frames
+    are allowed for masters.
+    """
+
+    pixel_bytes = itemsize * (2 if uncertainty else 1) + 1
+    return int(shape[0] * shape[1] * pixel_bytes * (frames + 3 * science + 12))
+
+
+def tree_bytes(directory):
+    """Bytes in the files below directory"""
+
+    total = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(root,name))
+            except OSError:
+                pass
+    return total
+
+
+class WorkingStore:
+    """Working directory of a night, held on a RAM filesystem when the night fits
+
+    In memory mode the working directories are made in a private directory
+    on a RAM backed filesystem such as /dev/shm, so intermediate frames never
+    reach the disk. The night spills to the configured disk working
+    directory when its estimated size, together with the peak memory of the
+    reduction, does not fit the memory budget or the free RAM. Before each
+    stage spill() checks the rest of the night still fits the RAM left free
+    and otherwise moves what has been written to the disk working directory.
+    path() maps a configured working path to where it is kept and release()
+    removes the RAM directory.
+    """
+
+    def __init__(self,working_dir,mode='disk',required=0,peak=0,budget=0,root=None):
+        self.working_dir = working_dir
+        self.mode = mode
+        self.required = required
+        self.location = working_dir
+        self.root = None
+        self.reason = None
+
+        if mode != 'memory':
+            return
+        root = root or ram_root()
+        if root is None:
+            self.reason = 'no RAM filesystem'
+            return
+        limit = ram_free(root) * ram_headroom
+        if budget:
+            limit = min(limit,budget - peak)
+        if required > limit:
+            self.reason = 'estimated {:.0f} MB exceeds {:.0f} MB available'.format(required / 1e6,max(limit,0) / 1e6)
+            return
+        self.root = root
+        self.location = tempfile.mkdtemp(prefix='mht_ccd_pipeline-',dir=root)
+
+    @property
+    def in_memory(self):
+        return self.location != self.working_dir
+
+    def path(self,path):
+        """Where a path inside the configured working directory is kept"""
+
+        if not self.in_memory:
+            return path
+        return os.path.join(self.location,os.path.relpath(path,self.working_dir))
+
+    def spill(self):
+        """Move a RAM store to the disk working directory when the rest of the night no longer fits
+
+        The bytes still to be written are the estimate less what the store
+        holds. Returns the RAM directory the store moved from, None when it
+        stays in RAM.
+        """
+
+        if not self.in_memory:
+            return None
+        remaining = max(self.required - tree_bytes(self.location),0)
+        free = ram_free(self.root) * ram_headroom
+        if remaining <= free:
+            return None
+
+        self.reason = 'remaining {:.0f} MB exceeds {:.0f} MB free in RAM'.format(remaining / 1e6,free / 1e6)
+        location = self.location
+        shutil.copytree(location,self.working_dir,dirs_exist_ok=True)
+        shutil.rmtree(location)
+        self.location = self.working_dir
+        return location
+
+    def moved(self,path,location):
+        """Where a path inside the RAM directory location is kept after a spill"""
+
+        return os.path.normpath(os.path.join(self.location,os.path.relpath(path,location)))
+
+    def release(self):
+        """Remove the RAM directory and everything left in it"""
+
+        if self.in_memory and os.path.isdir(self.location):
+            shutil.rmtree(self.location)
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+from astropy.io import fits
+
+from mht_ccd_pipeline import api
+from mht_ccd_pipeline import models as m
+from benchmarks.synthetic_night import SyntheticNight
+
+
+# configuration file the synthetic nights are written for
+config_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),'config.ini')
+
+
+@pytest.fixture(scope='session')
+def night(tmp_path_factory):
+    """Directory of a small synthetic night: bias, darks, B and V flats and science frames"""
+
+    source = str(tmp_path_factory.mktemp('night'))
+    SyntheticNight(config_file=config_file,shape=(64,64),seed=1).write(source)
+    return source
+
+
+@pytest.fixture
+def configure(night,tmp_path):
+    """Configuration_Model of the repository settings for the synthetic night, with overrides set"""
+
+    def configure(working_dir=None,**overrides):
+        settings = {'directories.source_dir':night,
+                    'directories.working_dir':working_dir or str(tmp_path / 'working'),
+                    'general_details.memory_tracking':False}
+        settings.update({name.replace('__','.'):value for name, value in overrides.items()})
+        return api.configuration(config_file,settings)
+    return configure
+
+
+@pytest.fixture
+def calibrate(configure):
+    """Calibrate the synthetic night with overrides and return the model"""
+
+    def calibrate(**overrides):
+        collection_args, directorylist = configure(**overrides).collection_arguments()
+        collection = m.ImageCollection_Model(status=api.Status(),**collection_args)
+        collection.reductionCalibrate({},directorylist)
+        return collection
+    return calibrate
+
+
+def tree(directory):
+    """Relative path and contents of every file below directory"""
+
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root,name)
+            with open(path,'rb') as fh:
+                files[os.path.relpath(path,directory)] = fh.read()
+    return files
+
+
+def compressed_night(night,directory,names):
+    """Copies of frames of the night tile compressed into .fz files"""
+
+    os.makedirs(directory)
+    for name in names:
+        with fits.open(os.path.join(night,name)) as hdul:
+            fits.HDUList([fits.PrimaryHDU(),fits.CompImageHDU(hdul[0].data,hdul[0].header)]).writeto(
+                    os.path.join(directory,name + '.fz'))
@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+from astropy.io import fits
+from ccdproc import CCDData
+
+from mht_ccd_pipeline import reduce_night
+from mht_ccd_pipeline.api import read_frame
+from mht_ccd_pipeline.storage import LocalStorage
+
+from conftest import config_file, compressed_night
+
+
+def test_reduce_night_matches_the_pipeline(calibrate,night):
+    collection = calibrate()
+    result = reduce_night(night,config_file)
+
+    assert sorted(result.masters) == sorted(os.listdir(collection.paths['master_dir']))
+    for name, ccd in result.masters.items():
+        assert np.array_equal(ccd.data,fits.getdata(os.path.join(collection.paths['master_dir'],name)),equal_nan=True)
+    reduced = sorted(name for name in os.listdir(collection.paths['output_dir']) if name.startswith('red_'))
+    assert sorted(result.science) == reduced
+    for name in reduced:
+        assert np.array_equal(result.science[name].data,fits.getdata(os.path.join(collection.paths['output_dir'],name)),
+                              equal_nan=True)
+
+
+def test_lazy_reduction_of_frames_in_memory(night,tmp_path):
+    storage = LocalStorage(night)
+    frames = {name:read_frame(storage,name) for name in storage.files()}
+    assert all(isinstance(ccd,CCDData) for ccd in frames.values())
+
+    result = reduce_night(frames,config_file,lazy=True,write_to=str(tmp_path / 'results'))
+    output_dir = os.path.join(str(tmp_path / 'results'),'output')
+    assert not os.listdir(output_dir)
+    names = [name for name, ccd in result.science]
+    assert names and sorted(os.listdir(output_dir)) == sorted(names)
+    assert sorted(os.listdir(os.path.join(str(tmp_path / 'results'),'masters'))) == sorted(result.masters)
+
+
+def test_reduce_night_of_compressed_frames(night,tmp_path):
+    source = str(tmp_path / 'compressed')
+    compressed_night(night,source,os.listdir(night))
+    plain = reduce_night(night,config_file)
+    result = reduce_night(source,config_file)
+
+    assert sorted(result.masters) == sorted(plain.masters)
+    for name, ccd in result.masters.items():
+        assert np.allclose(ccd.data,plain.masters[name].data,equal_nan=True)
+    assert len(result.science) == len(plain.science)
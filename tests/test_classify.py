@@ -0,0 +1,43 @@
+import fnmatch
+
+from ccdproc import ImageFileCollection
+
+from mht_ccd_pipeline.classify import FrameClassifier
+
+
+image_values = ['Bias Frame','Dark Frame','Flat Field','Light Frame']
+name_texts = ['Bias','Dark','SkyFlat','M33']
+
+
+def test_header_rules_match_files_filtered(night):
+    collection = ImageFileCollection(night,keywords=['imagetyp'])
+    frames = [(row['file'],row['imagetyp']) for row in collection.summary]
+    classified = FrameClassifier(image_values,name_texts,['True'] * 4).classify(frames)
+
+    for names, value in zip(classified,image_values):
+        assert sorted(names) == sorted(collection.files_filtered(imagetyp=value))
+    assert all(classified)
+
+
+def test_header_rules_ignore_case_and_missing_values():
+    classifier = FrameClassifier(image_values,name_texts,['True'] * 4)
+    frames = [('a.fit','BIAS FRAME'),('b.fit',None),('c.fit','Bias Frame 2')]
+    assert classifier.classify(frames) == [['a.fit'],[],[],[]]
+
+
+def test_filename_rules():
+    frames = [(name,None) for name in ('Bias-1.fit','Dark-1-30s.fit','SkyFlat-1-V.fit','M33-1-V.fit','NGC-1-V.fit')]
+    classifier = FrameClassifier(image_values,name_texts,['False'] * 4)
+    assert classifier.classify(frames) == [['Bias-1.fit'],['Dark-1-30s.fit'],['SkyFlat-1-V.fit'],['M33-1-V.fit']]
+
+
+def test_empty_science_text_takes_every_frame_that_is_not_a_calibration():
+    frames = [(name,None) for name in ('Bias-1.fit','Dark-1-30s.fit','SkyFlat-1-V.fit','M33-1-V.fit','NGC-1-V.fit')]
+    classifier = FrameClassifier(image_values,name_texts[:3] + [''],['False'] * 4)
+    assert classifier.classify(frames)[3] == ['M33-1-V.fit','NGC-1-V.fit']
+
+
+def test_name_patterns_match_as_fnmatch():
+    classifier = FrameClassifier(image_values,['Bias[12]','Dark','Flat','M33'],['False'] * 4)
+    names = ['Bias1-1.fit','Bias2-1.fit','Bias3-1.fit','Bias[12]-1.fit']
+    assert [name for name in names if classifier.nameMatches(0,name)] == fnmatch.filter(names,'*Bias[12]*')
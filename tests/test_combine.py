@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+import ccdproc
+from ccdproc import CCDData
+
+from mht_ccd_pipeline.combine import RunningMean, stream_average
+
+
+def frames(count=7,shape=(16,12),seed=3):
+    rng = np.random.default_rng(seed)
+    ccds = [CCDData(rng.normal(1000,20,shape),unit='adu',meta={'frame':index}) for index in range(count)]
+    # an outlier for sigma clipping to reject
+    ccds[2].data[4,5] = 5000
+    return ccds
+
+
+def test_running_mean_matches_numpy():
+    data = np.stack([ccd.data for ccd in frames()])
+    running = RunningMean()
+    for frame in data:
+        running.add(frame)
+    assert np.allclose(running.mean,data.mean(axis=0))
+    assert np.allclose(running.std(),data.std(axis=0))
+    assert (running.count == len(data)).all()
+
+
+def test_stream_average_matches_ccdproc_combine():
+    ccds = frames()
+    combined = stream_average(lambda: iter(ccds))
+    expected = ccdproc.combine(ccds,method='average')
+    assert np.allclose(combined.data,expected.data)
+    assert np.allclose(combined.uncertainty.array,expected.uncertainty.array)
+    assert combined.meta['frame'] == 0
+    assert combined.meta['NCOMBINE'] == len(ccds)
+    assert not combined.mask.any()
+
+
+def test_stream_average_sigma_clips_as_ccdproc_combine():
+    ccds = frames()
+    passes = []
+    combined = stream_average(lambda: passes.append(1) or iter(ccds),sigma_clip=True,sigma_low=2.0,sigma_high=2.0)
+    expected = ccdproc.combine(ccds,method='average',sigma_clip=True,
+                               sigma_clip_low_thresh=2.0,sigma_clip_high_thresh=2.0)
+    assert len(passes) == 2
+    assert np.allclose(combined.data,expected.data)
+    assert combined.data[4,5] < 1100
+
+
+def test_stream_average_of_no_frames_is_an_error():
+    with pytest.raises(ValueError):
+        stream_average(lambda: iter(()))
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from mht_ccd_pipeline import cosmicray
+
+
+def frame_with_cosmic_rays(seed=2):
+    rng = np.random.default_rng(seed)
+    data = rng.normal(1000.0,10.0,(96,96)).astype(np.float32)
+    hits = [(10,12),(40,70),(70,31),(63,64)]
+    for row, col in hits:
+        data[row,col] += 5000.0
+    return data, hits
+
+
+def test_tiled_cleaning_matches_the_whole_frame():
+    data, hits = frame_with_cosmic_rays()
+    cleaned, mask = cosmicray.clean_cosmic_rays(data,1.43,17.8,tile_size=0,sigclip=4.5)
+    tiled, tiled_mask = cosmicray.clean_cosmic_rays(data,1.43,17.8,tile_size=32,threads=2,sigclip=4.5)
+
+    assert all(mask[row,col] for row, col in hits)
+    assert np.array_equal(mask,tiled_mask)
+    assert np.array_equal(cleaned,tiled)
+    assert np.abs(cleaned[mask] - 1000.0).max() < 100.0
+    assert np.array_equal(cleaned[~mask],data[~mask])
+
+
+def test_missing_astroscrappy_is_reported(monkeypatch):
+    monkeypatch.setattr(cosmicray,'astroscrappy',None)
+    with pytest.raises(ImportError,match='astroscrappy'):
+        cosmicray.clean_cosmic_rays(np.zeros((8,8)),1.0,10.0)
@@ -0,0 +1,33 @@
+import os
+
+import numpy as np
+import ccdproc
+from astropy.io import fits
+
+
+def test_masters_are_made_for_each_dark_exposure(calibrate):
+    collection = calibrate()
+    dark_dir, master_dir = collection.directorylist[1], collection.paths['master_dir']
+    for exposure in (30,60):
+        frames = [os.path.join(dark_dir,name) for name in sorted(os.listdir(dark_dir)) if name.endswith('-{}s.fit'.format(exposure))]
+        master = fits.getdata(os.path.join(master_dir,'Master_Dark_{}.fit'.format(exposure)))
+        assert len(frames) == 3
+        assert np.allclose(master,ccdproc.combine(frames,method='median').data)
+        assert fits.getheader(os.path.join(master_dir,'br_Master_Dark_{}.fit'.format(exposure)))['EXPOSURE'] == exposure
+
+
+def test_scaled_darks_are_cached_by_exposure(calibrate):
+    collection = calibrate()
+    master_dir = collection.paths['master_dir']
+    collection.dark_cache = {}
+    master_60 = fits.getdata(os.path.join(master_dir,'br_Master_Dark_60.fit'))
+
+    matched = collection.scaledDark(master_dir,'br_Master_Dark.fit',60.0)
+    assert collection.scaledDark(master_dir,'br_Master_Dark.fit',60.0) is matched
+    assert matched.meta['uncdark'] == 'br_Master_Dark_60.fit' and matched.meta['uncdscl'] == 1.0
+    assert np.array_equal(matched.data,master_60)
+
+    scaled = collection.scaledDark(master_dir,'br_Master_Dark.fit',90.0)
+    assert scaled.meta['uncdark'] == 'br_Master_Dark_60.fit' and scaled.meta['uncdscl'] == 1.5
+    assert scaled.meta['EXPOSURE'] == 90.0
+    assert np.allclose(scaled.data,master_60 * 1.5)
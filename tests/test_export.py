@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from mht_ccd_pipeline import export
+from mht_ccd_pipeline.export import ExportError, copy_tree, export_tree
+
+from conftest import tree
+
+
+def results(directory):
+    """A small tree of results: masters, outputs and an empty directory"""
+
+    for name, size in (('masters/Master_Bias.fit',2880 * 3),('output/red_M33-0001-V.fit',2880 * 5),('output/notes.txt',7)):
+        path = os.path.join(directory,name)
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        with open(path,'wb') as fh:
+            fh.write(os.urandom(size))
+    os.makedirs(os.path.join(directory,'empty'))
+    return tree(directory)
+
+
+@pytest.mark.parametrize('verify',['size','checksum'])
+def test_copy_tree_copies_every_file(tmp_path,verify):
+    files = results(str(tmp_path / 'source'))
+    copied = copy_tree(str(tmp_path / 'source'),str(tmp_path / 'copy'),threads=3,verify=verify)
+    assert copied == sum(len(data) for data in files.values())
+    assert tree(str(tmp_path / 'copy')) == files
+    assert os.path.isdir(str(tmp_path / 'copy' / 'empty'))
+
+
+def test_copy_tree_checksum_catches_a_bad_copy(tmp_path,monkeypatch):
+    results(str(tmp_path / 'source'))
+    copy_file = export._copy_file
+
+    def corrupting(source,destination,checksum=False):
+        copied = copy_file(source,destination,checksum)
+        if source.endswith('.txt'):
+            with open(destination,'r+b') as fh:
+                fh.write(b'X')
+        return copied
+
+    monkeypatch.setattr(export,'_copy_file',corrupting)
+    copy_tree(str(tmp_path / 'source'),str(tmp_path / 'size'),verify='size')
+    with pytest.raises(ExportError,match='checksum'):
+        copy_tree(str(tmp_path / 'source'),str(tmp_path / 'checksum'),verify='checksum')
+
+
+def test_export_replaces_the_destination(tmp_path):
+    files = results(str(tmp_path / 'source'))
+    os.makedirs(str(tmp_path / 'export' / 'stale'))
+    export_tree(str(tmp_path / 'source'),str(tmp_path / 'export'))
+    assert tree(str(tmp_path / 'export')) == files
+    assert not os.path.exists(str(tmp_path / 'export' / 'stale'))
+    assert tree(str(tmp_path / 'source')) == files
+
+
+def test_export_moves_by_rename_on_one_filesystem(tmp_path):
+    files = results(str(tmp_path / 'source'))
+    assert export_tree(str(tmp_path / 'source'),str(tmp_path / 'nested' / 'export'),move=True) == 0
+    assert tree(str(tmp_path / 'nested' / 'export')) == files
+    assert not os.path.exists(str(tmp_path / 'source'))
+
+
+def test_export_moves_by_copy_across_filesystems(tmp_path,monkeypatch):
+    files = results(str(tmp_path / 'source'))
+    monkeypatch.setattr(export,'same_filesystem',lambda source, destination: False)
+    copied = export_tree(str(tmp_path / 'source'),str(tmp_path / 'export'),move=True,verify='checksum')
+    assert copied == sum(len(data) for data in files.values())
+    assert tree(str(tmp_path / 'export')) == files
+    assert not os.path.exists(str(tmp_path / 'source'))
+
+
+def test_export_onto_itself_does_nothing(tmp_path):
+    files = results(str(tmp_path / 'source'))
+    assert export_tree(str(tmp_path / 'source'),str(tmp_path / 'source'),move=True) == 0
+    assert tree(str(tmp_path / 'source')) == files
@@ -0,0 +1,43 @@
+import os
+import shutil
+
+import numpy as np
+from astropy.io import fits
+
+from mht_ccd_pipeline import api
+from mht_ccd_pipeline.fingerprint import data_fingerprint
+
+from conftest import compressed_night
+
+
+def test_compressed_frames_are_fingerprinted_by_their_image(night,configure,tmp_path):
+    names = sorted(name for name in os.listdir(night) if name.startswith('Bias'))[:2]
+    source = str(tmp_path / 'compressed')
+    compressed_night(night,source,names)
+
+    collection_args, directorylist = configure(directories__source_dir=source).collection_arguments()
+    collection = api.m.ImageCollection_Model(status=api.Status(),**collection_args)
+    os.makedirs(directorylist[0])
+    for name in names:
+        collection.copyFrame(collection.source,name + '.fz',directorylist[0],'False',3,image_type=0)
+
+    fingerprints = [collection.frame_fingerprints[name + '.fz'] for name in names]
+    assert fingerprints[0] != fingerprints[1]
+    assert sorted(os.listdir(directorylist[0])) == [name + '.fz' for name in names]
+    with fits.open(os.path.join(night,names[0]),do_not_scale_image_data=True) as hdul:
+        assert fingerprints[0] == data_fingerprint(hdul[0].header,hdul[0].data)
+
+
+def test_repeated_frames_are_reported_and_skipped(night,calibrate,tmp_path):
+    source = str(tmp_path / 'repeats')
+    shutil.copytree(night,source)
+    shutil.copy(os.path.join(source,'Bias-0001.fit'),os.path.join(source,'Bias-0009.fit'))
+    shutil.copy(os.path.join(source,'M33-0001-V.fit'),os.path.join(source,'M33-0009-V.fit'))
+
+    collection = calibrate(directories__source_dir=source)
+    duplicates = {entry['frame']:entry for entry in collection.report.as_dict()['duplicates']}
+    assert sorted(duplicates) == ['Bias-0009.fit','M33-0009-V.fit']
+    assert duplicates['M33-0009-V.fit']['duplicate_of'] == 'M33-0001-V.fit'
+    assert all(entry['skipped'] and entry['night'] == source for entry in duplicates.values())
+    assert 'Bias-0009.fit' not in os.listdir(collection.directorylist[0])
+    assert not [name for name in os.listdir(collection.paths['output_dir']) if '0009' in name]
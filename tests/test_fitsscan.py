@@ -0,0 +1,77 @@
+import warnings
+
+import numpy as np
+from astropy.io import fits
+from ccdproc import ImageFileCollection
+
+from mht_ccd_pipeline.fitsscan import HeaderCollection, patch_header, read_header
+
+
+keywords = ['IMAGETYP','FILTER','EXPOSURE','OBJECT','naxis1','date-obs']
+
+
+def test_header_collection_summarises_as_image_file_collection(night):
+    expected = ImageFileCollection(night,keywords=keywords).summary
+    summary = HeaderCollection(night,keywords,threads=2).summary
+
+    assert summary.colnames == expected.colnames
+    for name in expected.colnames:
+        assert summary[name].tolist() == expected[name].tolist()
+        assert np.array_equal(np.ma.getmaskarray(summary[name]),np.ma.getmaskarray(expected[name]))
+
+
+def test_header_collection_filters_as_image_file_collection(night):
+    expected = ImageFileCollection(night,keywords=keywords)
+    collection = HeaderCollection(night,keywords)
+
+    for keys in ({'IMAGETYP':'bias frame'},{'FILTER':'*'},{'FILTER':None},{'EXPOSURE':30.0},
+                 {'imagetyp':'Flat Field','filter':'v'}):
+        assert collection.files_filtered(**keys) == list(expected.files_filtered(**keys))
+    assert collection.files_filtered(include_path=True,FILTER='B') == expected.files_filtered(include_path=True,FILTER='B')
+
+
+def test_header_collection_globs_and_empty_directories(night,tmp_path):
+    collection = HeaderCollection(night,keywords,glob_include='*Flat*')
+    assert collection.files and all('Flat' in fname for fname in collection.files)
+    assert HeaderCollection(str(tmp_path),keywords).summary is None
+    assert HeaderCollection(str(tmp_path),keywords).files_filtered(FILTER='B') == []
+
+
+def test_patch_header_sets_hierarch_and_long_keywords_in_place(tmp_path):
+    path = str(tmp_path / 'frame.fit')
+    data = np.arange(16,dtype=np.int16).reshape(4,4)
+    header = fits.Header()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore',fits.verify.VerifyWarning)
+        header['HIERARCH ESO DET CHIP TEMP'] = 1.0
+        header['EXPOSURETIME'] = 30.0
+        header['IMAGETYP'] = ('Light Frame','image type')
+        fits.PrimaryHDU(data,header).writeto(path)
+
+        assert patch_header(path,{'HIERARCH ESO DET CHIP TEMP':2.0,'EXPOSURETIME':60.0,
+                                  'imagetyp':'Bias Frame','FILTER':'V'})
+
+    with fits.open(path) as hdul:
+        header = hdul[0].header
+        assert [card.keyword for card in header.cards].count('ESO DET CHIP TEMP') == 1
+        assert [card.keyword for card in header.cards].count('EXPOSURETIME') == 1
+        assert header['ESO DET CHIP TEMP'] == 2.0
+        assert header['EXPOSURETIME'] == 60.0
+        assert header['IMAGETYP'] == 'Bias Frame'
+        assert header.comments['IMAGETYP'] == 'image type'
+        assert header['FILTER'] == 'V'
+        assert np.array_equal(hdul[0].data,data)
+
+
+def test_patch_header_sets_the_image_header_of_a_compressed_frame(tmp_path):
+    path = str(tmp_path / 'frame.fit.fz')
+    data = np.arange(64,dtype=np.int16).reshape(8,8)
+    fits.HDUList([fits.PrimaryHDU(),fits.CompImageHDU(data,fits.Header({'IMAGETYP':'Light Frame'}))]).writeto(path)
+
+    assert not patch_header(path,{'IMAGETYP':'Bias Frame','FILTER':'B'})
+
+    assert read_header(path)['imagetyp'] == 'Bias Frame'
+    assert read_header(path)['filter'] == 'B'
+    with fits.open(path) as hdul:
+        assert 'IMAGETYP' not in hdul[0].header
+        assert np.array_equal(hdul[1].data,data)
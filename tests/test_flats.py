@@ -0,0 +1,46 @@
+import numpy as np
+import ccdproc
+from astropy.nddata import StdDevUncertainty
+from ccdproc import CCDData
+
+from mht_ccd_pipeline.flats import InverseFlat
+
+
+def flat_and_frame(shape=(20,24),seed=5):
+    rng = np.random.default_rng(seed)
+    flat = CCDData(rng.normal(20000,300,shape),unit='adu',uncertainty=StdDevUncertainty(np.full(shape,150.0)))
+    frame = CCDData(rng.normal(1500,40,shape),unit='adu',uncertainty=StdDevUncertainty(np.full(shape,40.0)),
+                    meta={'object':'M33'})
+    return flat, frame
+
+
+def test_inverse_flat_matches_flat_correct():
+    flat, frame = flat_and_frame()
+    corrected = InverseFlat(flat,name='Master_Flat_V.fit').apply(frame)
+    expected = ccdproc.flat_correct(frame,flat)
+    assert np.allclose(corrected.data,expected.data,rtol=1e-6)
+    assert np.allclose(corrected.uncertainty.array,expected.uncertainty.array,rtol=1e-5)
+    assert corrected.mask is None
+    assert corrected.meta['object'] == 'M33'
+    assert 'Master_Flat_V.fit' in corrected.meta['flatcor']
+    assert not InverseFlat(flat).apply(frame,uncertainty=False).uncertainty
+
+
+def test_inverse_flat_raises_low_values_as_flat_correct():
+    flat, frame = flat_and_frame()
+    flat.data[3,4] = 10.0
+    corrected = InverseFlat(flat,min_value=100.0).apply(frame)
+    expected = ccdproc.flat_correct(frame,flat,min_value=100.0)
+    assert np.allclose(corrected.data,expected.data,rtol=1e-6)
+    assert corrected.mask is None
+
+
+def test_inverse_flat_masks_pixels_it_cannot_correct():
+    flat, frame = flat_and_frame()
+    flat.data[3,4] = 0.0
+    flat.mask = np.zeros(flat.shape,dtype=bool)
+    flat.mask[5,6] = True
+    corrected = InverseFlat(flat).apply(frame)
+    assert sorted(zip(*np.nonzero(corrected.mask))) == [(3,4),(5,6)]
+    assert corrected.data[3,4] == 0 and corrected.data[5,6] == 0
+    assert np.isfinite(corrected.uncertainty.array).all()
@@ -0,0 +1,23 @@
+import json
+import logging
+import os
+
+import numpy as np
+from astropy.io import fits
+
+
+def test_second_night_reuses_library_masters(calibrate,tmp_path,caplog):
+    library_dir = str(tmp_path / 'library')
+    first = calibrate(working_dir=str(tmp_path / 'first'),master_details__library_dir=library_dir)
+    with open(os.path.join(library_dir,'index.json')) as fh:
+        index = json.load(fh)
+    assert sorted(entry['kind'] for entry in index.values()) == ['bias','dark','dark','flat','flat']
+
+    with caplog.at_level(logging.INFO,logger='mht_ccd_pipeline'):
+        second = calibrate(master_details__library_dir=library_dir)
+    reused = [record for record in caplog.records if record.getMessage().startswith('Reused library master')]
+    assert len(reused) == len(index)
+
+    for name in os.listdir(first.paths['master_dir']):
+        assert np.array_equal(fits.getdata(os.path.join(second.paths['master_dir'],name)),
+                              fits.getdata(os.path.join(first.paths['master_dir'],name)),equal_nan=True)
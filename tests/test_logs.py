@@ -0,0 +1,58 @@
+import os
+import json
+import logging
+
+from mht_ccd_pipeline.logs import ReportLogger, TraceRecorder, logger, setup_logging
+from mht_ccd_pipeline.report import RunReport
+
+
+def test_log_records_carry_the_night_step_and_frame(caplog):
+    report = RunReport(night='/data/2021-10-04')
+    log = ReportLogger(report)
+    with caplog.at_level(logging.INFO,logger='mht_ccd_pipeline'), report.step('Copy Images'):
+        log.info('Median filter',frame='Bias-0001.fit',duration=0.25)
+    record = [record for record in caplog.records if record.msg == 'Median filter'][0]
+    assert (record.night,record.step,record.frame,record.duration) == ('2021-10-04','Copy Images','Bias-0001.fit',0.25)
+
+
+def test_setup_logging_writes_the_context_to_a_file(tmp_path,monkeypatch):
+    log_file = str(tmp_path / 'reduction.log')
+    monkeypatch.setattr(logger,'level',logger.level)
+    monkeypatch.setattr(logger,'propagate',logger.propagate)
+    setup_logging('DEBUG',log_file)
+    try:
+        ReportLogger(RunReport(night='night')).debug('Dark scaled')
+        logger.info('No step')
+    finally:
+        for handler in list(logger.handlers):
+            if getattr(handler,'_mht_handler',False):
+                logger.removeHandler(handler)
+                handler.close()
+    with open(log_file,encoding='utf-8') as fh:
+        lines = fh.read().splitlines()
+    assert lines[0].endswith('DEBUG   night - - Dark scaled')
+    assert lines[1].endswith('INFO    - - - No step')
+
+
+def test_trace_merges_events_from_another_process():
+    trace = TraceRecorder()
+    worker = TraceRecorder()
+    worker.origin_epoch = trace.origin_epoch + 2.0
+    worker.complete('compute','operation',worker.origin,0.5)
+    trace.extend(worker.drain(),worker.origin_epoch)
+    event = [event for event in trace.events if event['ph'] == 'X'][0]
+    assert abs(event['ts'] - 2e6) < 1 and event['dur'] == 5e5
+    assert not worker.events
+
+
+def test_trace_events_are_written_with_the_report(calibrate,tmp_path):
+    collection = calibrate(general_details__trace_events=True)
+    collection.reductionWriteReport(str(tmp_path / 'report'))
+    with open(str(tmp_path / 'report' / 'reduction_trace.json'),encoding='utf-8') as fh:
+        events = json.load(fh)['traceEvents']
+
+    steps = {event['name'] for event in events if event.get('cat') == 'step'}
+    assert {'Copy Images','Create Masters','Reduce Science'} <= steps
+    assert any(event.get('cat') == 'operation' and event['name'] == 'write' for event in events)
+    assert all(event['pid'] == os.getpid() for event in events)
+    assert any(event['ph'] == 'M' and event['name'] == 'thread_name' for event in events)
@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+from scipy import ndimage
+
+from mht_ccd_pipeline.medianfilter import median_filter
+
+
+@pytest.mark.parametrize('size',[2,3,5])
+@pytest.mark.parametrize('dtype',[np.uint16,np.float32])
+def test_median_filter_matches_scipy_in_strips(size,dtype):
+    data = np.random.default_rng(3).integers(0,60000,(200,37)).astype(dtype)
+    expected = ndimage.median_filter(data,size=size,mode='reflect')
+
+    assert np.array_equal(median_filter(data,size,threads=1),expected)
+    assert np.array_equal(median_filter(data,size,threads=4),expected)
+
+
+def test_median_filter_with_nans_matches_scipy():
+    data = np.random.default_rng(4).normal(100.0,5.0,(40,40))
+    data[10,10] = np.nan
+    assert np.array_equal(median_filter(data,3,threads=2),ndimage.median_filter(data,size=3,mode='reflect'),equal_nan=True)
@@ -0,0 +1,74 @@
+import time
+import threading
+
+import pytest
+
+from mht_ccd_pipeline.pipeline import FramePipeline, prefetch
+from mht_ccd_pipeline.report import RunReport
+
+
+@pytest.mark.parametrize('read_depth',[0,1,3])
+def test_pipeline_writes_every_result_in_order(read_depth):
+    threads = set()
+    written = []
+
+    def read(item):
+        threads.add(('read',threading.current_thread().name))
+        return item * 10
+
+    def compute(item,data):
+        # None results are not written
+        return None if item == 3 else data + 1
+
+    pipeline = FramePipeline(read,compute,lambda item, result: written.append((item,result)),read_depth,1)
+    assert pipeline.run(range(6)) == 6
+    assert written == [(0,1),(1,11),(2,21),(4,41),(5,51)]
+    assert (('read',threading.current_thread().name) in threads) == (read_depth == 0)
+
+
+@pytest.mark.parametrize('stage',['read','compute','write'])
+def test_pipeline_raises_the_error_of_a_stage(stage):
+    def fail(name):
+        def function(item,*args):
+            if stage == name and item == 2:
+                raise OSError(name)
+            return item
+        return function
+
+    pipeline = FramePipeline(fail('read'),fail('compute'),fail('write'))
+    with pytest.raises(OSError,match=stage):
+        pipeline.run(range(20))
+
+
+def test_prefetch_yields_in_order_and_raises_read_errors():
+    assert list(prefetch(lambda item: item * 2,range(5),depth=2)) == [0,2,4,6,8]
+    assert list(prefetch(lambda item: item * 2,range(5),depth=0)) == [0,2,4,6,8]
+
+    def read(item):
+        if item == 3:
+            raise OSError('unreadable')
+        return item
+
+    frames = []
+    with pytest.raises(OSError,match='unreadable'):
+        for frame in prefetch(read,range(5)):
+            frames.append(frame)
+    assert frames == [0,1,2]
+
+
+def test_prefetch_stops_reading_when_the_consumer_stops():
+    read = []
+    frames = prefetch(lambda item: read.append(item) or item,range(100),depth=2)
+    assert next(frames) == 0
+    frames.close()
+    assert len(read) <= 4
+
+
+def test_pipeline_records_stalls_of_a_slow_stage():
+    report = RunReport()
+    with report.step('Reduce Science'):
+        FramePipeline(lambda item: time.sleep(0.02) or item,lambda item, data: data,
+                      lambda item, result: None,report=report).run(range(5))
+    stalls = report.steps[-1]['stalls']
+    assert stalls['compute'] > 0.05
+    assert stalls.get('read',0.0) < stalls['compute']
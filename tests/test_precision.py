@@ -0,0 +1,27 @@
+import os
+
+from mht_ccd_pipeline import api
+from mht_ccd_pipeline import models as m
+
+from conftest import tree
+
+
+def test_precision_reference_calibrates_into_its_own_directories(configure,tmp_path):
+    config_model = configure(general_details__precision='float32',general_details__precision_validation=True)
+    collection_args, directorylist = config_model.collection_arguments()
+    collection = m.ImageCollection_Model(status=api.Status(),**collection_args)
+    collection.reductionCalibrate({},directorylist)
+    working = tree(collection.paths['working_dir'])
+
+    reference, reference_directorylist = collection.precisionReference(
+            config_model,collection.paths['working_dir'] + '_float64',api.Status())
+    reference.reductionCalibrate({},reference_directorylist)
+    deviations = collection.reductionValidatePrecision(reference)
+
+    assert tree(collection.paths['working_dir']) == working
+    assert reference.filemods['precision'] == 'float64'
+    assert all(path.startswith(str(tmp_path / 'working_float64')) for path in reference_directorylist)
+    masters = sorted(os.listdir(reference.paths['master_dir']))
+    assert 'Master_Bias.fit' in masters
+    assert masters == sorted(os.listdir(collection.paths['master_dir']))
+    assert deviations
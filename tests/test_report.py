@@ -0,0 +1,62 @@
+import os
+import json
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from mht_ccd_pipeline import api
+from mht_ccd_pipeline import models as m
+from mht_ccd_pipeline.memory import MemoryEstimate, MemoryBudgetError
+
+from conftest import config_file
+
+
+def test_memory_tracking_is_off_by_default(configure):
+    assert m.Configuration_Model.fields['general_details']['memory_tracking']['value'] == 'False'
+    assert api.configuration(config_file).config['general_details']['memory_tracking'] == 'False'
+    collection_args, _ = api.configuration().collection_arguments()
+    assert collection_args['filemods']['memory_tracking'] is False
+
+    collection_args, _ = configure().collection_arguments()
+    del collection_args['filemods']['memory_tracking']
+    collection = m.ImageCollection_Model(status=api.Status(),**collection_args)
+    assert not collection.report.track_memory
+
+
+def test_memory_tracking_records_step_peaks(calibrate):
+    collection = calibrate(general_details__memory_tracking=True)
+    steps = collection.report.steps
+    assert steps and all('traced_peak' in step and step['rss_peak'] > 0 for step in steps)
+
+
+def test_report_times_each_step(calibrate,tmp_path):
+    collection = calibrate()
+    report_file = collection.reductionWriteReport(str(tmp_path / 'report'))
+    with open(report_file,encoding='utf-8') as fh:
+        report = json.load(fh)
+
+    steps = {step['step']:step for step in report['steps']}
+    assert {'Copy Images','Create Masters','Bias Removal','Dark Removal','Reduce Science'} <= set(steps)
+    assert steps['Copy Images']['frames'] == len(os.listdir(collection.paths['source_dir']))
+    assert steps['Reduce Science']['bytes_written'] > 0
+    assert report['total_wall'] == pytest.approx(sum(step['wall'] for step in report['steps']))
+    assert not os.path.exists(str(tmp_path / 'report' / 'reduction_trace.json'))
+
+
+def test_memory_budget_combines_masters_in_chunks(calibrate,tmp_path):
+    unlimited = calibrate(working_dir=str(tmp_path / 'unlimited'))
+    collection = calibrate(general_details__memory_budget=1)
+    assert collection.chunk_combine
+    assert collection.report.as_dict()['memory_estimate']['Create Masters'] > 1
+    for name in sorted(os.listdir(unlimited.paths['master_dir'])):
+        assert np.allclose(fits.getdata(os.path.join(collection.paths['master_dir'],name)),
+                           fits.getdata(os.path.join(unlimited.paths['master_dir'],name)),equal_nan=True)
+
+
+def test_memory_budget_stops_a_night_that_cannot_fit(calibrate,monkeypatch):
+    # frames of 64 x 64 pixels that take over a MB each
+    monkeypatch.setattr(MemoryEstimate,'ccd_pixel_bytes',300)
+    with pytest.raises(MemoryBudgetError) as error:
+        calibrate(general_details__memory_budget=1)
+    assert error.value.budget == 1e6 and error.value.estimate > 1e6
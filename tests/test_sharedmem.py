@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+from astropy.io import fits
+from astropy.nddata import StdDevUncertainty
+from ccdproc import CCDData
+
+from mht_ccd_pipeline import sharedmem
+from mht_ccd_pipeline.flats import InverseFlat
+from mht_ccd_pipeline.sharedmem import SharedFrames, attach
+
+
+def test_attached_frames_are_read_only_views_of_the_masters():
+    rng = np.random.default_rng(2)
+    master = CCDData(rng.normal(100,5,(8,10)),unit='adu',uncertainty=StdDevUncertainty(np.full((8,10),2.0)),
+                     meta={'exposure':30.0})
+    flat = CCDData(rng.normal(20000,100,(8,10)),unit='adu')
+    flat.data[1,2] = 0
+    inverse_flat = InverseFlat(flat,name='Master_Flat_V.fit')
+
+    with SharedFrames() as shared:
+        shared.publishCCD('dark',master)
+        shared.publishInverseFlat('V',inverse_flat)
+        assert shared.nbytes >= master.data.nbytes * 2 + inverse_flat.nbytes
+        frames = attach(shared.registry())
+        try:
+            assert np.array_equal(frames['dark'].data,master.data)
+            assert np.array_equal(frames['dark'].uncertainty.array,master.uncertainty.array)
+            assert frames['dark'].header['exposure'] == 30.0 and frames['dark'].unit == master.unit
+            assert not frames['dark'].data.flags.writeable
+            assert np.array_equal(frames['V'].inverse,inverse_flat.inverse)
+            assert frames['V'].mask[1,2] and frames['V'].mean == inverse_flat.mean
+        finally:
+            sharedmem.detach()
+
+
+def test_worker_processes_reduce_as_the_calling_process(calibrate,tmp_path):
+    serial = calibrate(working_dir=str(tmp_path / 'serial'))
+    collection = calibrate(general_details__worker_processes=2)
+    outputs = sorted(os.listdir(serial.paths['output_dir']))
+    assert outputs and sorted(os.listdir(collection.paths['output_dir'])) == outputs
+    for name in outputs:
+        assert np.array_equal(fits.getdata(os.path.join(collection.paths['output_dir'],name)),
+                              fits.getdata(os.path.join(serial.paths['output_dir'],name)),equal_nan=True)
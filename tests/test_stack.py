@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from mht_ccd_pipeline.stack import downsample, frame_offset, frame_rows, combine_tile, tile_rows
+
+
+def star_field(shape,seed=5,count=60):
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:shape[0],0:shape[1]]
+    image = rng.normal(100.0,3.0,shape)
+    for y, x, flux in zip(rng.uniform(0,shape[0],count),rng.uniform(0,shape[1],count),rng.uniform(500,5000,count)):
+        image += flux * np.exp(-((yy - y) ** 2 + (xx - x) ** 2) / (2 * 1.5 ** 2))
+    return image.astype(np.float32)
+
+
+@pytest.mark.parametrize('factor',[1,2,4])
+def test_frame_offset_recovers_a_shift(factor):
+    field = star_field((300,300))
+    reference = field[20:276,20:276]
+    moved = field[27:283,15:271]
+    assert frame_offset(reference,downsample(reference,factor),moved,factor) == (7,-5)
+
+
+def test_combine_tile_ignores_pixels_a_frame_does_not_cover():
+    data = np.arange(12,dtype=np.float32).reshape(3,4)
+    rows = [frame_rows(data,None,0,0,0,3),frame_rows(data + 2,None,1,0,0,3)]
+    combined, count = combine_tile(rows)
+    assert np.array_equal(count[0],[1,1,1,1]) and np.array_equal(count[1:],np.full((2,4),2))
+    assert np.array_equal(combined[0],data[0])
+    assert np.array_equal(combined[1:],(data[1:] + data[:2] + 2) / 2)
+    assert tile_rows(4,1000,4 * 1000 * 4 * 10) == 10
+
+
+def test_science_frames_stack_by_object_and_filter(calibrate):
+    collection = calibrate(reduction_details__stack_frames=True)
+    output_dir = collection.paths['output_dir']
+    stacks = sorted(name for name in os.listdir(output_dir) if name.startswith('stack_'))
+    assert stacks == ['stack_M33_B.fit','stack_M33_V.fit']
+
+    for name in stacks:
+        filterType = name[-5]
+        reduced = sorted(fname for fname in os.listdir(output_dir)
+                         if fname.startswith('red_') and fname.endswith('-' + filterType + '.fit'))
+        with fits.open(os.path.join(output_dir,name)) as hdul:
+            assert hdul[0].header['NCOMBINE'] == len(reduced)
+            offsets = [tuple(int(n) for n in str(card).split()[-2:]) for card in hdul[0].header['HISTORY']
+                       if str(card).startswith('Stacked')]
+            stacked = hdul[0].data
+        assert len(offsets) == len(reduced)
+        rows = []
+        for fname, (dy, dx) in zip(reduced,offsets):
+            with fits.open(os.path.join(output_dir,fname)) as hdul:
+                rows.append(frame_rows(hdul[0].data,hdul['MASK'].data,dy,dx,0,hdul[0].data.shape[0]))
+        expected, count = combine_tile(rows)
+        assert np.allclose(stacked[count > 0],expected[count > 0],rtol=1e-6)
@@ -0,0 +1,71 @@
+import io
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from mht_ccd_pipeline import api
+from mht_ccd_pipeline import models as m
+from mht_ccd_pipeline.storage import Storage, LocalStorage, ArchiveStorage, MemoryStorage, open_storage
+
+
+def night_files(night):
+    return {name:LocalStorage(night).read(name) for name in LocalStorage(night).files()}
+
+
+def test_storage_is_abstract():
+    with pytest.raises(TypeError):
+        Storage()
+
+
+def test_memory_storage_reads_writes_and_gives_its_output_directory(tmp_path):
+    storage = MemoryStorage({'a.fit':b'abc'},output_dir=str(tmp_path / 'results'))
+    storage.write('b.fit',b'defg')
+
+    assert storage.files() == ['a.fit','b.fit']
+    assert storage.size('b.fit') == 4
+    assert storage.read('a.fit') == b'abc'
+    assert storage.outputDirectory() == str(tmp_path / 'results')
+    assert os.path.isdir(storage.outputDirectory())
+    with pytest.raises(ValueError):
+        MemoryStorage().outputDirectory()
+
+
+@pytest.mark.parametrize('archive',['night.tar','night.tar.gz','night.zip'])
+def test_archive_storage_reads_members_in_place(night,tmp_path,archive):
+    files = night_files(night)
+    path = str(tmp_path / archive)
+    if archive.endswith('.zip'):
+        with zipfile.ZipFile(path,'w') as zf:
+            for name, data in files.items():
+                zf.writestr('night/' + name,data)
+    else:
+        with tarfile.open(path,'w:gz' if archive.endswith('.gz') else 'w') as tf:
+            for name, data in files.items():
+                info = tarfile.TarInfo('night/' + name)
+                info.size = len(data)
+                tf.addfile(info,io.BytesIO(data))
+
+    with open_storage(path) as storage:
+        assert isinstance(storage,ArchiveStorage)
+        assert storage.files() == sorted(files)
+        name = sorted(files)[0]
+        assert storage.size(name) == len(files[name])
+        assert storage.read(name) == files[name]
+        with pytest.raises(PermissionError):
+            storage.write(name,b'')
+        assert storage.outputDirectory() == os.path.join(str(tmp_path),'night','night')
+
+
+def test_night_in_memory_storage_reduces_as_from_its_directory(night,configure,tmp_path):
+    storage = MemoryStorage(night_files(night),output_dir=str(tmp_path / 'results'))
+    collection_args, directorylist = configure().collection_arguments()
+    collection_args['paths']['source_dir'] = storage
+    collection = m.ImageCollection_Model(status=api.Status(),**collection_args)
+    collection.reductionCalibrate({},directorylist)
+
+    reduced = sorted(name for name in os.listdir(collection.paths['output_dir']) if name.startswith('red_'))
+    assert len(reduced) == len(collection.science_names)
+    assert reduced
+    assert collection.source.outputDirectory() == str(tmp_path / 'results')
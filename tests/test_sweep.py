@@ -0,0 +1,20 @@
+import json
+
+from mht_ccd_pipeline import api
+from mht_ccd_pipeline.sweep import Sweep
+
+
+def test_sweep_shares_ingest_and_compares_variants(configure,tmp_path):
+    variants = {'base':{},
+                'average_flat':{'master_details.median_combine_flat':'False'},
+                'threads':{'general_details':{'worker_threads':'2'}}}
+    report_file = Sweep(configure(),variants,str(tmp_path / 'sweep'),status=api.Status()).run()
+    with open(report_file) as fh:
+        report = json.load(fh)
+
+    ingests = [run for run in report['stages'] if run['stage'] == 'ingest']
+    assert len(ingests) == 1 and sorted(ingests[0]['variants']) == sorted(variants)
+    results = {variant['name']:variant for variant in report['variants']}
+    assert 'ingest' in results['average_flat']['shared_stages']
+    assert results['threads']['compared'] and results['threads']['max_difference'] == 0
+    assert results['average_flat']['compared'] and results['average_flat']['max_difference'] > 0
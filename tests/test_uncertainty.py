@@ -0,0 +1,43 @@
+import os
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from mht_ccd_pipeline.uncertainty import keeps_uncertainty, reconstruct_uncertainty
+
+
+def test_uncertainty_modes():
+    assert keeps_uncertainty('full') and keeps_uncertainty('full',master=True)
+    assert not keeps_uncertainty('masters-only') and keeps_uncertainty('masters-only',master=True)
+    assert not keeps_uncertainty('on-demand') and keeps_uncertainty('on-demand',master=True)
+    assert not keeps_uncertainty('none') and not keeps_uncertainty('none',master=True)
+
+
+def extensions(path):
+    with fits.open(path) as hdul:
+        return [hdu.name for hdu in hdul]
+
+
+def test_none_mode_drops_uncertainties(calibrate):
+    collection = calibrate(general_details__uncertainty='none')
+    for directory in ('master_dir','output_dir'):
+        for name in os.listdir(collection.paths[directory]):
+            assert 'UNCERT' not in extensions(os.path.join(collection.paths[directory],name))
+
+
+def test_on_demand_uncertainty_rebuilds_the_full_one(calibrate,night,tmp_path):
+    full = calibrate(working_dir=str(tmp_path / 'full'),general_details__uncertainty='full')
+    on_demand = calibrate(general_details__uncertainty='on-demand')
+
+    names = sorted(name for name in os.listdir(on_demand.paths['output_dir']) if name.startswith('red_'))
+    assert names
+    for name in names[:2]:
+        reduced = os.path.join(on_demand.paths['output_dir'],name)
+        assert 'UNCERT' not in extensions(reduced)
+        uncertainty = reconstruct_uncertainty(reduced,night,on_demand.paths['master_dir'])
+        expected = fits.getdata(os.path.join(full.paths['output_dir'],name),'UNCERT')
+        assert np.allclose(uncertainty.array,expected,rtol=1e-6,equal_nan=True)
+
+    with pytest.raises(KeyError):
+        reconstruct_uncertainty(os.path.join(full.paths['output_dir'],names[0]),night,full.paths['master_dir'])
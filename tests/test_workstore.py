@@ -0,0 +1,84 @@
+import os
+import shutil
+
+import numpy as np
+from astropy.io import fits
+
+from mht_ccd_pipeline import api
+from mht_ccd_pipeline import models as m
+from mht_ccd_pipeline import workstore
+from mht_ccd_pipeline.workstore import WorkingStore
+
+
+def test_store_stays_in_ram_while_the_night_fits(tmp_path,monkeypatch):
+    monkeypatch.setattr(workstore,'ram_free',lambda root: 10 ** 9)
+    store = WorkingStore(str(tmp_path / 'working'),'memory',required=1000,root=str(tmp_path))
+    assert store.in_memory
+    assert store.spill() is None
+    store.release()
+    assert not os.path.exists(store.location)
+
+
+def test_store_spills_what_it_holds_to_disk(tmp_path,monkeypatch):
+    free = [10 ** 9]
+    monkeypatch.setattr(workstore,'ram_free',lambda root: free[0])
+    working_dir = str(tmp_path / 'working')
+    store = WorkingStore(working_dir,'memory',required=1000,root=str(tmp_path))
+    ram_dir = store.location
+    frame = store.path(os.path.join(working_dir,'bias','frame.fit'))
+    os.makedirs(os.path.dirname(frame))
+    with open(frame,'wb') as fh:
+        fh.write(b'x' * 100)
+
+    free[0] = 2000
+    assert store.spill() is None
+    free[0] = 100
+    assert store.spill() == ram_dir
+
+    assert not store.in_memory
+    assert not os.path.exists(ram_dir)
+    assert store.moved(frame,ram_dir) == os.path.join(working_dir,'bias','frame.fit')
+    with open(os.path.join(working_dir,'bias','frame.fit'),'rb') as fh:
+        assert fh.read() == b'x' * 100
+
+
+def test_night_spills_to_disk_between_stages(calibrate,monkeypatch,tmp_path):
+    disk = calibrate(working_dir=str(tmp_path / 'disk'))
+
+    # RAM runs out once the masters are made
+    stages = []
+    monkeypatch.setattr(workstore,'ram_free',lambda root: 0 if len(stages) > 3 else 10 ** 12)
+    spill = workstore.WorkingStore.spill
+    monkeypatch.setattr(workstore.WorkingStore,'spill',lambda store: stages.append(1) or spill(store))
+    collection = calibrate(general_details__working_store='memory')
+
+    assert not collection.working_store.in_memory
+    assert 'exceeds' in collection.working_store.reason
+    assert collection.paths['working_dir'] == str(tmp_path / 'working')
+    assert all(path.startswith(str(tmp_path / 'working')) for path in collection.directorylist)
+    assert sorted(os.listdir(collection.paths['master_dir'])) == sorted(os.listdir(disk.paths['master_dir']))
+    outputs = sorted(os.listdir(disk.paths['output_dir']))
+    assert sorted(os.listdir(collection.paths['output_dir'])) == outputs
+    for name in outputs:
+        assert np.array_equal(fits.getdata(os.path.join(collection.paths['output_dir'],name)),
+                              fits.getdata(os.path.join(disk.paths['output_dir'],name)),equal_nan=True)
+
+
+def test_each_night_of_a_run_gets_its_own_store(configure,night,tmp_path,monkeypatch):
+    monkeypatch.setattr(workstore,'ram_free',lambda root: 10 ** 12)
+    second = str(tmp_path / 'second')
+    shutil.copytree(night,second)
+
+    # the nights of a run share the paths and directory list, as application.create_collections does
+    collection_args, directorylist = configure(general_details__working_store='memory').collection_arguments()
+    paths = collection_args['paths']
+    configured = dict(paths)
+    for source in (night,second):
+        paths['source_dir'] = source
+        collection = m.ImageCollection_Model(status=api.Status(),**collection_args)
+        collection.reductionCalibrate({},directorylist)
+        assert collection.working_store.in_memory
+        assert len([name for name in os.listdir(collection.paths['output_dir']) if name.startswith('red_')]) == 8
+        collection.releaseWorkingStore()
+        assert dict(paths,source_dir=configured['source_dir']) == configured
+        assert list(directorylist) == [configured[key] for key in ('bias_dir','dark_dir','flat_dir','science_dir','master_dir','output_dir')]